@@ -0,0 +1,8 @@
+"""
+### Benchmarks for pypremis ###
+
+Run from the repository root, eg:
+
+    python -m benchmarks.run --objects 200 --output results.json
+    python -m benchmarks.compare baseline.json results.json
+"""
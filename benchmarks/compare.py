@@ -0,0 +1,64 @@
+import argparse
+import json
+import sys
+
+
+"""
+### Compare two benchmark result files ###
+
+Prints the change in best time for every benchmark present in both files,
+and exits non-zero if any got slower by more than the threshold.
+"""
+
+
+def compare(old, new, threshold=0.10):
+    """
+    Compare two benchmark outputs.
+
+    __Args__
+
+    1. old (dict): the baseline output of benchmarks.run
+    2. new (dict): the output to compare against it
+
+    __KWArgs__
+
+    * threshold (float): the relative slowdown that counts as a regression
+
+    __Returns__
+
+    * (tuple): (a list of (name, old best, new best, relative change)
+    tuples, a list of the names of regressed benchmarks)
+    """
+    if old.get('params') != new.get('params'):
+        raise ValueError("The results were produced with different parameters.")
+    rows = []
+    regressions = []
+    for name in sorted(set(old['results']) & set(new['results'])):
+        before = old['results'][name]['best']
+        after = new['results'][name]['best']
+        change = (after - before) / before if before else 0.0
+        rows.append((name, before, after, change))
+        if change > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=0.10)
+    args = parser.parse_args(argv)
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    rows, regressions = compare(old, new, threshold=args.threshold)
+    for name, before, after, change in rows:
+        flag = '  REGRESSION' if name in regressions else ''
+        print("{:<16} {:>10.4f}s {:>10.4f}s {:>+8.1%}{}".format(name, before, after, change, flag))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.run import git_revision
+
+
+"""
+### Import time benchmark ###
+
+Runs "python -X importtime" in fresh interpreters for a set of import
+statements and reports the cumulative microseconds of each. Bytecode is
+written to a private cache which is warmed first, so the numbers reflect
+warm starts rather than compilation.
+
+The output has the same shape as benchmarks.run, so two runs from different
+commits can be compared with benchmarks.compare.
+"""
+
+
+STATEMENTS = {
+    'package': 'import pypremis',
+    'package_attribute': 'import pypremis; pypremis.PremisRecord',
+    'nodes': 'import pypremis.nodes',
+    'lib': 'import pypremis.lib',
+    'fixity': 'import pypremis.fixity',
+    'scheduler': 'import pypremis.scheduler',
+}
+
+_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+
+def measure(statement, env):
+    """
+    Import time a statement in a fresh interpreter.
+
+    __Returns__
+
+    * (int): the total cumulative microseconds of the top level imports
+    """
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                            env=env, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                            check=True).stderr.decode('utf-8')
+    total = 0
+    for line in output.splitlines():
+        match = _LINE.match(line)
+        # Only count top level entries, nested ones are already included
+        # in their parent's cumulative time.
+        if match and len(match.group(3)) == 1 and match.group(4) not in ('site', 'usercustomize'):
+            total += int(match.group(2))
+    return total
+
+
+def run(repeat=10):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    env['PYTHONPYCACHEPREFIX'] = tempfile.mkdtemp()
+    env['PYTHONPATH'] = root + os.pathsep + env.get('PYTHONPATH', '')
+    env['PYTHONWARNINGS'] = 'ignore'
+    results = {}
+    for name, statement in sorted(STATEMENTS.items()):
+        measure(statement, env)
+        times = [measure(statement, env) / 1e6 for _ in range(repeat)]
+        results[name] = {'best': min(times), 'mean': sum(times) / len(times),
+                         'runs': repeat, 'statement': statement}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure pypremis import times.")
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', help="write JSON results here rather than stdout")
+    args = parser.parse_args(argv)
+    output = {
+        'meta': {'revision': git_revision(), 'python': sys.version.split()[0]},
+        'params': {'benchmark': 'importtime'},
+        'results': run(repeat=args.repeat),
+    }
+    text = json.dumps(output, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from pypremis.lib import PremisRecord
+from pypremis.memory import trace
+
+from benchmarks.synthetic import generate_record
+
+
+"""
+### Memory benchmark ###
+
+Loads a synthetic record under tracemalloc and prints both the traced
+allocation figures and the record's .memory_report().
+"""
+
+
+def run(params):
+    """
+    Write a synthetic record built from params to disk, then trace loading it.
+
+    __Returns__
+
+    * (tuple): (the loaded PremisRecord, the trace dict from pypremis.memory.trace)
+    """
+    handle, path = tempfile.mkstemp(suffix='.xml')
+    os.close(handle)
+    try:
+        generate_record(**params).write_to_file(path)
+        return trace(lambda: PremisRecord(frompath=path))
+    finally:
+        os.remove(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trace the memory used loading a record.")
+    parser.add_argument('--objects', type=int, default=100)
+    parser.add_argument('--events-per-object', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="print JSON rather than a table")
+    args = parser.parse_args(argv)
+    record, traced = run({'objects': args.objects,
+                          'events_per_object': args.events_per_object,
+                          'seed': args.seed})
+    report = record.memory_report()
+    if args.json:
+        print(json.dumps({'trace': traced, 'report': report.as_dict()}, indent=2, sort_keys=True))
+        return
+    print("Traced while loading: {:,} bytes retained, {:,} bytes peak".format(
+        traced['current'], traced['peak']))
+    for location, size in traced['top']:
+        print("  {:<60} {:>12,}".format(location[-60:], size))
+    print()
+    print(report.format())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+
+from pypremis.factories import XMLNodeFactory
+from pypremis.lib import PremisRecord
+from pypremis.parallel import ParallelXMLNodeFactory
+
+from benchmarks.run import git_revision, timeit
+from benchmarks.synthetic import generate_record
+
+
+"""
+### Parallel loading benchmark ###
+
+Writes a synthetic record to a temporary file and times loading it with
+XMLNodeFactory, and with ParallelXMLNodeFactory at each of the given numbers
+of workers, reporting each parallel load's speedup over the serial one.
+
+The output has the same shape as benchmarks.run, so two runs from different
+commits can be compared with benchmarks.compare.
+"""
+
+
+def load(path, factory, **kwargs):
+    record = PremisRecord._empty()
+    record.populate_from_file(factory, filepath=path, journal=False, **kwargs)
+    return record
+
+
+def run(params, workers=(2, 4), repeat=3):
+    """
+    Time loading a synthetic record built from params serially and in
+    parallel.
+
+    __Returns__
+
+    * (dict): benchmark names mapped to timing dicts. Parallel ones also
+    hold their speedup over the serial load, and all hold the size of the
+    file in bytes.
+    """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'premis.xml')
+        expected = generate_record(**params)
+        expected.write_to_file(path)
+        size = os.path.getsize(path)
+        if load(path, XMLNodeFactory) != expected:
+            raise ValueError("The serial load didn't round trip")
+        results = {'serial': timeit(lambda: load(path, XMLNodeFactory), repeat)}
+        for n in workers:
+            if load(path, ParallelXMLNodeFactory, workers=n) != expected:
+                raise ValueError("The load with {} workers didn't round trip".format(n))
+            result = timeit(lambda: load(path, ParallelXMLNodeFactory, workers=n), repeat)
+            result['speedup'] = results['serial']['best'] / result['best']
+            results['parallel_{}'.format(n)] = result
+        for result in results.values():
+            result['bytes'] = size
+        return results
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare serial and parallel loads of a record.")
+    parser.add_argument('--objects', type=int, default=500)
+    parser.add_argument('--events-per-object', type=int, default=5)
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="write JSON results here rather than stdout")
+    args = parser.parse_args(argv)
+
+    params = {
+        'objects': args.objects,
+        'events_per_object': args.events_per_object,
+    }
+    output = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'params': params,
+        'results': run(params, workers=args.workers, repeat=args.repeat),
+    }
+    text = json.dumps(output, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+import argparse
+import copyreg
+import io
+import json
+import pickle
+import platform
+import sys
+import time
+from datetime import datetime
+
+from pypremis.lib import NodeSet
+from pypremis.nodes import PremisNode
+
+from benchmarks.run import git_revision, timeit
+from benchmarks.synthetic import generate_record
+
+
+"""
+### Pickling benchmark ###
+
+Pickles a synthetic record with the compact encoding nodes and NodeSets
+define, and with python's default encoding of their instance dicts, and
+reports the size of each pickle and the time to dump and load it.
+
+The output has the same shape as benchmarks.run, so two runs from different
+commits can be compared with benchmarks.compare.
+"""
+
+
+class DefaultPickler(pickle.Pickler):
+    """
+    A Pickler which ignores the compact encodings, pickling nodes and
+    NodeSets as their instance dicts the way python does by default.
+    """
+    def reducer_override(self, obj):
+        if isinstance(obj, PremisNode):
+            return copyreg.__newobj__, (type(obj),), obj.__dict__.copy()
+        if isinstance(obj, NodeSet):
+            state = obj.__dict__.copy()
+            del state['_lock']
+            return copyreg.__newobj__, (type(obj),), state
+        return NotImplemented
+
+
+def dumps_default(obj, protocol):
+    f = io.BytesIO()
+    DefaultPickler(f, protocol).dump(obj)
+    return f.getvalue()
+
+
+def run(params, repeat=5, protocol=pickle.HIGHEST_PROTOCOL):
+    """
+    Time pickling a synthetic record built from params both ways.
+
+    __Returns__
+
+    * (dict): benchmark names mapped to timing dicts, which also hold the
+    size of the pickle in bytes
+    """
+    record = generate_record(**params)
+    results = {}
+    for name, dumps in (('compact', lambda x: pickle.dumps(x, protocol)),
+                        ('default', lambda x: dumps_default(x, protocol))):
+        data = dumps(record)
+        if pickle.loads(data) != record:
+            raise ValueError("The {} pickle didn't round trip".format(name))
+        results['dumps_' + name] = timeit(lambda: dumps(record), repeat)
+        results['loads_' + name] = timeit(lambda: pickle.loads(data), repeat)
+        results['round_trip_' + name] = timeit(lambda: pickle.loads(dumps(record)), repeat)
+        for key in ('dumps_', 'loads_', 'round_trip_'):
+            results[key + name]['bytes'] = len(data)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the compact and default pickles of a record.")
+    parser.add_argument('--objects', type=int, default=100)
+    parser.add_argument('--events-per-object', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="write JSON results here rather than stdout")
+    args = parser.parse_args(argv)
+
+    params = {
+        'objects': args.objects,
+        'events_per_object': args.events_per_object,
+    }
+    output = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+        },
+        'params': params,
+        'results': run(params, repeat=args.repeat),
+    }
+    text = json.dumps(output, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
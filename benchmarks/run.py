@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from pypremis.factories import XMLNodeFactory
+from pypremis.lib import PremisRecord
+from pypremis.nodes import Event, EventIdentifier
+
+from benchmarks.synthetic import generate_values, build_nodes
+
+
+"""
+### Throughput benchmarks for the core PremisRecord operations ###
+
+Times parsing, building, indexing, equality, .to_xml() and .write_to_file()
+(with and without preserve_source) over a synthetic record and writes the results as JSON, so that runs from
+different commits can be compared with benchmarks.compare.
+
+* build: building the record's nodes from plain values
+* index: building a PremisRecord from those nodes
+* parse_xml: parsing the xml document alone, XMLNodeFactory(path).xml
+* parse, parse_lazy, parse_opaque: loading a PremisRecord from the file,
+which is parsing, building the nodes and indexing them together
+"""
+
+
+def timeit(func, repeat):
+    """
+    Call func() repeat times.
+
+    __Returns__
+
+    * (dict): the best and mean wall clock times in seconds, and the number
+    of runs
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'best': min(times), 'mean': sum(times) / len(times), 'runs': repeat}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(params, repeat=5):
+    """
+    Run every benchmark against a synthetic record built from params.
+
+    __Args__
+
+    1. params (dict): kwargs for benchmarks.synthetic.generate_values()
+
+    __KWArgs__
+
+    * repeat (int): the number of times to run each benchmark
+
+    __Returns__
+
+    * (dict): benchmark names mapped to timing dicts
+    """
+    values = generate_values(**params)
+    objects, events, agents, rights = build_nodes(values)
+    record = PremisRecord(objects=objects, events=events, agents=agents, rights=rights)
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, 'premis.xml')
+    record.write_to_file(path)
+    other = PremisRecord(frompath=path)
+    opaque = PremisRecord(frompath=path, opaque_extensions=True)
+
+    results = {}
+    results['build'] = timeit(lambda: build_nodes(values), repeat)
+    results['index'] = timeit(lambda: PremisRecord(objects=objects, events=events,
+                                                   agents=agents, rights=rights), repeat)
+    results['parse_xml'] = timeit(lambda: XMLNodeFactory(path).xml, repeat)
+    results['parse'] = timeit(lambda: PremisRecord(frompath=path), repeat)
+    results['parse_lazy'] = timeit(lambda: PremisRecord(frompath=path, lazy=True), repeat)
+    results['parse_opaque'] = timeit(lambda: PremisRecord(frompath=path, opaque_extensions=True), repeat)
+    results['equality'] = timeit(lambda: record == other, repeat)
+    results['to_xml'] = timeit(record.to_xml, repeat)
+    results['to_xml_opaque'] = timeit(opaque.to_xml, repeat)
+    results['write_to_file'] = timeit(lambda: record.write_to_file(path), repeat)
+    # Load, add an event and save to a new file, copying everything else
+    preserving = PremisRecord(frompath=path, preserve_source=True)
+    preserving.add_event(Event(EventIdentifier('uuid', 'benchmark'), 'validation',
+                               '2020-01-01T00:00:00'))
+    copy_path = os.path.join(tmpdir, 'copy.xml')
+    results['write_preserving'] = timeit(lambda: preserving.write_to_file(copy_path), repeat)
+    os.remove(copy_path)
+    snapshot_path = os.path.join(tmpdir, 'premis.snapshot')
+    results['write_snapshot'] = timeit(lambda: record.to_snapshot(snapshot_path), repeat)
+    results['load_snapshot'] = timeit(lambda: PremisRecord.from_snapshot(snapshot_path), repeat)
+    results['load_snapshot']['bytes'] = os.path.getsize(snapshot_path)
+    os.remove(snapshot_path)
+
+    size = os.path.getsize(path)
+    results['parse_xml']['bytes'] = size
+    results['parse']['bytes'] = size
+    results['parse_lazy']['bytes'] = size
+    results['parse_opaque']['bytes'] = size
+    results['write_to_file']['bytes'] = size
+    results['write_preserving']['bytes'] = size
+    os.remove(path)
+    os.rmdir(tmpdir)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the core PremisRecord operations.")
+    parser.add_argument('--objects', type=int, default=100)
+    parser.add_argument('--events-per-object', type=int, default=5)
+    parser.add_argument('--agents', type=int, default=3)
+    parser.add_argument('--rights', type=int, default=1)
+    parser.add_argument('--no-extensions', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="write JSON results here rather than stdout")
+    args = parser.parse_args(argv)
+
+    params = {
+        'objects': args.objects,
+        'events_per_object': args.events_per_object,
+        'agents': args.agents,
+        'rights': args.rights,
+        'extensions': not args.no_extensions,
+        'seed': args.seed,
+    }
+    output = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+        },
+        'params': params,
+        'results': run(params, repeat=args.repeat),
+    }
+    text = json.dumps(output, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
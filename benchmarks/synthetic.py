@@ -0,0 +1,242 @@
+import random
+import string
+
+from pypremis.lib import PremisRecord
+from pypremis.nodes import *
+
+
+"""
+### A deterministic generator of synthetic PREMIS records ###
+
+**generate_nodes()** builds lists of Object, Event, Agent and Rights nodes
+shaped like the records we see in production: several identifiers per
+object, fixity and format information, chains of events linked back to
+their objects and agents, and (optionally) extension blocks. The same
+arguments always produce the same record.
+
+It runs in two steps, so building nodes can be timed on its own:
+**generate_values()** draws the random contents as plain values, and
+**build_nodes()** builds the nodes from them.
+"""
+
+
+EVENT_TYPES = ['ingestion', 'fixity check', 'virus check', 'format identification',
+               'replication', 'migration', 'validation', 'metadata modification']
+AGENT_TYPES = ['software', 'person', 'organization']
+ALGORITHMS = ['SHA-256', 'MD5', 'SHA-512']
+FORMATS = [('application/pdf', '1.4'), ('image/tiff', '6.0'), ('text/plain', None),
+           ('image/jpeg', '1.02'), ('audio/x-wav', None)]
+
+
+class _Strings(object):
+    # Wraps a seeded Random to produce strings of realistic shapes
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+
+    def word(self, low=4, high=12):
+        return ''.join(self.rng.choice(string.ascii_lowercase)
+                       for _ in range(self.rng.randint(low, high)))
+
+    def sentence(self, low=6, high=30):
+        return ' '.join(self.word() for _ in range(self.rng.randint(low, high)))
+
+    def hex(self, length):
+        return ''.join(self.rng.choice('0123456789abcdef') for _ in range(length))
+
+    def date(self):
+        return "{:04d}-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}".format(
+            self.rng.randint(2000, 2020), self.rng.randint(1, 12), self.rng.randint(1, 28),
+            self.rng.randint(0, 23), self.rng.randint(0, 59), self.rng.randint(0, 59))
+
+    def path(self):
+        return '/' + '/'.join(self.word(2, 8) for _ in range(self.rng.randint(3, 8))) + \
+            '.' + self.word(3, 4)
+
+
+def _extension_values(s, depth=2):
+    # (name, value) pairs for an extension block, where a value is a string
+    # or a list of (name, string) pairs for a nested element
+    values = []
+    for _ in range(s.rng.randint(2, 5)):
+        if depth and s.rng.random() < 0.3:
+            child = [('{http://example.org/ext}' + s.word(), s.sentence(1, 6))
+                     for _ in range(s.rng.randint(1, 4))]
+            values.append(('{http://example.org/ext}' + s.word(), child))
+        else:
+            values.append(('{http://example.org/ext}' + s.word(), s.sentence(1, 10)))
+    return values
+
+
+def _extension(cls, values):
+    node = cls()
+    for name, value in values:
+        if isinstance(value, list):
+            child = ExtensionNode()
+            for child_name, child_value in value:
+                child.add_to_field(child_name, child_value)
+            value = child
+        node.add_to_field(name, value)
+    return node
+
+
+def generate_values(objects=100, events_per_object=5, agents=3, rights=1,
+                    extensions=True, seed=0):
+    """
+    Generate the contents of a synthetic record as plain values, without
+    building any nodes. See generate_nodes() for the kwargs.
+
+    __Returns__
+
+    * (dict): lists of plain dicts under 'objects', 'agents' and 'rights',
+    each object holding its events, to be passed to build_nodes()
+    """
+    s = _Strings(seed)
+
+    agent_list = []
+    for i in range(agents):
+        agent = {'identifier': ('local', 'agent-{}'.format(i))}
+        agent['name'] = s.sentence(1, 4)
+        agent['type'] = s.rng.choice(AGENT_TYPES)
+        agent['version'] = '{}.{}.{}'.format(s.rng.randint(0, 9), s.rng.randint(0, 20), s.rng.randint(0, 99))
+        agent['note'] = s.sentence()
+        agent['extension'] = _extension_values(s) if extensions else None
+        agent_list.append(agent)
+
+    object_list = []
+    event_number = 0
+    for i in range(objects):
+        obj = {'identifiers': [('local', 'object-{}'.format(i)), ('uuid', s.hex(32))]}
+        obj['fixity'] = [(x, s.hex(64 if x == 'SHA-256' else 32 if x == 'MD5' else 128))
+                         for x in ALGORITHMS[:s.rng.randint(1, 3)]]
+        obj['format'] = s.rng.choice(FORMATS)
+        obj['registryKey'] = 'fmt/{}'.format(s.rng.randint(1, 999))
+        obj['size'] = str(s.rng.randint(1, 10**10))
+        obj['extension'] = _extension_values(s) if extensions else None
+        obj['originalName'] = s.path()
+        obj['contentLocation'] = s.path()
+        obj['events'] = []
+        for _ in range(events_per_object):
+            event = {'identifier': ('local', 'event-{}'.format(event_number))}
+            event_number += 1
+            event['detail'] = s.sentence()
+            event['extension'] = _extension_values(s) if extensions else None
+            event['type'] = s.rng.choice(EVENT_TYPES)
+            event['dateTime'] = s.date()
+            event['outcome'] = s.rng.choice(['success', 'failure'])
+            event['outcomeNote'] = s.sentence()
+            event['agent'] = s.rng.choice(agent_list)['identifier'] if agent_list else None
+            obj['events'].append(event)
+        object_list.append(obj)
+
+    rights_list = [{'identifier': ('local', 'rights-{}'.format(i))} for i in range(rights)]
+
+    return {'objects': object_list, 'agents': agent_list, 'rights': rights_list}
+
+
+def build_nodes(values):
+    """
+    Build the nodes of a synthetic record from generate_values()'s output.
+
+    __Args__
+
+    1. values (dict): the output of generate_values()
+
+    __Returns__
+
+    * (tuple): lists of (objects, events, agents, rights) nodes
+    """
+    agent_list = []
+    for values_agent in values['agents']:
+        agent = Agent(AgentIdentifier(*values_agent['identifier']))
+        agent.set_agentName(values_agent['name'])
+        agent.set_agentType(values_agent['type'])
+        agent.set_agentVersion(values_agent['version'])
+        agent.set_agentNote(values_agent['note'])
+        if values_agent['extension'] is not None:
+            agent.set_agentExtension(_extension(AgentExtension, values_agent['extension']))
+        agent_list.append(agent)
+
+    object_list = []
+    event_list = []
+    for values_object in values['objects']:
+        identifiers = [ObjectIdentifier(*x) for x in values_object['identifiers']]
+        fixity = [Fixity(algorithm, digest, 'pypremis')
+                  for algorithm, digest in values_object['fixity']]
+        formatName, formatVersion = values_object['format']
+        characteristics = ObjectCharacteristics(
+            Format(formatDesignation=FormatDesignation(formatName, formatVersion),
+                   formatRegistry=FormatRegistry('PRONOM', values_object['registryKey'])),
+            compositionLevel='0',
+            fixity=fixity,
+            size=values_object['size']
+        )
+        if values_object['extension'] is not None:
+            characteristics.set_objectCharacteristicsExtension(
+                _extension(ObjectCharacteristicsExtension, values_object['extension']))
+        obj = Object(identifiers, 'file', characteristics,
+                     originalName=values_object['originalName'],
+                     storage=Storage(ContentLocation('filepath', values_object['contentLocation']),
+                                     'disk'))
+        objectIdentifierValue = values_object['identifiers'][0][1]
+        for values_event in values_object['events']:
+            eventIdentifier = EventIdentifier(*values_event['identifier'])
+            detail = EventDetailInformation(eventDetail=values_event['detail'])
+            if values_event['extension'] is not None:
+                detail.set_eventDetailExtension(
+                    _extension(EventDetailExtension, values_event['extension']))
+            event = Event(
+                eventIdentifier, values_event['type'], values_event['dateTime'],
+                eventDetailInformation=detail,
+                eventOutcomeInformation=EventOutcomeInformation(
+                    values_event['outcome'],
+                    EventOutcomeDetail(eventOutcomeDetailNote=values_event['outcomeNote'])),
+                linkingObjectIdentifier=LinkingObjectIdentifier('local', objectIdentifierValue, 'source')
+            )
+            if values_event['agent'] is not None:
+                event.set_linkingAgentIdentifier(LinkingAgentIdentifier(
+                    values_event['agent'][0], values_event['agent'][1], 'executing program'))
+            obj.add_linkingEventIdentifier(LinkingEventIdentifier(*values_event['identifier']))
+            event_list.append(event)
+        object_list.append(obj)
+
+    rights_list = []
+    for values_rights in values['rights']:
+        statement = RightsStatement(RightsStatementIdentifier(*values_rights['identifier']),
+                                    'copyright')
+        statement.set_copyrightInformation(CopyrightInformation('copyrighted', 'us'))
+        statement.set_rightsGranted(RightsGranted('replicate'))
+        rights_list.append(Rights(rightsStatement=statement))
+
+    return object_list, event_list, agent_list, rights_list
+
+
+def generate_nodes(objects=100, events_per_object=5, agents=3, rights=1,
+                   extensions=True, seed=0):
+    """
+    Generate the nodes of a synthetic record.
+
+    __KWArgs__
+
+    * objects (int): the number of Object nodes
+    * events_per_object (int): the number of Event nodes linked to each object
+    * agents (int): the number of Agent nodes, events link to these
+    * rights (int): the number of Rights nodes
+    * extensions (bool): include extension blocks in objects and events
+    * seed (int): the random seed
+
+    __Returns__
+
+    * (tuple): lists of (objects, events, agents, rights) nodes
+    """
+    return build_nodes(generate_values(objects=objects, events_per_object=events_per_object,
+                                       agents=agents, rights=rights, extensions=extensions,
+                                       seed=seed))
+
+
+def generate_record(**kwargs):
+    """
+    Generate a synthetic PremisRecord. Takes the same kwargs as
+    generate_nodes().
+    """
+    objects, events, agents, rights = generate_nodes(**kwargs)
+    return PremisRecord(objects=objects, events=events, agents=agents, rights=rights)
@@ -0,0 +1,173 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from pypremis.lib import PremisRecord
+
+from benchmarks.run import git_revision
+from benchmarks.synthetic import generate_record
+
+
+"""
+### Thread scaling benchmark ###
+
+Parses and serializes a synthetic record from an increasing number of
+threads at once, each thread working on records of its own, and reports how
+the throughput scales with the thread count. On a free-threaded (no GIL)
+build of python on a multi-core machine the throughput should grow with the
+number of threads, with the GIL it stays roughly flat.
+
+The output has the same shape as benchmarks.run, with one result per
+operation and thread count, so two runs from different commits can be
+compared with benchmarks.compare.
+"""
+
+
+def gil_enabled():
+    """
+    Returns whether the GIL is enabled, which it always is before 3.13.
+    """
+    check = getattr(sys, '_is_gil_enabled', None)
+    return True if check is None else check()
+
+
+def measure(work, threads, iterations):
+    """
+    Time threads threads each calling work() iterations times, starting
+    together.
+
+    __Returns__
+
+    * (float): the wall clock seconds until every thread finished
+    """
+    barrier = threading.Barrier(threads + 1)
+    errors = []
+
+    def worker():
+        barrier.wait()
+        try:
+            for _ in range(iterations):
+                work()
+        except BaseException as e:
+            errors.append(e)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise errors[0]
+    return elapsed
+
+
+def run(params, thread_counts, iterations=5, repeat=3):
+    """
+    Run the parse and serialize benchmarks at each thread count.
+
+    __Args__
+
+    1. params (dict): kwargs for benchmarks.synthetic.generate_record()
+    2. thread_counts (list): the numbers of threads to run with
+
+    __KWArgs__
+
+    * iterations (int): the records each thread handles per run
+    * repeat (int): the number of runs at each thread count
+
+    __Returns__
+
+    * (dict): benchmark names mapped to timing dicts, which also hold the
+    records handled per second and the speedup over one thread
+    """
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, 'premis.xml')
+    generate_record(**params).write_to_file(path)
+
+    def parse():
+        PremisRecord(frompath=path)
+
+    local = threading.local()
+
+    def serialize():
+        # Each thread serializes a record of its own
+        record = getattr(local, 'record', None)
+        if record is None:
+            record = local.record = PremisRecord(frompath=path)
+        record.to_xml()
+
+    results = {}
+    try:
+        for name, work in (('parse', parse), ('serialize', serialize)):
+            baseline = None
+            for threads in thread_counts:
+                # Warm up, and build the per thread records outside the timing
+                measure(work, threads, 1)
+                times = [measure(work, threads, iterations) for _ in range(repeat)]
+                best = min(times)
+                throughput = threads * iterations / best
+                if baseline is None:
+                    # Per thread throughput at the lowest thread count
+                    baseline = throughput / threads
+                results['{}_threads_{}'.format(name, threads)] = {
+                    'best': best,
+                    'mean': sum(times) / len(times),
+                    'runs': repeat,
+                    'threads': threads,
+                    'records_per_second': throughput,
+                    'speedup': throughput / baseline,
+                }
+    finally:
+        os.remove(path)
+        os.rmdir(tmpdir)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure parse and serialize throughput "
+                                                 "at increasing thread counts.")
+    parser.add_argument('--objects', type=int, default=100)
+    parser.add_argument('--events-per-object', type=int, default=5)
+    parser.add_argument('--threads', type=int, nargs='+',
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="write JSON results here rather than stdout")
+    args = parser.parse_args(argv)
+
+    params = {
+        'objects': args.objects,
+        'events_per_object': args.events_per_object,
+    }
+    output = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'gil_enabled': gil_enabled(),
+            'cpu_count': os.cpu_count(),
+        },
+        'params': dict(params, iterations=args.iterations),
+        'results': run(params, args.threads, iterations=args.iterations, repeat=args.repeat),
+    }
+    text = json.dumps(output, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+### pypremis ###
+
+The commonly used names are available directly from the package, eg
+pypremis.PremisRecord, and submodules (pypremis.nodes, pypremis.fixity, ...)
+can be accessed as attributes the same way. They're imported when they're
+first used, so "import pypremis" itself loads nothing else; importing
+anything that works with records (pypremis.lib, pypremis.factories, ...)
+still loads the node classes.
+"""
+
+import importlib
+
+
+# Lazily resolved names, mapped to the submodule which defines them
+_ATTRIBUTES = {
+    'PremisRecord': 'pypremis.lib',
+    'NodeSet': 'pypremis.lib',
+    'DuplicateIdentifierError': 'pypremis.lib',
+    'EventLogger': 'pypremis.eventlog',
+    'XMLNodeFactory': 'pypremis.factories',
+    'FixityVerifier': 'pypremis.fixity',
+    'FixityCache': 'pypremis.fixity',
+    'AuditScheduler': 'pypremis.scheduler',
+}
+
+_SUBMODULES = [
+    'aio',
+    'archives',
+    'bagit',
+    'characterize',
+    'compression',
+    'eventlog',
+    'factories',
+    'fixity',
+    'instrument',
+    'journal',
+    'jsonform',
+    'lib',
+    'memory',
+    'mets',
+    'nodes',
+    'parallel',
+    'scheduler',
+    'snapshot',
+    'source',
+]
+
+__all__ = sorted(_ATTRIBUTES) + _SUBMODULES
+
+
+def __getattr__(name):
+    # PEP 562, only called for names not already in the module namespace.
+    # Resolved values are cached in globals() so this only runs once per name.
+    if name in _ATTRIBUTES:
+        value = getattr(importlib.import_module(_ATTRIBUTES[name]), name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module('pypremis.' + name)
+    else:
+        raise AttributeError("module 'pypremis' has no attribute '{}'".format(name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,298 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from pypremis.compression import for_target
+from pypremis.factories import XMLNodeFactory
+from pypremis.lib import PremisRecord
+
+
+"""
+### asyncio interfaces to PremisRecords ###
+
+Parsing and serializing records is CPU and disk bound and takes seconds for
+big records. These coroutines run that work on a bounded pool of threads so
+the event loop stays responsive.
+
+1. **load()** reads a PremisRecord from a file.
+2. **save()** writes a PremisRecord to a file atomically.
+3. **iter_entities()**, **iter_objects()**, **iter_events()**,
+**iter_agents()** and **iter_rights()** are async iterators over the
+streaming reader, see XMLNodeFactory.iter_entities().
+4. **AsyncExecutor** is the pool they run on. At most max_pending jobs are
+queued or running at once; further callers wait their turn, which keeps a
+burst of requests from piling up unbounded work.
+
+Cancelling a coroutine stops work that hasn't started. Work that has started
+runs to completion in its thread, but its result is discarded, and save()
+only ever replaces the target with a completely written file.
+"""
+
+
+class AsyncExecutor(object):
+    """
+    A thread pool with a bound on outstanding jobs.
+
+    __Attributes__
+
+    1. pending (int): the number of jobs submitted to the threads and not
+    yet finished or cancelled
+    2. cancelled (int): the number of jobs cancelled before they started
+    """
+    def __init__(self, max_workers=4, max_pending=None):
+        """
+        __KWArgs__
+
+        * max_workers (int): the number of threads
+        * max_pending (int): the most jobs queued or running at once.
+        Defaults to 2 * max_workers.
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending or 2 * max_workers
+        self.pending = 0
+        self.cancelled = 0
+        self._pool = None
+        self._lock = threading.Lock()
+        # asyncio.Semaphores belong to one event loop
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.max_workers,
+                                                thread_name_prefix='pypremis-aio')
+            return self._pool
+
+    def _get_semaphore(self, loop):
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.max_pending)
+                self._semaphores[loop] = semaphore
+            return semaphore
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs) in the pool, waiting for a free slot first.
+
+        __Returns__
+
+        * the result of func
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._get_semaphore(loop)
+        await semaphore.acquire()
+        with self._lock:
+            self.pending += 1
+        try:
+            future = self._get_pool().submit(func, *args, **kwargs)
+        except BaseException:
+            with self._lock:
+                self.pending -= 1
+            semaphore.release()
+            raise
+
+        def release(future):
+            with self._lock:
+                self.pending -= 1
+                if future.cancelled():
+                    self.cancelled += 1
+            # The slot is held until the thread is done, even if the caller
+            # was cancelled, so cancelled work still counts against the bound
+            try:
+                loop.call_soon_threadsafe(semaphore.release)
+            except RuntimeError:
+                # The loop has been closed
+                pass
+
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self, wait=True):
+        """
+        Stop the threads. The executor starts new ones if it's used again.
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+
+_default = AsyncExecutor()
+
+
+def get_executor():
+    """
+    Returns the AsyncExecutor used when none is given.
+    """
+    return _default
+
+
+async def load(path, executor=None, **kwargs):
+    """
+    Read a PremisRecord from a file.
+
+    __Args__
+
+    1. path (str): the location of the premis xml file
+
+    __KWArgs__
+
+    * executor (AsyncExecutor): the executor to run on
+    * any other keyword arguments are passed to PremisRecord, eg lazy=True
+
+    __Returns__
+
+    * (PremisRecord): the record
+    """
+    executor = executor or _default
+    return await executor.run(PremisRecord, frompath=path, **kwargs)
+
+
+def _save(record, path, cancelled):
+    source = record._source
+    if source is not None and os.path.exists(path) and \
+            os.path.samefile(path, source.path) and \
+            source.is_spliceable() and source.is_current():
+        # Already written to a temporary file and renamed into place, and
+        # keeps the record bound to its rewritten source
+        record.write_to_file(path)
+        return True
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(handle)
+    try:
+        # Compressed as path's suffix or existing contents ask, not as the
+        # temporary file's name would
+        record.write_to_file(tmp, compression=for_target(path))
+        if cancelled.is_set():
+            os.remove(tmp)
+            return False
+        if os.path.exists(path):
+            shutil.copymode(path, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return True
+
+
+async def save(record, path, executor=None):
+    """
+    Write a PremisRecord to a file.
+
+    The record is written to a temporary file next to path and renamed over
+    it, so path holds either its old contents or the whole new record, even
+    if the save is cancelled or fails part way through.
+
+    The record shouldn't be modified while it is being saved.
+
+    __Args__
+
+    1. record (PremisRecord): the record
+    2. path (str): the location to write it to
+
+    __KWArgs__
+
+    * executor (AsyncExecutor): the executor to run on
+    """
+    executor = executor or _default
+    cancelled = threading.Event()
+    try:
+        await executor.run(_save, record, path, cancelled)
+    except asyncio.CancelledError:
+        cancelled.set()
+        raise
+
+
+class _Reader(object):
+    # Advances a generator from the executor's threads, one job at a time
+    def __init__(self, iterator):
+        self.iterator = iterator
+        self.lock = threading.Lock()
+
+    def take(self, n):
+        result = []
+        with self.lock:
+            for item in self.iterator:
+                result.append(item)
+                if len(result) == n:
+                    break
+        return result
+
+    def close(self):
+        # Waits for a take() that was cancelled but had already started
+        with self.lock:
+            self.iterator.close()
+
+
+async def _iterate(path, method, executor, chunk_size):
+    executor = executor or _default
+    reader = _Reader(getattr(XMLNodeFactory(path), method)())
+    try:
+        while True:
+            # The next chunk is only read once the caller has consumed this
+            # one, so a slow consumer holds back the reader
+            chunk = await executor.run(reader.take, chunk_size)
+            for item in chunk:
+                yield item
+            if len(chunk) < chunk_size:
+                return
+    finally:
+        # Closes the file if iteration stopped early
+        await asyncio.shield(executor.run(reader.close))
+
+
+def iter_entities(path, executor=None, chunk_size=64):
+    """
+    Asynchronously iterate over the top level entities of a premis xml file
+    in document order, streaming the file.
+
+    __Args__
+
+    1. path (str): the location of the premis xml file
+
+    __KWArgs__
+
+    * executor (AsyncExecutor): the executor to run on
+    * chunk_size (int): the number of entities built per job
+
+    __Returns__
+
+    * (async generator): (name, PremisNode) tuples, where name is one of
+    'object', 'event', 'agent' or 'rights'
+    """
+    return _iterate(path, 'iter_entities', executor, chunk_size)
+
+
+def iter_objects(path, executor=None, chunk_size=64):
+    """
+    An async variant of XMLNodeFactory.iter_objects(), see iter_entities()
+    """
+    return _iterate(path, 'iter_objects', executor, chunk_size)
+
+
+def iter_events(path, executor=None, chunk_size=64):
+    """
+    An async variant of XMLNodeFactory.iter_events(), see iter_entities()
+    """
+    return _iterate(path, 'iter_events', executor, chunk_size)
+
+
+def iter_agents(path, executor=None, chunk_size=64):
+    """
+    An async variant of XMLNodeFactory.iter_agents(), see iter_entities()
+    """
+    return _iterate(path, 'iter_agents', executor, chunk_size)
+
+
+def iter_rights(path, executor=None, chunk_size=64):
+    """
+    An async variant of XMLNodeFactory.iter_rights(), see iter_entities()
+    """
+    return _iterate(path, 'iter_rights', executor, chunk_size)
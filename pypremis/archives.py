@@ -0,0 +1,148 @@
+import os
+import tarfile
+import zipfile
+from fnmatch import fnmatchcase
+
+from pypremis.lib import PremisRecord
+
+
+"""
+### Loading PREMIS records from zip and tar packages ###
+
+Packaged AIPs can be read without extracting them: matching members are
+streamed from the archive straight into the parser. Members which are
+themselves compressed (eg metadata/premis.xml.gz) are decompressed as they're
+read, as are tar archives (.tar.gz, .tar.xz, ...).
+
+1. **iter_members()** yields the matching members of one archive as file
+objects.
+2. **iter_records()** yields a PremisRecord for each matching member of one
+archive.
+3. **load_archives()** loads the records of many archives, optionally in a
+pool of worker processes.
+"""
+
+
+# Member names matched by default, with fnmatch's wildcards (* also matches
+# /, so the second matches at any depth)
+DEFAULT_PATTERNS = ('metadata/premis.xml', '*/metadata/premis.xml')
+
+
+def _patterns(patterns):
+    if patterns is None:
+        return DEFAULT_PATTERNS
+    if isinstance(patterns, str):
+        return (patterns,)
+    return tuple(patterns)
+
+
+def _matches(name, patterns):
+    return any(fnmatchcase(name, pattern) for pattern in patterns)
+
+
+def iter_members(archive, patterns=None):
+    """
+    Yields the members of a zip or tar archive whose names match, opened for
+    reading. Each member is closed once the next one is asked for.
+
+    __Args__
+
+    1. archive (str): the path to the archive
+
+    __KWArgs__
+
+    * patterns (str or list): fnmatch patterns for the member names to
+    yield. Defaults to DEFAULT_PATTERNS, any metadata/premis.xml.
+
+    __Returns__
+
+    * (generator): (member name, binary file object) tuples, in the
+    archive's order
+    """
+    patterns = _patterns(patterns)
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as z:
+            for info in z.infolist():
+                if info.is_dir() or not _matches(info.filename, patterns):
+                    continue
+                with z.open(info) as f:
+                    yield info.filename, f
+    elif os.path.isfile(archive) and tarfile.is_tarfile(archive):
+        with tarfile.open(archive, 'r:*') as t:
+            for member in t:
+                if not member.isfile() or not _matches(member.name, patterns):
+                    continue
+                with t.extractfile(member) as f:
+                    yield member.name, f
+    else:
+        raise ValueError("{} isn't a zip or tar archive".format(archive))
+
+
+def iter_records(archive, patterns=None, **kwargs):
+    """
+    Yields a record for each matching member of a zip or tar archive.
+
+    __Args__
+
+    1. archive (str): the path to the archive
+
+    __KWArgs__
+
+    * patterns (str or list): see iter_members()
+    * Anything else is passed to PremisRecord, eg lazy or
+    opaque_extensions. Options which need the record's own file on disk
+    (preserve_source, journal) don't apply.
+
+    __Returns__
+
+    * (generator): (member name, PremisRecord) tuples
+    """
+    for name, f in iter_members(archive, patterns):
+        record = PremisRecord(frompath=f, **kwargs)
+        # Rather than the member's file object, which is closed once the
+        # next member is read
+        record.set_filepath(None)
+        yield name, record
+
+
+def _load_archive(archive, patterns, kwargs):
+    # Runs in the worker processes of load_archives()
+    return list(iter_records(archive, patterns, **kwargs))
+
+
+def load_archives(archives, patterns=None, workers=None, **kwargs):
+    """
+    Loads the records in many zip or tar archives.
+
+    __Args__
+
+    1. archives (list): paths to the archives
+
+    __KWArgs__
+
+    * patterns (str or list): see iter_members()
+    * workers (int): load the archives in this many worker processes,
+    rather than one after another in this one
+    * Anything else is passed to PremisRecord, see iter_records()
+
+    __Returns__
+
+    * (generator): (archive, member name, PremisRecord) tuples, in the order
+    of archives and then of their members
+    """
+    archives = list(archives)
+    patterns = _patterns(patterns)
+    if not workers or workers < 2 or len(archives) < 2:
+        for archive in archives:
+            for name, record in iter_records(archive, patterns, **kwargs):
+                yield archive, name, record
+        return
+    # Imported here, only parallel loads need it
+    from concurrent.futures import ProcessPoolExecutor
+    count = len(archives)
+    with ProcessPoolExecutor(min(workers, count)) as pool:
+        results = pool.map(_load_archive, archives,
+                           [patterns] * count, [kwargs] * count)
+        for archive, records in zip(archives, results):
+            for name, record in records:
+                yield archive, name, record
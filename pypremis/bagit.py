@@ -0,0 +1,224 @@
+import os
+import random
+import re
+
+from pypremis.characterize import build_object, sniff_format
+from pypremis.fixity import hash_file, normalize_algorithm
+from pypremis.lib import PremisRecord
+
+
+"""
+### Building Object nodes from BagIt manifests ###
+
+1. **iter_bag_objects()** is a generator which yields an Object PremisNode
+for every payload (and optionally tag) file listed in a bag's manifests,
+taking its fixity from the manifests rather than re-hashing it.
+2. **load_bag()** wraps iter_bag_objects() to fill a PremisRecord.
+3. **iter_manifest()** streams the entries of a single manifest file.
+"""
+
+
+class BagItError(ValueError):
+    """Raised when a bag is malformed or a spot check of its manifest fails"""
+
+
+# BagIt manifest algorithm names mapped to the messageDigestAlgorithm values
+# we record. Anything not in here is recorded verbatim.
+PREMIS_ALGORITHMS = {
+    'md5': 'MD5',
+    'sha1': 'SHA-1',
+    'sha224': 'SHA-224',
+    'sha256': 'SHA-256',
+    'sha384': 'SHA-384',
+    'sha512': 'SHA-512',
+}
+
+# The order manifests are preferred in when picking which one to stream
+PREFERENCE = ['sha512', 'sha384', 'sha256', 'sha224', 'sha1', 'md5']
+
+_MANIFEST = re.compile(r'^(tag)?manifest-([A-Za-z0-9]+)\.txt$')
+_ESCAPE = re.compile(r'%(0[AaDd]|25)')
+
+
+def _unescape(path):
+    # BagIt 1.0 percent-encodes CR, LF and % in manifest paths
+    return _ESCAPE.sub(lambda m: chr(int(m.group(1), 16)), path)
+
+
+def find_manifests(bag, tag=False):
+    """
+    Find a bag's manifest files.
+
+    __Args__
+
+    1. bag (str): the bag's root directory
+
+    __KWArgs__
+
+    * tag (bool): find tagmanifests rather than payload manifests
+
+    __Returns__
+
+    * (dict): BagIt algorithm names mapped to manifest paths
+    """
+    result = {}
+    for name in os.listdir(bag):
+        match = _MANIFEST.match(name)
+        if match and bool(match.group(1)) == tag:
+            result[match.group(2).lower()] = os.path.join(bag, name)
+    return result
+
+
+def iter_manifest(path, encoding='utf-8'):
+    """
+    Stream the entries of a manifest file.
+
+    __Args__
+
+    1. path (str): the location of the manifest file
+
+    __Returns__
+
+    * (generator): (digest, path relative to the bag root) tuples
+    """
+    with open(path, 'r', encoding=encoding, newline=None) as f:
+        for lineno, line in enumerate(f, start=1):
+            line = line.rstrip('\r\n')
+            if lineno == 1:
+                line = line.lstrip('\ufeff')
+            if not line.strip():
+                continue
+            parts = line.split(None, 1)
+            if len(parts) != 2:
+                raise BagItError("Malformed line {} in {}".format(lineno, path))
+            digest, relpath = parts
+            yield digest.lower(), _unescape(relpath.strip())
+
+
+def _ordered(manifests):
+    return sorted(manifests, key=lambda x: PREFERENCE.index(x) if x in PREFERENCE else len(PREFERENCE))
+
+
+def _iter_entries(bag, manifests):
+    # Streams the preferred manifest and looks up the rest, so only the
+    # secondary manifests are ever held in memory.
+    order = _ordered(manifests)
+    primary, secondary = order[0], order[1:]
+    lookups = {x: dict((p, d) for d, p in iter_manifest(manifests[x])) for x in secondary}
+    for digest, relpath in iter_manifest(manifests[primary]):
+        digests = {primary: digest}
+        for algorithm in secondary:
+            if relpath in lookups[algorithm]:
+                digests[algorithm] = lookups[algorithm][relpath]
+        yield relpath, digests
+
+
+def _payload_path(bag, relpath):
+    # The location of a manifest entry, which has to be inside the bag
+    path = os.path.normpath(os.path.join(bag, *relpath.split('/')))
+    if os.path.isabs(relpath) or os.path.commonpath([bag, path]) != bag or path == bag:
+        raise BagItError("{} is listed in a manifest but isn't inside the bag".format(relpath))
+    return path
+
+
+def iter_bag_objects(bag, include_tags=False, algorithms=None, sample_rate=0,
+                     seed=None, messageDigestOriginator=None,
+                     objectIdentifierType='uuid', contentLocationType='filepath'):
+    """
+    Yield an Object node for every file listed in a bag's manifests. Sizes
+    come from os.stat, fixity from the manifests and formats from file
+    extensions, so payload files are only read if they are spot checked.
+
+    __Args__
+
+    1. bag (str): the bag's root directory
+
+    __KWArgs__
+
+    * include_tags (bool): also yield Objects for the files listed in the
+    tagmanifests, if the bag has any
+    * algorithms (iterable): the BagIt algorithm names to record fixity for,
+    eg ['sha256']. Defaults to every manifest present.
+    * sample_rate (float): the probability, between 0 and 1, that any given
+    file is re-hashed and checked against its manifest entries
+    * seed (any): a seed for the spot check sampling
+    * messageDigestOriginator (str): recorded in every Fixity node
+    * objectIdentifierType (str): the objectIdentifierType of produced
+    Objects. Identifier values are random uuids.
+    * contentLocationType (str): the contentLocationType of produced Objects
+
+    __Returns__
+
+    * (generator): Object PremisNode instances in manifest order
+    """
+    bag = os.path.abspath(bag)
+    if not os.path.isfile(os.path.join(bag, 'bagit.txt')):
+        raise BagItError("{} is not a bag, it has no bagit.txt".format(bag))
+    rng = random.Random(seed)
+    groups = [find_manifests(bag)]
+    if include_tags:
+        groups.append(find_manifests(bag, tag=True))
+    for tags, manifests in enumerate(groups):
+        if algorithms is not None:
+            manifests = {x: manifests[x] for x in manifests if x in algorithms}
+        if not manifests:
+            if tags:
+                # Tagmanifests are optional
+                continue
+            raise BagItError("No usable manifests found in {}".format(bag))
+        names = {}
+        for algorithm in manifests:
+            name = normalize_algorithm(algorithm)
+            if name is None:
+                raise BagItError("Unsupported manifest algorithm: {}".format(algorithm))
+            names[algorithm] = name
+        for relpath, digests in _iter_entries(bag, manifests):
+            path = _payload_path(bag, relpath)
+            try:
+                size = os.stat(path).st_size
+            except OSError:
+                raise BagItError("{} is listed in a manifest but missing".format(relpath))
+            if sample_rate and rng.random() < sample_rate:
+                actual = hash_file(path, [names[x] for x in digests])
+                for algorithm in digests:
+                    if actual[names[algorithm]] != digests[algorithm]:
+                        raise BagItError("{} does not match its manifest-{}.txt entry".format(
+                            relpath, algorithm))
+            originalName = relpath
+            if originalName.startswith('data/'):
+                originalName = originalName[len('data/'):]
+            yield build_object(
+                path, originalName, size,
+                {names[x]: digests[x] for x in digests},
+                sniff_format(b'', relpath),
+                {names[x]: PREMIS_ALGORITHMS.get(x, x) for x in _ordered(digests)},
+                objectIdentifierType=objectIdentifierType,
+                contentLocationType=contentLocationType,
+                messageDigestOriginator=messageDigestOriginator
+            )
+
+
+def load_bag(bag, record=None, **kwargs):
+    """
+    Build Object nodes for a bag into a PremisRecord.
+
+    __Args__
+
+    1. bag (str): the bag's root directory
+
+    __KWArgs__
+
+    * record (PremisRecord): a record to add the Objects to. If not supplied
+    a new one is created.
+    * All other kwargs are passed to iter_bag_objects()
+
+    __Returns__
+
+    * (PremisRecord): the record, which has no Objects if no record was
+    supplied and the bag's manifests were empty
+    """
+    if record is None:
+        record = PremisRecord._empty()
+    for obj in iter_bag_objects(bag, **kwargs):
+        record.add_object(obj)
+    return record
@@ -0,0 +1,333 @@
+import hashlib
+import mimetypes
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+from pypremis.fixity import normalize_algorithm
+from pypremis.lib import PremisRecord
+from pypremis.nodes import *
+
+
+"""
+### Building Object nodes from files on disk ###
+
+1. **walk()** is a generator which scans a directory tree and yields an
+Object PremisNode for every file in it, with its size, fixity, format,
+originalName and storage populated.
+2. **characterize()** wraps walk() to fill a PremisRecord.
+3. **sniff_format()** guesses a file's format from its leading bytes using
+the local SIGNATURES table.
+"""
+
+
+# (offset, magic bytes, formatName) triples, checked in order. Deliberately
+# small and local: anything more involved should go through a real format
+# identification tool and be recorded as its own event. Magic bytes short
+# enough to turn up at the start of text files are confirmed by CHECKS.
+SIGNATURES = [
+    (0, b'%PDF-', 'application/pdf'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'II*\x00', 'image/tiff'),
+    (0, b'MM\x00*', 'image/tiff'),
+    (0, b'\x00\x00\x00\x0cjP  \r\n\x87\n', 'image/jp2'),
+    (0, b'BM', 'image/bmp'),
+    (8, b'WEBP', 'image/webp'),
+    (8, b'WAVE', 'audio/x-wav'),
+    (8, b'AVI ', 'video/x-msvideo'),
+    (0, b'fLaC', 'audio/flac'),
+    (0, b'OggS', 'audio/ogg'),
+    (0, b'ID3', 'audio/mpeg'),
+    (4, b'ftyp', 'video/mp4'),
+    (0, b'\x1aE\xdf\xa3', 'video/x-matroska'),
+    (0, b'PK\x03\x04', 'application/zip'),
+    (0, b'\x1f\x8b', 'application/gzip'),
+    (0, b'BZh', 'application/x-bzip2'),
+    (0, b'\xfd7zXZ\x00', 'application/x-xz'),
+    (0, b"7z\xbc\xaf'\x1c", 'application/x-7z-compressed'),
+    (257, b'ustar', 'application/x-tar'),
+    (0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/x-ole-storage'),
+    (0, b'{\\rtf', 'application/rtf'),
+    (0, b'\xffWPC', 'application/vnd.wordperfect'),
+    (0, b'<?xml', 'text/xml'),
+    (0, b'\xef\xbb\xbf<?xml', 'text/xml'),
+]
+
+
+
+def _is_bmp(header):
+    # The reserved words of the file header are zero, and the DIB header
+    # size is one of the known versions'
+    if len(header) < 18 or header[6:10] != b'\0\0\0\0':
+        return False
+    return int.from_bytes(header[14:18], 'little') in (12, 16, 40, 52, 56, 64, 108, 124)
+
+
+def _is_id3(header):
+    # An ID3v2.2-2.4 tag header: major version, revision, flags with the
+    # undefined bits clear, and a syncsafe size
+    if len(header) < 10 or header[3] not in (2, 3, 4) or header[4] == 0xff:
+        return False
+    if header[5] & (0x3f if header[3] == 2 else 0x0f):
+        return False
+    return all(x < 0x80 for x in header[6:10])
+
+
+# formatNames mapped to functions confirming a signature match from the
+# header
+CHECKS = {
+    'image/bmp': _is_bmp,
+    'audio/mpeg': _is_id3,
+}
+
+SNIFF_BYTES = max(offset + len(magic) for offset, magic, _ in SIGNATURES)
+
+UNKNOWN_FORMAT = 'application/octet-stream'
+
+
+def sniff_format(header, name=None):
+    """
+    Guess the format of a file.
+
+    __Args__
+
+    1. header (bytes): at least the first SNIFF_BYTES bytes of the file
+
+    __KWArgs__
+
+    * name (str): the file name, used as a fallback if no signature matches
+
+    __Returns__
+
+    * (str): a mimetype
+    """
+    for offset, magic, formatName in SIGNATURES:
+        if header[offset:offset+len(magic)] == magic:
+            check = CHECKS.get(formatName)
+            if check is None or check(header):
+                return formatName
+    if name is not None:
+        guess = mimetypes.guess_type(name, strict=False)[0]
+        if guess is not None:
+            return guess
+    return UNKNOWN_FORMAT
+
+
+def _characterize_file(path, name, algorithms, sniff, cache, blocksize):
+    # Runs in the worker pool. Hashes and sniffs in the same read pass where
+    # the cache can't answer for us.
+    key = None
+    digests = {}
+    if cache is not None:
+        key, digests = cache.lookup(path, algorithms)
+    todo = [x for x in algorithms if x not in digests]
+    header = b''
+    if todo or sniff:
+        hashers = {x: hashlib.new(x) for x in todo}
+        with open(path, 'rb') as f:
+            if not todo:
+                header = f.read(SNIFF_BYTES)
+            data = f.read(blocksize) if todo else b''
+            if data:
+                header = data[:SNIFF_BYTES]
+            while data:
+                for hasher in hashers.values():
+                    hasher.update(data)
+                data = f.read(blocksize)
+        computed = {x: hashers[x].hexdigest() for x in hashers}
+        if cache is not None and computed:
+            cache.store(path, key, computed)
+        digests.update(computed)
+    if key is not None:
+        size = key[2]
+    else:
+        size = os.stat(path).st_size
+    formatName = sniff_format(header, name) if sniff else sniff_format(b'', name)
+    return size, digests, formatName
+
+
+def iter_files(root, follow_symlinks=False, on_error=None):
+    """
+    Yield (path, relative path) pairs for every regular file under root,
+    using os.scandir so that most entries never need a separate stat call.
+    Directories which can't be read are skipped, and passed to
+    on_error(path, exception) if it's given. With follow_symlinks each
+    directory is only descended into once, however many links lead to it.
+    """
+    stack = [root]
+    visited = set()
+    if follow_symlinks:
+        st = os.stat(root)
+        visited.add((st.st_dev, st.st_ino))
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = sorted(it, key=lambda x: x.name)
+        except OSError as e:
+            if on_error is not None:
+                on_error(current, e)
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=follow_symlinks):
+                if follow_symlinks:
+                    try:
+                        st = entry.stat()
+                    except OSError as e:
+                        if on_error is not None:
+                            on_error(entry.path, e)
+                        continue
+                    if (st.st_dev, st.st_ino) in visited:
+                        continue
+                    visited.add((st.st_dev, st.st_ino))
+                subdirs.append(entry.path)
+            elif entry.is_file(follow_symlinks=follow_symlinks):
+                yield entry.path, os.path.relpath(entry.path, root)
+        # Reversed so the stack pops directories in name order
+        stack.extend(reversed(subdirs))
+
+
+def build_object(path, relpath, size, digests, formatName, algorithms,
+                 objectIdentifierType='uuid', objectIdentifierValue=None,
+                 contentLocationType='filepath', messageDigestOriginator=None):
+    """
+    Assemble an Object node from the characteristics of a file.
+
+    __Args__
+
+    1. path (str): the file's location, recorded as its contentLocation
+    2. relpath (str): the name to record as the originalName
+    3. size (int): the file's size in bytes
+    4. digests (dict): hashlib algorithm names mapped to hex digests
+    5. formatName (str): the name to record in the formatDesignation
+    6. algorithms (dict): hashlib algorithm names mapped to the
+    messageDigestAlgorithm values that should be recorded for them
+
+    __Returns__
+
+    * (Object): the Object PremisNode instance
+    """
+    if objectIdentifierValue is None:
+        objectIdentifierValue = uuid4().hex
+    fixity = [Fixity(algorithms[x], digests[x], messageDigestOriginator)
+              for x in algorithms]
+    characteristics = ObjectCharacteristics(
+        Format(formatDesignation=FormatDesignation(formatName)),
+        compositionLevel='0',
+        fixity=fixity,
+        size=str(size)
+    )
+    storage = Storage(contentLocation=ContentLocation(contentLocationType, path))
+    return Object(ObjectIdentifier(objectIdentifierType, objectIdentifierValue),
+                  'file', characteristics, originalName=relpath, storage=storage)
+
+
+def walk(root, algorithms=('SHA-256',), sniff=True, workers=4, cache=None,
+         follow_symlinks=False, objectIdentifierType='uuid',
+         contentLocationType='filepath', blocksize=1024*1024,
+         messageDigestOriginator=None, on_error=None):
+    """
+    Characterize every file under a directory, yielding an Object node per
+    file. Files are stat'd, hashed and sniffed in a thread pool, and a
+    bounded number of files are in flight at once, so memory use doesn't grow
+    with the size of the tree.
+
+    Files and directories which can't be read (or which disappear during
+    the walk) are skipped rather than ending it.
+
+    __Args__
+
+    1. root (str): the directory to walk
+
+    __KWArgs__
+
+    * algorithms (iterable): the messageDigestAlgorithm values to record
+    fixity for
+    * sniff (bool): read the leading bytes of each file to identify its
+    format. If False formats are guessed from file extensions only.
+    * workers (int): the number of files to process concurrently
+    * cache (FixityCache): reuse digests of unchanged files
+    * follow_symlinks (bool): descend into symlinked directories and
+    characterize symlinked files
+    * objectIdentifierType (str): the objectIdentifierType of produced
+    Objects. Identifier values are random uuids.
+    * contentLocationType (str): the contentLocationType of produced Objects
+    * blocksize (int): the number of bytes to read at a time while hashing
+    * messageDigestOriginator (str): recorded in every Fixity node
+    * on_error (callable): called as on_error(path, exception) for every
+    file or directory that was skipped
+
+    __Returns__
+
+    * (generator): Object PremisNode instances, in directory walk order
+    """
+    names = {}
+    for algorithm in algorithms:
+        name = normalize_algorithm(algorithm)
+        if name is None:
+            raise ValueError("Unsupported digest algorithm: {}".format(algorithm))
+        names[name] = algorithm
+    root = os.path.abspath(root)
+    options = {'objectIdentifierType': objectIdentifierType,
+               'contentLocationType': contentLocationType,
+               'messageDigestOriginator': messageDigestOriginator}
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path, relpath in iter_files(root, follow_symlinks=follow_symlinks,
+                                        on_error=on_error):
+            future = executor.submit(_characterize_file, path, os.path.basename(path),
+                                     list(names), sniff, cache, blocksize)
+            pending.append((path, relpath, future))
+            while len(pending) > workers * 2:
+                obj = _build(pending.popleft(), names, options, on_error)
+                if obj is not None:
+                    yield obj
+        while pending:
+            obj = _build(pending.popleft(), names, options, on_error)
+            if obj is not None:
+                yield obj
+    if cache is not None:
+        cache.commit()
+
+
+def _build(entry, names, options, on_error):
+    # Returns None for files that couldn't be read
+    path, relpath, future = entry
+    try:
+        size, digests, formatName = future.result()
+    except OSError as e:
+        if on_error is not None:
+            on_error(path, e)
+        return None
+    return build_object(path, relpath, size, digests, formatName, names, **options)
+
+
+def characterize(root, record=None, **kwargs):
+    """
+    Characterize every file under a directory into a PremisRecord.
+
+    __Args__
+
+    1. root (str): the directory to walk
+
+    __KWArgs__
+
+    * record (PremisRecord): a record to add the Objects to. If not supplied
+    a new one is created.
+    * All other kwargs are passed to walk()
+
+    __Returns__
+
+    * (PremisRecord): the record, which has no Objects if no record was
+    supplied and the directory contained no files
+    """
+    if record is None:
+        record = PremisRecord._empty()
+    for obj in walk(root, **kwargs):
+        record.add_object(obj)
+    return record
@@ -0,0 +1,201 @@
+import io
+import os
+from contextlib import contextmanager
+
+
+"""
+### Reading and writing compressed PREMIS xml files ###
+
+Files compressed with gzip, xz or bzip2 are recognized by their first bytes
+whatever they're named, and are decompressed as they're read through the
+standard library's codecs, never to a temporary file.
+
+1. **detect()** returns the compression of a file or file object, if any.
+2. **infer()** returns the compression a path's suffix asks for.
+3. **for_target()** returns the compression to rewrite a path with.
+4. **reading()** is a context manager giving something ElementTree can
+parse, decompressing the source if it needs it.
+5. **open_writer()** opens a path for writing xml text, compressed.
+"""
+
+
+# Compression names mapped to the magic bytes their files start with
+MAGIC = {
+    'gz': b'\x1f\x8b',
+    'xz': b'\xfd7zXZ\x00',
+    'bz2': b'BZh',
+}
+
+# Suffixes mapped to the compression they imply
+SUFFIXES = {
+    '.gz': 'gz',
+    '.xz': 'xz',
+    '.bz2': 'bz2',
+}
+
+_HEAD = max(len(x) for x in MAGIC.values())
+
+
+def _match(head):
+    for name, magic in MAGIC.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def detect(source):
+    """
+    Detects whether a file is compressed from its first bytes.
+
+    __Args__
+
+    1. source: a path, or a binary file object. File objects are left where
+    they were, and are only checked if they can peek or seek. Text file
+    objects are never compressed.
+
+    __Returns__
+
+    * (str): 'gz', 'xz' or 'bz2', or None if the source isn't compressed
+    """
+    if isinstance(source, (str, bytes, os.PathLike)):
+        try:
+            with open(source, 'rb') as f:
+                return _match(f.read(_HEAD))
+        except (IsADirectoryError, FileNotFoundError):
+            return None
+    if isinstance(source, io.TextIOBase):
+        return None
+    peek = getattr(source, 'peek', None)
+    if peek is not None:
+        head = peek(_HEAD)[:_HEAD]
+    else:
+        try:
+            if not source.seekable():
+                return None
+            position = source.tell()
+            head = source.read(_HEAD)
+            source.seek(position)
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return None
+    if not isinstance(head, bytes):
+        return None
+    return _match(head)
+
+
+def infer(path):
+    """
+    Returns the compression a path's suffix implies, eg 'gz' for
+    premis.xml.gz.
+
+    __Args__
+
+    1. path (str): the path
+
+    __Returns__
+
+    * (str): 'gz', 'xz' or 'bz2', or None
+    """
+    if not isinstance(path, (str, os.PathLike)):
+        return None
+    return SUFFIXES.get(os.path.splitext(os.fspath(path))[1].lower())
+
+
+def for_target(path):
+    """
+    Returns the compression to write a path with when replacing it: what its
+    suffix implies, or failing that whatever the file already there uses,
+    so eg a gzipped premis.xml stays gzipped.
+
+    __Args__
+
+    1. path (str): the path
+
+    __Returns__
+
+    * (str): 'gz', 'xz' or 'bz2', or None
+    """
+    return infer(path) or detect(path)
+
+
+def _codec(compression):
+    # Imported here, only compressed files need them
+    if compression == 'gz':
+        import gzip
+        return gzip
+    if compression == 'xz':
+        import lzma
+        return lzma
+    if compression == 'bz2':
+        import bz2
+        return bz2
+    raise ValueError("Unknown compression: {}, expected one of {}".format(
+        compression, ', '.join(sorted(MAGIC))))
+
+
+def open_reader(source, compression):
+    """
+    Opens a compressed path or binary file object for reading its
+    decompressed bytes. Closing the reader doesn't close a file object it
+    was given.
+
+    __Args__
+
+    1. source: a path or binary file object
+    2. compression (str): 'gz', 'xz' or 'bz2'
+
+    __Returns__
+
+    * (file object): the decompressed stream
+    """
+    codec = _codec(compression)
+    if compression == 'gz':
+        if isinstance(source, (str, bytes, os.PathLike)):
+            return codec.open(source, 'rb')
+        return codec.GzipFile(fileobj=source, mode='rb')
+    if compression == 'xz':
+        return codec.LZMAFile(source, 'rb')
+    return codec.BZ2File(source, 'rb')
+
+
+@contextmanager
+def reading(source):
+    """
+    Gives a source as something ElementTree can parse, decompressed if it's
+    compressed and as is otherwise.
+
+    __Args__
+
+    1. source: a path or file object
+    """
+    compression = detect(source)
+    if compression is None:
+        yield source
+        return
+    with open_reader(source, compression) as f:
+        yield f
+
+
+def open_writer(path, compression, compresslevel=None):
+    """
+    Opens a path for writing compressed xml text, encoded as UTF-8.
+
+    __Args__
+
+    1. path (str): the path
+    2. compression (str): 'gz', 'xz' or 'bz2'
+
+    __KWArgs__
+
+    * compresslevel (int): 0-9 for xz, 1-9 for gz and bz2. Defaults to the
+    codec's own default, 9 for gz and bz2 and 6 for xz.
+
+    __Returns__
+
+    * (file object): a text stream
+    """
+    codec = _codec(compression)
+    if compression == 'xz':
+        return codec.open(path, 'wt', preset=compresslevel, encoding='utf-8')
+    if compresslevel is None:
+        compresslevel = 9
+    return codec.open(path, 'wt', compresslevel=compresslevel, encoding='utf-8')
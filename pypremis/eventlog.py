@@ -0,0 +1,296 @@
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from pypremis.factories import XMLNodeFactory
+from pypremis.journal import EventJournal, journal_path
+from pypremis.lib import PremisRecord, DuplicateIdentifierError
+
+
+"""
+### Buffered, thread safe event logging ###
+
+1. **EventLogger** accepts Event nodes for any number of records from any
+number of threads, and applies them in batches from a single writer thread,
+so producers never wait on record updates or disk I/O.
+"""
+
+
+class _Flush(object):
+    # A marker put on the queue by .flush(), set once everything queued
+    # before it has been applied
+    def __init__(self):
+        self.done = threading.Event()
+
+
+_STOP = object()
+
+# The most records given as paths whose events are kept in memory for
+# spotting duplicates
+SEEN_JOURNALS = 32
+
+
+def _file_state(path):
+    # Changes whenever the file is written to, compacted or replaced
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class EventLogger(object):
+    """
+    A multi-producer event logger.
+
+    Events are queued by .log() and grouped per record by a writer thread,
+    which applies them once batch_size events are pending or flush_interval
+    seconds have passed since the oldest pending event was queued.
+
+    Records can be given as PremisRecords, which the events are added to, or
+    as paths to premis xml files, whose journals (see pypremis.journal) the
+    events are appended to. With journal=True events added to PremisRecords
+    which were read from a file are also appended to that file's journal.
+
+    Events with an identifier the record (or, for paths, the file or its
+    journal) already has are skipped if they're identical, and reported as
+    errors otherwise. Errors, including events which couldn't be applied
+    because reading or writing the record failed, are collected in .errors
+    as (record, event, exception) tuples and passed to on_error if it was
+    given; they never stop the writer thread. Events are only counted as
+    applied, and only added to PremisRecords, once their journal has been
+    written, so the events of a failed write can be logged again.
+
+    Only the writer thread modifies records, so while a logger is running
+    other threads shouldn't add events to the same records directly.
+    """
+    def __init__(self, batch_size=1000, flush_interval=1.0, journal=False,
+                 fsync=True, maxsize=0, on_error=None):
+        """
+        __KWArgs__
+
+        * batch_size (int): the number of pending events that triggers a flush
+        * flush_interval (float): the longest time in seconds an event waits
+        before it's applied
+        * journal (bool): also append events added to PremisRecords to the
+        journal of the file they were read from
+        * fsync (bool): fsync journals after every batch
+        * maxsize (int): the most events that may be queued before .log()
+        blocks. 0, the default, means never block.
+        * on_error (callable): called as on_error(record, event, exception)
+        from the writer thread when an event can't be applied
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.journal = journal
+        self.fsync = fsync
+        self.on_error = on_error
+        self.errors = []
+        self.applied = 0
+        self.skipped = 0
+        self._queue = queue.Queue(maxsize)
+        # The events of records given as paths, whose contents aren't
+        # loaded, as path: ((file state, journal state), {identifier key:
+        # event}). Reread when the file or its journal changes from outside
+        # the logger, and limited to the SEEN_JOURNALS most recently used.
+        self._seen = OrderedDict()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='pypremis-EventLogger',
+                                        daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def log(self, record, event):
+        """
+        Queue an event.
+
+        __Args__
+
+        1. record (PremisRecord or str): the record to add the event to, or
+        the path of a premis xml file to journal it for
+        2. event (Event): the Event PremisNode
+        """
+        if self._closed:
+            raise ValueError("The EventLogger has been closed.")
+        self._queue.put((record, event))
+
+    def flush(self, timeout=None):
+        """
+        Block until every event queued so far has been applied.
+
+        __KWArgs__
+
+        * timeout (float): the longest time to wait, in seconds
+
+        __Returns__
+
+        * (bool): False if the timeout expired first
+        """
+        if self._closed:
+            raise ValueError("The EventLogger has been closed.")
+        marker = _Flush()
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def close(self):
+        """
+        Apply any pending events and stop the writer thread.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        pending = {}
+        count = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is None or item is _STOP or isinstance(item, _Flush):
+                self._apply(pending)
+                pending = {}
+                count = 0
+                deadline = None
+                if item is _STOP:
+                    return
+                if item is not None:
+                    item.done.set()
+                continue
+            record, event = item
+            # Keyed by identity, PremisRecords compare by content
+            key = record if isinstance(record, str) else id(record)
+            if key not in pending:
+                pending[key] = (record, [])
+            pending[key][1].append(event)
+            count += 1
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            if count >= self.batch_size:
+                self._apply(pending)
+                pending = {}
+                count = 0
+                deadline = None
+
+    def _error(self, record, event, exception):
+        self.errors.append((record, event, exception))
+        if self.on_error is not None:
+            try:
+                self.on_error(record, event, exception)
+            except Exception:
+                pass
+
+    def _apply(self, pending):
+        for record, events in pending.values():
+            try:
+                if isinstance(record, PremisRecord):
+                    self._apply_record(record, events)
+                else:
+                    self._apply_path(record, events)
+            except Exception as e:
+                # Eg a lazy record whose file can no longer be read
+                for event in events:
+                    self._error(record, event, e)
+
+    def _batch(self, record, events, existing):
+        # Returns the events to write as an OrderedDict by identifier key, and
+        # the number of identical repeats. existing(key) returns the event the
+        # record already has with an identifier, or None.
+        batch = OrderedDict()
+        skipped = 0
+        for event in events:
+            try:
+                key = repr(event.get_eventIdentifier())
+                other = batch.get(key)
+                if other is None:
+                    other = existing(key)
+            except Exception as e:
+                self._error(record, event, e)
+                continue
+            if other is None:
+                batch[key] = event
+            elif other == event:
+                skipped += 1
+            else:
+                self._error(record, event, DuplicateIdentifierError(key))
+        return batch, skipped
+
+    def _write(self, record, journal, batch):
+        # Appends a batch to a journal, reporting its events if that fails
+        try:
+            journal.append(list(batch.values()))
+        except Exception as e:
+            for event in batch.values():
+                self._error(record, event, e)
+            return False
+        return True
+
+    def _apply_record(self, record, events):
+        identifiers = record.events_list.identifiers
+        batch, skipped = self._batch(
+            record, events,
+            lambda key: record.get_event(key) if key in identifiers else None)
+        path = record.get_filepath()
+        if batch and self.journal and isinstance(path, str):
+            if not self._write(record, EventJournal(journal_path(path), fsync=self.fsync), batch):
+                return
+        for event in batch.values():
+            record.add_event(event)
+        self.applied += len(batch)
+        self.skipped += skipped
+
+    def _apply_path(self, path, events):
+        journal = EventJournal(journal_path(path), fsync=self.fsync)
+        try:
+            seen = self._seen_events(path, journal)
+        except Exception as e:
+            for event in events:
+                self._error(path, event, e)
+            return
+        batch, skipped = self._batch(path, events, seen.get)
+        if batch:
+            if not self._write(path, journal, batch):
+                return
+            seen = dict(seen)
+            seen.update(batch)
+            self._remember(path, (_file_state(path), _file_state(journal.path)), seen)
+        self.applied += len(batch)
+        self.skipped += skipped
+
+    def _remember(self, path, state, seen):
+        self._seen[path] = (state, seen)
+        self._seen.move_to_end(path)
+        while len(self._seen) > SEEN_JOURNALS:
+            self._seen.popitem(last=False)
+
+    def _seen_events(self, path, journal):
+        # The events in a record's file and its journal by identifier key,
+        # from the cache if neither has changed since the logger last read
+        # or wrote them
+        state = (_file_state(path), _file_state(journal.path))
+        cached = self._seen.get(path)
+        if cached is not None and cached[0] == state:
+            self._seen.move_to_end(path)
+            return cached[1]
+        seen = {}
+        if state[0] is not None:
+            # Streamed, only the events are built
+            for event in XMLNodeFactory(path).iter_events():
+                seen.setdefault(repr(event.get_eventIdentifier()), event)
+        if state[1] is not None:
+            for event in journal.read()[0]:
+                seen.setdefault(repr(event.get_eventIdentifier()), event)
+        self._remember(path, state, seen)
+        return seen
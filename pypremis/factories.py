@@ -1,6 +1,10 @@
+import threading
 import xml.etree.ElementTree as ET
 from abc import ABCMeta, abstractmethod
+from time import perf_counter
 
+from pypremis import instrument
+from pypremis.compression import reading
 from pypremis.nodes import *
 
 """
@@ -8,10 +12,51 @@ from pypremis.nodes import *
 
 1. **XMLNodeFactory** is a class implementing .find_objects(), .find_events(),
 .find_rights(), and .find_agents() meant to build PremisNode instances from
-valid premis XML records
+valid premis XML records. The .iter_*() variants stream the document rather
+than parsing it up front.
 """
 
 
+# The tags of top level PREMIS entities, mapped to their node names
+ENTITY_TAGS = {
+    '{http://www.loc.gov/premis/v3}object': 'object',
+    '{http://www.loc.gov/premis/v3}event': 'event',
+    '{http://www.loc.gov/premis/v3}agent': 'agent',
+    '{http://www.loc.gov/premis/v3}rights': 'rights',
+}
+
+# Node names mapped to the name of their PremisNode class and build* method
+ENTITY_CLASSES = {
+    'object': 'Object',
+    'event': 'Event',
+    'agent': 'Agent',
+    'rights': 'Rights',
+}
+
+
+def build_extension_fields(result, children):
+    """
+    Adds elements to an ExtensionNode or ExtendedNode as fields keyed by
+    their tags. Elements with children of their own become nested
+    ExtensionNodes, the rest are added as their text.
+
+    __Args__
+
+    1. result (ExtensionNode or ExtendedNode): the node to add fields to
+    2. children (iterable): ET.Elements
+
+    __Returns__
+
+    * (ExtensionNode or ExtendedNode): result
+    """
+    for child in children:
+        if len(child) == 0:
+            result.add_to_field(child.tag, child.text)
+        else:
+            result.add_to_field(child.tag, build_extension_fields(ExtensionNode(), child))
+    return result
+
+
 class XMLNodeFactory(object):
     """
     A class for ingesting an xml document and building PremisNodes out of it.
@@ -19,21 +64,54 @@ class XMLNodeFactory(object):
     __Attributes__
 
     1. xml: an ElementTree xml Element object meant to act as the root to attach
-    objects too from the xml.
+    objects too from the xml. The document is parsed the first time this is
+    accessed; the iter_* methods stream the document instead and never need it.
     """
-    def __init__(self, xmlfile):
+    def __init__(self, xmlfile, opaque_extensions=False):
         """
         Initializes an XML node factory and points it to a PREMIS xml file
         to be used to build PremisNode instances.
 
         __Args__
 
-        1. xmlfile: the path to a PREMIS xml serialization on disk
+        1. xmlfile: the path to a PREMIS xml serialization on disk, or a file
+        object. File objects can only be read once, so use either .xml and the
+        find_* methods, or a single pass of one of the iter_* methods. Files
+        compressed with gzip, xz or bzip2 are decompressed as they're read,
+        see pypremis.compression
+
+        __KWArgs__
+
+        * opaque_extensions (bool): keep the contents of extension nodes
+        (eg objectCharacteristicsExtension) as the source elements, only
+        building them into ExtensionNodes if their fields are accessed. See
+        ExtendedNode.set_payload()
         """
-        ET.register_namespace('premis', "http://www.loc.gov/premis/v3")
-        ET.register_namespace('xsi', "http://www.w3.org/2001/XMLSchema-instance")
-        tree = ET.parse(xmlfile)
-        self.xml = tree.getroot()
+        self.xmlfile = xmlfile
+        self.opaque_extensions = opaque_extensions
+        self._xml = None
+        # Guards parsing .xml. The build* methods only read the elements
+        # they're given, so a factory can build from several threads at once,
+        # as lazily loaded records do.
+        self._lock = threading.Lock()
+
+    @property
+    def xml(self):
+        if self._xml is None:
+            with self._lock:
+                if self._xml is None:
+                    self._xml = self._parse()
+        return self._xml
+
+    def _parse(self):
+        with reading(self.xmlfile) as source:
+            if instrument.ENABLED:
+                with instrument.timed('parse', 'document'):
+                    tree = ET.parse(source)
+                instrument.count('elements_visited', 'document', sum(1 for _ in tree.iter()))
+            else:
+                tree = ET.parse(source)
+        return tree.getroot()
 
     def _find_all(self, node, tag, req=False):
         """
@@ -175,6 +253,192 @@ class XMLNodeFactory(object):
         """
         return self._process_nodes(func, node, tag, req)
 
+    def _build_entity(self, builder, node, name):
+        """
+        Calls builder(node), timing it if instrumentation is enabled.
+
+        __Args__
+
+        1. builder (func): one of the build* methods
+        2. node (ET.Element): the element to build from
+        3. name (str): the node name to file the timing under
+        """
+        if not instrument.ENABLED:
+            return builder(node)
+        start = perf_counter()
+        result = builder(node)
+        instrument.add_time('build', name, perf_counter() - start)
+        return result
+
+    def iter_elements(self):
+        """
+        Yields the top level entity elements of the record in document order,
+        without building anything from them.
+
+        Unless .xml has already been parsed the document is streamed, and each
+        top level element is detached from the root once it has been yielded,
+        so only the elements the caller holds on to stay in memory.
+
+        __Returns__
+
+        * (generator): (name, ET.Element) tuples, where name is one of
+        'object', 'event', 'agent' or 'rights'
+        """
+        if self._xml is not None:
+            for element in self._xml:
+                name = ENTITY_TAGS.get(element.tag)
+                if name is not None:
+                    yield name, element
+            return
+        if instrument.ENABLED:
+            yield from self._iterparse_timed()
+            return
+        depth = 0
+        root = None
+        with reading(self.xmlfile) as source:
+            for event, element in ET.iterparse(source, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    if root is None:
+                        root = element
+                    continue
+                depth -= 1
+                if depth == 1:
+                    name = ENTITY_TAGS.get(element.tag)
+                    if name is not None:
+                        yield name, element
+                    del root[:]
+
+    def _iterparse_timed(self):
+        # iter_elements() with the time spent parsing (but not in the caller)
+        # and the number of elements seen recorded.
+        depth = 0
+        root = None
+        visited = 0
+        elapsed = 0.0
+        start = perf_counter()
+        try:
+            with reading(self.xmlfile) as source:
+                for event, element in ET.iterparse(source, events=('start', 'end')):
+                    if event == 'start':
+                        depth += 1
+                        visited += 1
+                        if root is None:
+                            root = element
+                        continue
+                    depth -= 1
+                    if depth == 1:
+                        name = ENTITY_TAGS.get(element.tag)
+                        if name is not None:
+                            elapsed += perf_counter() - start
+                            yield name, element
+                            start = perf_counter()
+                        del root[:]
+            elapsed += perf_counter() - start
+        finally:
+            instrument.add_time('parse', 'document', elapsed)
+            instrument.count('elements_visited', 'document', visited)
+
+    def iter_entities(self):
+        """
+        Builds the top level entities of the record one at a time, in
+        document order.
+
+        __Returns__
+
+        * (generator): (name, PremisNode) tuples, where name is one of
+        'object', 'event', 'agent' or 'rights'
+        """
+        for name, element in self.iter_elements():
+            yield name, self.buildEntity(name, element)
+
+    def _iter_entities(self, wanted):
+        for name, element in self.iter_elements():
+            if name == wanted:
+                yield self.buildEntity(name, element)
+
+    def iter_objects(self):
+        """
+        A generator variant of .find_objects()
+
+        __Returns__
+
+        * (generator): built PremisNode.Objects
+        """
+        return self._iter_entities('object')
+
+    def iter_agents(self):
+        """
+        A generator variant of .find_agents()
+
+        __Returns__
+
+        * (generator): built PremisNode.Agents
+        """
+        return self._iter_entities('agent')
+
+    def iter_events(self):
+        """
+        A generator variant of .find_events()
+
+        __Returns__
+
+        * (generator): built PremisNode.Events
+        """
+        return self._iter_entities('event')
+
+    def iter_rights(self):
+        """
+        A generator variant of .find_rights()
+
+        __Returns__
+
+        * (generator): built PremisNode.Rights
+        """
+        return self._iter_entities('rights')
+
+    def buildEntity(self, name, node):
+        """
+        Builds a top level PremisNode from its element.
+
+        __Args__
+
+        1. name (str): 'object', 'event', 'agent' or 'rights'
+        2. node (ET.Element): the element to build from
+
+        __Returns__
+
+        * (PremisNode): the built node
+        """
+        builder = getattr(self, 'build' + ENTITY_CLASSES[name])
+        return self._build_entity(builder, node, name)
+
+    def buildIdentifiers(self, name, node):
+        """
+        Builds only the identifier subnodes of a top level element, which is
+        all a NodeSet needs to index an entity that hasn't been built yet.
+
+        __Args__
+
+        1. name (str): 'object', 'event', 'agent' or 'rights'
+        2. node (ET.Element): the top level element
+
+        __Returns__
+
+        * (list): ObjectIdentifier, EventIdentifier, AgentIdentifier or
+        RightsStatementIdentifier PremisNodes
+        """
+        if name == 'object':
+            return self._pn(self.buildObjectIdentifier, node, '{http://www.loc.gov/premis/v3}objectIdentifier', req=True)
+        if name == 'event':
+            return [self.buildEventIdentifier(self._find_node(node, '{http://www.loc.gov/premis/v3}eventIdentifier', req=True))]
+        if name == 'agent':
+            return self._pn(self.buildAgentIdentifier, node, '{http://www.loc.gov/premis/v3}agentIdentifier', req=True)
+        if name == 'rights':
+            return [self.buildRightsStatementIdentifier(self._find_node(x, '{http://www.loc.gov/premis/v3}rightsStatementIdentifier', req=True))
+                    for x in self._find_all_nodes(node, '{http://www.loc.gov/premis/v3}rightsStatement')]
+        raise ValueError("Unknown entity: {}".format(name))
+
     def find_objects(self):
         """
         finds all of the objects in an xml record and builds Object PremisNodes
@@ -184,7 +448,7 @@ class XMLNodeFactory(object):
 
         * (list): a list of built PremisNode.Objects
         """
-        return [self.buildObject(x) for x in self._find_all_nodes(self.xml, '{http://www.loc.gov/premis/v3}object')]
+        return [self._build_entity(self.buildObject, x, 'object') for x in self._find_all_nodes(self.xml, '{http://www.loc.gov/premis/v3}object')]
 
     def find_agents(self):
         """
@@ -195,7 +459,7 @@ class XMLNodeFactory(object):
 
         * (list): a list of built PremisNode.Agents
         """
-        return [self.buildAgent(x) for x in self._find_all_nodes(self.xml, '{http://www.loc.gov/premis/v3}agent')]
+        return [self._build_entity(self.buildAgent, x, 'agent') for x in self._find_all_nodes(self.xml, '{http://www.loc.gov/premis/v3}agent')]
 
     def find_events(self):
         """
@@ -206,7 +470,7 @@ class XMLNodeFactory(object):
 
         * (list): a list of built PremisNode.Events
         """
-        return [self.buildEvent(x) for x in self._find_all_nodes(self.xml, '{http://www.loc.gov/premis/v3}event')]
+        return [self._build_entity(self.buildEvent, x, 'event') for x in self._find_all_nodes(self.xml, '{http://www.loc.gov/premis/v3}event')]
 
     def find_rights(self):
         """
@@ -217,7 +481,7 @@ class XMLNodeFactory(object):
 
         * (list): a list of built PremisNode.Rights...'s?
         """
-        return [self.buildRights(x) for x in self._find_all_nodes(self.xml, '{http://www.loc.gov/premis/v3}rights')]
+        return [self._build_entity(self.buildRights, x, 'rights') for x in self._find_all_nodes(self.xml, '{http://www.loc.gov/premis/v3}rights')]
 
     def buildExtensionNode(self, node):
         """
@@ -232,13 +496,7 @@ class XMLNodeFactory(object):
 
         * (ExtensionNode): the built ExtensionNode
         """
-        result = ExtensionNode()
-        for child in node:
-            if len(child) == 0:
-                result.add_to_field(child.tag, child.text)
-            else:
-                result.add_to_field(child.tag, self.buildExtensionNode(child))
-        return result
+        return build_extension_fields(ExtensionNode(), node)
 
     def buildExtendedNode(self, extendedNode, node):
         """
@@ -255,12 +513,14 @@ class XMLNodeFactory(object):
         * (ExtendedNode): the built ExtendedNode
         """
         result = extendedNode()
-        for child in node:
-            if len(child) == 0:
-                result.add_to_field(child.tag, child.text)
-            else:
-                result.add_to_field(child.tag, self.buildExtensionNode(child))
-        return result
+        if self.opaque_extensions:
+            payload = list(node)
+            for child in payload:
+                # Don't carry the whitespace between siblings along
+                child.tail = None
+            result.set_payload(payload)
+            return result
+        return build_extension_fields(result, node)
 
     # From here on out each of these functions takes one ElementTree Element
     # instance as an arg. It runs different searches and functions over
@@ -0,0 +1,664 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from pypremis.lib import PremisRecord
+from pypremis.nodes import *
+
+
+"""
+### Fixity verification for content described by PREMIS records ###
+
+1. **FixityVerifier** re-hashes the files described by Object nodes, compares
+the results with the recorded Fixity nodes and writes "fixity check" Event
+nodes describing the outcome back into the records.
+2. **FixityResult** holds the outcome of checking a single Object.
+3. **FixityCache** remembers the digests of files keyed on their stat
+information so unchanged files don't need to be read again.
+"""
+
+
+# PREMIS messageDigestAlgorithm values are free text, this maps the spellings
+# we see in the wild onto hashlib constructor names.
+ALGORITHMS = {
+    'md5': 'md5',
+    'sha1': 'sha1',
+    'sha-1': 'sha1',
+    'sha224': 'sha224',
+    'sha-224': 'sha224',
+    'sha256': 'sha256',
+    'sha-256': 'sha256',
+    'sha384': 'sha384',
+    'sha-384': 'sha384',
+    'sha512': 'sha512',
+    'sha-512': 'sha512',
+    'sha3-256': 'sha3_256',
+    'sha3-512': 'sha3_512',
+    'blake2b': 'blake2b',
+    'blake2s': 'blake2s'
+}
+
+SUCCESS = 'success'
+FAILURE = 'failure'
+MISSING = 'missing'
+UNVERIFIABLE = 'unverifiable'
+
+
+def normalize_algorithm(algorithm):
+    """
+    Translate a messageDigestAlgorithm value into a hashlib algorithm name.
+
+    __Args__
+
+    1. algorithm (str): the messageDigestAlgorithm value, eg "SHA-256"
+
+    __Returns__
+
+    * (str or None): the hashlib name, or None if the algorithm is unsupported
+    """
+    key = algorithm.strip().lower()
+    if key in ALGORITHMS:
+        return ALGORITHMS[key]
+    if key in hashlib.algorithms_available:
+        return key
+    key = key.replace('-', '_')
+    if key in hashlib.algorithms_available:
+        return key
+    return None
+
+
+def hash_file(path, algorithms, blocksize=1024*1024):
+    """
+    Computes one or more digests of a file in a single read pass.
+
+    __Args__
+
+    1. path (str): the location of the file on disk
+    2. algorithms (iterable): hashlib algorithm names
+
+    __KWArgs__
+
+    * blocksize (int): the number of bytes to read at a time
+
+    __Returns__
+
+    * (dict): hashlib algorithm names mapped to hex digests
+    """
+    hashers = {x: hashlib.new(x) for x in algorithms}
+    with open(path, 'rb') as f:
+        data = f.read(blocksize)
+        while data:
+            for hasher in hashers.values():
+                hasher.update(data)
+            data = f.read(blocksize)
+    return {x: hashers[x].hexdigest() for x in hashers}
+
+
+def _hash_job(path, algorithms, blocksize):
+    # Runs in the worker pool, so it has to be a module level function
+    # (picklable) and can't raise anything the parent can't unpickle.
+    try:
+        return hash_file(path, algorithms, blocksize), None
+    except OSError as e:
+        return None, str(e)
+
+
+def _optional(getter, *args):
+    # Node getters raise a KeyError for fields which were never set
+    try:
+        return getter(*args)
+    except KeyError:
+        return None
+
+
+def get_fixities(obj):
+    """
+    Collect every Fixity node recorded for an Object node.
+
+    __Args__
+
+    1. obj (Object): an Object PremisNode instance
+
+    __Returns__
+
+    * (list): the Fixity PremisNode instances
+    """
+    result = []
+    for characteristics in _optional(obj.get_objectCharacteristics) or []:
+        result.extend(_optional(characteristics.get_fixity) or [])
+    return result
+
+
+def get_content_paths(obj, root=None):
+    """
+    Lists the candidate file paths recorded in an Object node's storage
+    contentLocations.
+
+    __Args__
+
+    1. obj (Object): an Object PremisNode instance
+
+    __KWArgs__
+
+    * root (str): if supplied relative contentLocationValues are resolved
+    against this directory
+
+    __Returns__
+
+    * (list): a list of path strings
+    """
+    result = []
+    for storage in _optional(obj.get_storage) or []:
+        location = _optional(storage.get_contentLocation)
+        if location is None:
+            continue
+        value = location.get_contentLocationValue()
+        if value.startswith('file://'):
+            value = value[len('file://'):]
+        if root is not None and not os.path.isabs(value):
+            value = os.path.join(root, value)
+        result.append(value)
+    return result
+
+
+def resolve_path(obj, root=None):
+    """
+    Returns the first contentLocation of an Object node which exists on disk
+    as a regular file, or None.
+    """
+    for path in get_content_paths(obj, root=root):
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+class FixityResult(object):
+    """
+    The outcome of checking the fixity of a single Object node.
+
+    __Attributes__
+
+    1. obj: the Object PremisNode instance that was checked
+    2. path: the resolved path on disk, or None
+    3. outcome: one of SUCCESS, FAILURE, MISSING or UNVERIFIABLE
+    4. expected: a dict of hashlib names to the digests recorded in the node
+    5. actual: a dict of hashlib names to the digests computed from disk
+    6. note: a human readable explanation of the outcome
+    7. cached: True if the actual digests came from a FixityCache rather
+    than from reading the file
+    """
+    def __init__(self, obj, path, outcome, expected=None, actual=None, note=None):
+        self.cached = False
+        self.obj = obj
+        self.path = path
+        self.outcome = outcome
+        self.expected = expected or {}
+        self.actual = actual or {}
+        self.note = note
+
+    def __repr__(self):
+        return "<FixityResult {} {}>".format(self.outcome, self.path)
+
+
+class FixityCache(object):
+    """
+    A persistent cache of file digests backed by SQLite.
+
+    Entries are keyed on (st_dev, st_ino, algorithm) and remember the size
+    and mtime_ns the file had when it was hashed. A cached digest is only
+    reused if the file's current size and mtime_ns still match, and (if
+    max_age_days is set) it was computed recently enough. Otherwise the file
+    has to be hashed again, which refreshes the entry.
+
+    A single cache may be shared between threads.
+    """
+    def __init__(self, path=':memory:', max_age_days=None, commit_every=1000):
+        """
+        __KWArgs__
+
+        * path (str): the location of the sqlite database. Defaults to an
+        in memory database.
+        * max_age_days (int or float): force a full re-hash of any file that
+        hasn't been hashed in this many days
+        * commit_every (int): the number of stored digests to batch per transaction
+        """
+        self.path = path
+        self.max_age_days = max_age_days
+        self.commit_every = commit_every
+        self._uncommitted = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fixity ("
+            "dev INTEGER NOT NULL, ino INTEGER NOT NULL, algorithm TEXT NOT NULL, "
+            "size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+            "digest TEXT NOT NULL, verified REAL NOT NULL, "
+            "PRIMARY KEY (dev, ino, algorithm))"
+        )
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def stat_key(path):
+        """
+        Stat a file and return the tuple the cache is keyed on.
+
+        __Returns__
+
+        * (tuple): (st_dev, st_ino, st_size, st_mtime_ns)
+        """
+        st = os.stat(path)
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def get(self, key, algorithm):
+        """
+        Return the cached digest for a stat key and hashlib algorithm name, or
+        None if there isn't a fresh one.
+        """
+        dev, ino, size, mtime_ns = key
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, digest, verified FROM fixity "
+                "WHERE dev = ? AND ino = ? AND algorithm = ?",
+                (dev, ino, algorithm)
+            ).fetchone()
+        if row is None or row[0] != size or row[1] != mtime_ns:
+            return None
+        if self.max_age_days is not None and \
+                time.time() - row[3] > self.max_age_days * 86400:
+            return None
+        return row[2]
+
+    def put(self, key, algorithm, digest, verified=None):
+        """
+        Remember the digest of a file with the given stat key.
+        """
+        dev, ino, size, mtime_ns = key
+        if verified is None:
+            verified = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fixity VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (dev, ino, algorithm, size, mtime_ns, digest, verified)
+            )
+            self._uncommitted += 1
+            if self._uncommitted >= self.commit_every:
+                self._conn.commit()
+                self._uncommitted = 0
+
+    def lookup(self, path, algorithms):
+        """
+        Stat a file and return whatever fresh digests are cached for it.
+
+        __Args__
+
+        1. path (str): the file's location on disk
+        2. algorithms (iterable): hashlib algorithm names
+
+        __Returns__
+
+        * (tuple): (stat key, dict of algorithm names to cached digests)
+        """
+        key = self.stat_key(path)
+        cached = {}
+        for algorithm in algorithms:
+            digest = self.get(key, algorithm)
+            if digest is not None:
+                cached[algorithm] = digest
+        return key, cached
+
+    def store(self, path, key, digests):
+        """
+        Remember freshly computed digests for a file. If the file's stat
+        information changed since key was taken (ie, it was modified while
+        being hashed) nothing is stored.
+
+        __Args__
+
+        1. path (str): the file's location on disk
+        2. key (tuple or None): the stat key taken before hashing
+        3. digests (dict): hashlib algorithm names mapped to digests
+        """
+        try:
+            current = self.stat_key(path)
+        except OSError:
+            return
+        if key is not None and current != key:
+            return
+        for algorithm in digests:
+            self.put(current, algorithm, digests[algorithm])
+
+    def digest(self, path, algorithm, blocksize=1024*1024):
+        """
+        Return the digest of a file, only reading it if the cache doesn't
+        already have a fresh digest for it.
+
+        __Args__
+
+        1. path (str): the file's location on disk
+        2. algorithm (str): a messageDigestAlgorithm or hashlib name
+
+        __Returns__
+
+        * (str): the hex digest
+        """
+        name = normalize_algorithm(algorithm)
+        if name is None:
+            raise ValueError("Unsupported digest algorithm: {}".format(algorithm))
+        key, cached = self.lookup(path, [name])
+        if name in cached:
+            return cached[name]
+        digests = hash_file(path, [name], blocksize)
+        self.store(path, key, digests)
+        return digests[name]
+
+    def fixity(self, path, algorithm='SHA-256', messageDigestOriginator=None):
+        """
+        Build a Fixity node for a file, using the cache where possible.
+
+        __Args__
+
+        1. path (str): the file's location on disk
+
+        __KWArgs__
+
+        * algorithm (str): the messageDigestAlgorithm to record
+        * messageDigestOriginator (str): the messageDigestOriginator to record
+
+        __Returns__
+
+        * (Fixity): the Fixity PremisNode instance
+        """
+        return Fixity(algorithm, self.digest(path, algorithm), messageDigestOriginator)
+
+    def commit(self):
+        """
+        Flush any batched writes to the database.
+        """
+        with self._lock:
+            self._conn.commit()
+            self._uncommitted = 0
+
+    def close(self):
+        """
+        Commit and close the underlying database connection.
+        """
+        self.commit()
+        self._conn.close()
+
+
+class FixityVerifier(object):
+    """
+    Re-hashes the content described by the Object nodes in PremisRecords and
+    records the outcomes as "fixity check" Events.
+
+    Hashing is done in a thread pool by default, which is usually what you want
+    since hashlib releases the GIL while digesting. Pass use_processes=True to
+    hash in a process pool instead.
+    """
+    def __init__(self, linkingAgentIdentifier=None, root=None, workers=4,
+                 use_processes=False, eventIdentifierType='uuid',
+                 eventType='fixity check', link_objects=False,
+                 blocksize=1024*1024, cache=None):
+        """
+        __KWArgs__
+
+        * linkingAgentIdentifier (LinkingAgentIdentifier or list): attached
+        to every Event produced
+        * root (str): a directory to resolve relative contentLocationValues against
+        * workers (int): the number of files to hash concurrently
+        * use_processes (bool): hash in a process pool rather than a thread pool
+        * eventIdentifierType (str): the eventIdentifierType of produced Events
+        * eventType (str): the eventType of produced Events
+        * link_objects (bool): also add a LinkingEventIdentifier pointing at
+        the new Event to each checked Object
+        * blocksize (int): the number of bytes to read at a time while hashing
+        * cache (FixityCache): if supplied, files whose stat information is
+        unchanged since they were last hashed are not hashed again
+        """
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.linkingAgentIdentifier = linkingAgentIdentifier
+        self.root = root
+        self.workers = workers
+        self.use_processes = use_processes
+        self.eventIdentifierType = eventIdentifierType
+        self.eventType = eventType
+        self.link_objects = link_objects
+        self.blocksize = blocksize
+        self.cache = cache
+
+    def _plan(self, obj):
+        """
+        Work out what needs hashing for an Object node.
+
+        __Returns__
+
+        * (tuple): (path, expected digests, FixityResult or None, stat key or
+        None). If the result is not None the object doesn't need to be hashed,
+        either because it can't be or because the cache already answered.
+        """
+        expected = {}
+        for fixity in get_fixities(obj):
+            algorithm = normalize_algorithm(fixity.get_messageDigestAlgorithm())
+            if algorithm is not None:
+                expected[algorithm] = fixity.get_messageDigest().strip().lower()
+        if not expected:
+            return None, expected, FixityResult(
+                obj, None, UNVERIFIABLE,
+                note="No fixity values with a supported algorithm recorded."
+            ), None
+        path = resolve_path(obj, root=self.root)
+        if path is None:
+            return None, expected, FixityResult(
+                obj, None, MISSING, expected=expected,
+                note="No contentLocation could be resolved to a file."
+            ), None
+        if self.cache is None:
+            return path, expected, None, None
+        try:
+            key, cached = self.cache.lookup(path, expected)
+        except OSError as e:
+            return path, expected, FixityResult(obj, path, MISSING, expected=expected,
+                                                note=str(e)), None
+        if len(cached) == len(expected):
+            result = self._compare(obj, path, expected, cached, None)
+            result.cached = True
+            return path, expected, result, key
+        return path, expected, None, key
+
+    def _compare(self, obj, path, expected, actual, error):
+        if error is not None:
+            return FixityResult(obj, path, MISSING, expected=expected, note=error)
+        mismatched = sorted(x for x in expected if expected[x] != actual[x])
+        if mismatched:
+            return FixityResult(obj, path, FAILURE, expected=expected, actual=actual,
+                                note="Digest mismatch: {}".format(", ".join(mismatched)))
+        return FixityResult(obj, path, SUCCESS, expected=expected, actual=actual)
+
+    def check_object(self, obj):
+        """
+        Check a single Object node in the calling thread.
+
+        __Args__
+
+        1. obj (Object): an Object PremisNode instance
+
+        __Returns__
+
+        * (FixityResult): the outcome
+        """
+        path, expected, result, key = self._plan(obj)
+        if result is not None:
+            return result
+        return self._finish((obj, path, expected, _hash_job(path, sorted(expected), self.blocksize), key))
+
+    def iter_results(self, objects):
+        """
+        Check an iterable of Object nodes, hashing up to self.workers files
+        concurrently. Only a bounded number of objects are pulled from the
+        iterable ahead of the results being consumed.
+
+        __Args__
+
+        1. objects (iterable): Object PremisNode instances
+
+        __Returns__
+
+        * (generator): FixityResults, in the same order as the input
+        """
+        executor_cls = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+        pending = deque()
+        with executor_cls(max_workers=self.workers) as executor:
+            for obj in objects:
+                path, expected, result, key = self._plan(obj)
+                if result is None:
+                    future = executor.submit(_hash_job, path, sorted(expected), self.blocksize)
+                    pending.append((obj, path, expected, future, key))
+                else:
+                    pending.append((obj, path, expected, result, key))
+                while len(pending) > self.workers * 2:
+                    yield self._finish(pending.popleft())
+            while pending:
+                yield self._finish(pending.popleft())
+        if self.cache is not None:
+            self.cache.commit()
+
+    def _finish(self, entry):
+        obj, path, expected, future, key = entry
+        if isinstance(future, FixityResult):
+            return future
+        if isinstance(future, tuple):
+            actual, error = future
+        else:
+            actual, error = future.result()
+        if actual is not None and self.cache is not None:
+            self.cache.store(path, key, actual)
+        return self._compare(obj, path, expected, actual, error)
+
+    def build_event(self, result):
+        """
+        Build a "fixity check" Event node describing a FixityResult.
+
+        __Args__
+
+        1. result (FixityResult): the outcome to describe
+
+        __Returns__
+
+        * (Event): the new Event PremisNode instance
+        """
+        eventIdentifier = EventIdentifier(self.eventIdentifierType, uuid4().hex)
+        if result.note:
+            outcomeDetail = EventOutcomeDetail(eventOutcomeDetailNote=result.note)
+            outcome = EventOutcomeInformation(result.outcome, outcomeDetail)
+        else:
+            outcome = EventOutcomeInformation(result.outcome)
+        objectIdentifier = result.obj.get_objectIdentifier(0)
+        linkingObjectIdentifier = LinkingObjectIdentifier(
+            objectIdentifier.get_objectIdentifierType(),
+            objectIdentifier.get_objectIdentifierValue()
+        )
+        event = Event(eventIdentifier, self.eventType,
+                      datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                      eventOutcomeInformation=outcome,
+                      linkingObjectIdentifier=linkingObjectIdentifier)
+        if self.linkingAgentIdentifier is not None:
+            event.set_linkingAgentIdentifier(self.linkingAgentIdentifier)
+        if self.link_objects:
+            result.obj.add_linkingEventIdentifier(
+                LinkingEventIdentifier(eventIdentifier.get_eventIdentifierType(),
+                                       eventIdentifier.get_eventIdentifierValue())
+            )
+        return event
+
+    def verify_record(self, record, write=False):
+        """
+        Check every Object node in a PremisRecord and add the resulting
+        Events to it once all of its objects have been checked.
+
+        __Args__
+
+        1. record (PremisRecord or str): a record, or the path to one
+
+        __KWArgs__
+
+        * write (bool): write the record back to its filepath afterwards
+
+        __Returns__
+
+        * (list): the FixityResults
+        """
+        return self.verify_records([record], write=write)[0][1]
+
+    def iter_verify_records(self, records, write=False):
+        """
+        Check the objects of many records, streaming objects from every
+        record through the same worker pool. Events are added to each record
+        as a batch once all of its objects have been checked.
+
+        __Args__
+
+        1. records (iterable): PremisRecords, or paths to premis xml files
+
+        __KWArgs__
+
+        * write (bool): write each record back to its filepath once done
+
+        __Returns__
+
+        * (generator): (PremisRecord, list of FixityResults) tuples
+        """
+        # Records are loaded lazily as the pool asks for more objects, so
+        # only a handful of records are held in memory at once.
+        loaded = deque()
+
+        def objects():
+            for record in records:
+                if not isinstance(record, PremisRecord):
+                    record = PremisRecord(frompath=record)
+                object_list = record.get_object_list()
+                loaded.append((record, len(object_list)))
+                for obj in object_list:
+                    yield obj
+
+        results = []
+        for result in self.iter_results(objects()):
+            results.append(result)
+            # Objects are yielded in order, so the head of loaded is always
+            # the record the current result belongs to.
+            while loaded and len(results) >= loaded[0][1]:
+                record, count = loaded.popleft()
+                batch, results = results[:count], results[count:]
+                self._apply(record, batch, write)
+                yield record, batch
+        while loaded:
+            record, count = loaded.popleft()
+            batch, results = results[:count], results[count:]
+            self._apply(record, batch, write)
+            yield record, batch
+
+    def verify_records(self, records, write=False):
+        """
+        Like .iter_verify_records(), but returns a list.
+        """
+        return list(self.iter_verify_records(records, write=write))
+
+    def _apply(self, record, results, write):
+        for result in results:
+            record.add_event(self.build_event(result))
+        if write:
+            if record.get_filepath() is None:
+                raise ValueError("Can not write a record with no filepath.")
+            record.write_to_file(record.get_filepath())
@@ -0,0 +1,169 @@
+import threading
+from time import perf_counter
+
+
+"""
+### Opt-in instrumentation of pypremis' hot paths ###
+
+When enabled, pypremis records how long it spends in each phase of loading
+and saving records, broken down by node type, along with counts of the work
+done. Hook points in the library check the module level ENABLED flag before
+doing anything else, so the overhead while disabled is a single attribute
+lookup.
+
+Phases timed:
+
+1. **parse**: ET.parse() of a source file
+2. **build**: the factory build* method for each top level entity
+3. **index**: NodeSet.append(), including computing identifier keys
+4. **serialize**: the .toXML() of each top level entity, and ET.tostring()
+5. **write**: writing a serialized tree to disk
+
+Counters kept:
+
+1. **elements_visited**: elements in parsed source documents
+2. **nodes_built**: PremisNode instances created, by node name
+3. **identifiers_indexed**: identifier keys added to NodeSets
+4. **lookups**: NodeSet.get_nodes() calls
+5. **bytes_written**: bytes written by PremisRecord.write_to_file()
+
+Callbacks registered with enable() or add_callback() are called for every
+measurement as callback(kind, metric, name, value), where kind is 'time'
+(value in seconds) or 'count'. They're called synchronously from whatever
+thread did the work, so they should be cheap and thread safe.
+"""
+
+
+ENABLED = False
+
+_lock = threading.Lock()
+_callbacks = []
+_timings = {}
+_counts = {}
+
+
+def enable(callback=None):
+    """
+    Turn instrumentation on.
+
+    __KWArgs__
+
+    * callback (callable): registered with add_callback()
+    """
+    global ENABLED
+    if callback is not None:
+        add_callback(callback)
+    ENABLED = True
+
+
+def disable():
+    """
+    Turn instrumentation off. Collected statistics are kept until reset().
+    """
+    global ENABLED
+    ENABLED = False
+
+
+def is_enabled():
+    return ENABLED
+
+
+def add_callback(callback):
+    """
+    Register a callable to receive every measurement.
+    """
+    with _lock:
+        _callbacks.append(callback)
+
+
+def remove_callback(callback):
+    """
+    Unregister a callable previously passed to add_callback() or enable().
+    """
+    with _lock:
+        _callbacks.remove(callback)
+
+
+def reset():
+    """
+    Discard collected statistics and registered callbacks.
+    """
+    with _lock:
+        _timings.clear()
+        _counts.clear()
+        del _callbacks[:]
+
+
+def add_time(phase, name, seconds):
+    """
+    Record time spent in a phase.
+
+    __Args__
+
+    1. phase (str): eg 'build'
+    2. name (str): what the time was spent on, usually a node name
+    3. seconds (float): the elapsed time
+    """
+    with _lock:
+        entry = _timings.setdefault(phase, {}).setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+        callbacks = list(_callbacks)
+    for callback in callbacks:
+        callback('time', phase, name, seconds)
+
+
+def count(metric, name=None, n=1):
+    """
+    Increment a counter.
+
+    __Args__
+
+    1. metric (str): eg 'nodes_built'
+
+    __KWArgs__
+
+    * name (str): what was counted, usually a node name
+    * n (int): the amount to increment by
+    """
+    with _lock:
+        metric_counts = _counts.setdefault(metric, {})
+        metric_counts[name] = metric_counts.get(name, 0) + n
+        callbacks = list(_callbacks)
+    for callback in callbacks:
+        callback('count', metric, name, n)
+
+
+class timed(object):
+    """
+    A context manager which records the time spent in its block with
+    add_time(). Call sites should check ENABLED first, this doesn't.
+    """
+    def __init__(self, phase, name):
+        self.phase = phase
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        add_time(self.phase, self.name, perf_counter() - self.start)
+
+
+def stats():
+    """
+    Return a snapshot of the collected statistics.
+
+    __Returns__
+
+    * (dict): {'timings': {phase: {name: {'calls': int, 'seconds': float}}},
+    'counts': {metric: {name: int}}}
+    """
+    with _lock:
+        return {
+            'timings': {phase: {name: {'calls': v[0], 'seconds': v[1]}
+                                for name, v in names.items()}
+                        for phase, names in _timings.items()},
+            'counts': {metric: dict(names) for metric, names in _counts.items()}
+        }
@@ -0,0 +1,314 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where journals aren't locked
+    fcntl = None
+
+from pypremis.compression import for_target
+from pypremis.factories import XMLNodeFactory
+from pypremis.lib import PremisRecord, DuplicateIdentifierError
+
+
+"""
+### Append-only event journals for PREMIS records ###
+
+Writing an event into premis.xml means rewriting the whole file. A journal
+is a sidecar file next to the record (premis.xml.journal) which events are
+appended to instead, one JSON line per event, and which is folded back into
+the record later. While a journal is being appended to or compacted it's
+locked through a second sidecar file (premis.xml.journal.lock), which
+compact() removes along with the journal.
+
+1. **EventJournal** appends events to a journal and reads them back.
+2. **merge_journal()** adds the events in a journal to a PremisRecord,
+skipping events the record already has. PremisRecord calls this when it
+loads a record from a file with a journal.
+3. **compact()** folds a journal into its record's xml file atomically and
+removes it.
+"""
+
+
+class JournalError(ValueError):
+    """Raised when a journal contains an entry that can't be read"""
+
+
+ROOT = ('<premis:premis xmlns:premis="http://www.loc.gov/premis/v3" '
+        'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">')
+
+
+def journal_path(path):
+    """
+    Returns the location of the journal for the record at path.
+    """
+    return path + '.journal'
+
+
+def _fsync_directory(path):
+    # Makes renames and unlinks in a directory durable. Not possible (or
+    # needed) everywhere, eg on Windows.
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(path or '.', os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class EventJournal(object):
+    """
+    An append-only journal of Event nodes.
+
+    Every call to .append() writes its events as complete lines and, unless
+    fsync is False, waits for them to reach the disk before returning. A
+    crash part way through an append can only leave a partial last line,
+    which is skipped when the journal is read.
+    """
+    def __init__(self, path, fsync=True):
+        """
+        __Args__
+
+        1. path (str): the location of the journal file. Use journal_path()
+        to get the journal for a record.
+
+        __KWArgs__
+
+        * fsync (bool): fsync the journal after every append
+        """
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.fsync = fsync
+        self.skipped = 0
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    @contextmanager
+    def locked(self):
+        """
+        Holds an exclusive lock on the journal, across threads and processes,
+        for as long as the context lasts.
+
+        The lock is taken on the file at .lock_path rather than the journal,
+        which compact() replaces and removes while holding it. compact()
+        removes the lock file as well, so a lock that turns out to be on a
+        removed lock file once it's acquired is given up and taken again.
+        """
+        if fcntl is None:
+            yield
+            return
+        while True:
+            f = open(self.lock_path, 'a')
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    current = os.stat(self.lock_path)
+                except FileNotFoundError:
+                    current = None
+                locked = os.fstat(f.fileno())
+            except BaseException:
+                f.close()
+                raise
+            if current is not None and \
+                    (current.st_dev, current.st_ino) == (locked.st_dev, locked.st_ino):
+                break
+            # Closing the file releases the lock
+            f.close()
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            f.close()
+
+    def append(self, events):
+        """
+        Append events to the journal.
+
+        __Args__
+
+        1. events (Event or list): the Event PremisNodes to append
+        """
+        if not isinstance(events, list):
+            events = [events]
+        lines = []
+        for event in events:
+            xml = ET.tostring(event.toXML(), encoding='unicode')
+            lines.append(json.dumps({'type': 'event', 'xml': xml}) + '\n')
+        data = ''.join(lines).encode('utf-8')
+        with self.locked(), open(self.path, 'a+b') as f:
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    # The tail of an interrupted append, keep it on its own
+                    # line so it is skipped rather than corrupting this one
+                    data = b'\n' + data
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def read(self):
+        """
+        Read the events in the journal.
+
+        __Returns__
+
+        * (tuple): (a list of Event PremisNodes in the order they were
+        appended, the number of bytes of the journal that were read). Only
+        complete lines are read, a partial last line (an append still being
+        written, or an interrupted one) is left for the next read.
+        """
+        if not self.exists():
+            return [], 0
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        data = data[:data.rfind(b'\n') + 1]
+        self.skipped = 0
+        fragments = []
+        for line in data.split(b'\n'):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line.decode('utf-8'))
+            except ValueError:
+                # A partially written line from an interrupted append
+                self.skipped += 1
+                continue
+            if entry.get('type') != 'event':
+                raise JournalError("Unsupported journal entry in {}: {}".format(
+                    self.path, entry.get('type')))
+            fragments.append(entry['xml'])
+        if not fragments:
+            return [], len(data)
+        document = (ROOT + ''.join(fragments) + '</premis:premis>').encode('utf-8')
+        try:
+            events = list(XMLNodeFactory(io.BytesIO(document)).iter_events())
+        except (ET.ParseError, ValueError) as e:
+            raise JournalError("Invalid event in {}: {}".format(self.path, e))
+        return events, len(data)
+
+    def __iter__(self):
+        return iter(self.read()[0])
+
+    def remove(self):
+        """
+        Delete the journal file, if it exists.
+        """
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def merge_journal(record, journal):
+    """
+    Add the events in a journal to a record. Events whose identifier is
+    already in the record are skipped if they are identical to the event
+    already there, which happens when a compaction is interrupted after the
+    record was rewritten but before the journal was removed.
+
+    __Args__
+
+    1. record (PremisRecord): the record to add events to
+    2. journal (EventJournal): the journal to read
+
+    __Returns__
+
+    * (int): the number of bytes of the journal that were read
+    """
+    events, size = journal.read()
+    for event in events:
+        key = repr(event.get_eventIdentifier())
+        if key in record.events_list.identifiers:
+            if record.get_event(key) == event:
+                continue
+            raise DuplicateIdentifierError(
+                "{} has a different event with the identifier {}".format(journal.path, key))
+        record.add_event(event)
+    return size
+
+
+def compact(path, fsync=True):
+    """
+    Fold a record's journal into its xml file and remove the journal.
+
+    The record is written to a temporary file which is fsynced and renamed
+    over the original, so a crash at any point leaves either the old file
+    and the whole journal, or the new file (and possibly the journal, whose
+    events are then skipped as duplicates the next time it's merged).
+
+    Events appended to the journal while the compaction is running are kept
+    in the journal: the journal is locked (see EventJournal.locked()) while
+    what was appended after it was read is carried over, and the lock file is
+    removed before the lock is released. compact() shouldn't be run
+    concurrently from more than one process.
+
+    __Args__
+
+    1. path (str): the location of the record's xml file
+
+    __KWArgs__
+
+    * fsync (bool): fsync the new file and the directory
+
+    __Returns__
+
+    * (int): the number of events folded into the record
+    """
+    journal = EventJournal(journal_path(path), fsync=fsync)
+    if not journal.exists():
+        return 0
+    record = PremisRecord(frompath=path, preserve_source=True, journal=False)
+    before = len(record.events_list)
+    size = merge_journal(record, journal)
+    added = len(record.events_list) - before
+
+    directory = os.path.dirname(os.path.abspath(path))
+    if added:
+        handle, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        os.close(handle)
+        try:
+            # Compressed the way the record was, see aio.save()
+            record.write_to_file(tmp, compression=for_target(path))
+            if fsync:
+                with open(tmp, 'rb') as f:
+                    os.fsync(f.fileno())
+            shutil.copymode(path, tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        if fsync:
+            _fsync_directory(directory)
+
+    # Keep anything appended since the journal was read. Appends wait for
+    # the lock, so none can land in the file being replaced or removed.
+    with journal.locked():
+        with open(journal.path, 'rb') as f:
+            f.seek(size)
+            rest = f.read()
+        if rest:
+            handle, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(handle, 'wb') as f:
+                f.write(rest.lstrip(b'\n'))
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp, journal.path)
+        else:
+            journal.remove()
+        if fcntl is not None:
+            # Anyone waiting on it takes the lock again on a new lock file
+            os.remove(journal.lock_path)
+    if fsync:
+        _fsync_directory(directory)
+    return added
@@ -0,0 +1,306 @@
+import inspect
+import json
+from collections import OrderedDict
+
+from pypremis import nodes
+from pypremis.nodes import PremisNode, ExtendedNode, ExtensionNode
+
+
+"""
+### Reading and writing PREMIS records as JSON ###
+
+The JSON form mirrors the nodes directly, so it can be read and written
+without going through xml.
+
+A node is a JSON object whose keys are its field names, in the order of its
+class's field_order. Fields which may repeat (those with an add_* method)
+are always arrays, the rest are single values. Values are strings, or
+objects for fields holding nodes, the class of which is named after the
+field (eventIdentifier holds an EventIdentifier). Object's objectCategory,
+the xsi:type of the xml, is an ordinary field.
+
+Extension content (objectCharacteristicsExtension, eventDetailExtension,
+...) keeps the element names it had in the xml, with namespaces in
+{namespace}name form, and every value is an array of strings and objects.
+
+A record is an object with a "version" and an array each of "objects",
+"events", "agents" and "rights" nodes:
+
+    {"version": "3.0", "objects": [...], "events": [...], "agents": [...],
+     "rights": [...]}
+
+In JSON Lines each line is one entity, in the order the record iterates
+them, as an object with its "type" (object, event, agent or rights) and the
+node:
+
+    {"type": "event", "node": {"eventIdentifier": {...}, ...}}
+
+1. **node_to_dict()** and **node_from_dict()** convert single nodes.
+2. **record_to_dict()** and **record_from_dict()** convert whole records.
+PremisRecord.to_json() and PremisRecord.from_json() use them.
+3. **write_jsonl()** and **iter_jsonl()** write and stream entities as JSON
+Lines.
+"""
+
+
+VERSION = '3.0'
+
+# Record keys mapped to the name of the entities they hold
+ENTITY_KEYS = OrderedDict((
+    ('objects', 'object'),
+    ('events', 'event'),
+    ('agents', 'agent'),
+    ('rights', 'rights'),
+))
+
+
+# Constructor arguments which aren't spelt like the fields they set
+_ARGUMENT_FIELDS = {
+    'linkingEventIdentiferType': 'linkingEventIdentifierType',
+}
+
+_required = {}
+
+
+def _required_fields(cls):
+    # The fields a node class's __init__ requires, its arguments without
+    # defaults
+    fields = _required.get(cls)
+    if fields is None:
+        fields = ()
+        if not issubclass(cls, (ExtendedNode, ExtensionNode)) and \
+                cls.__init__ is not PremisNode.__init__:
+            parameters = list(inspect.signature(cls.__init__).parameters.values())[1:]
+            fields = tuple(_ARGUMENT_FIELDS.get(x.name, x.name) for x in parameters
+                           if x.default is x.empty and x.kind == x.POSITIONAL_OR_KEYWORD)
+        _required[cls] = fields
+    return fields
+
+
+def _node_class(key):
+    # The node class held by a field, named after it
+    cls = getattr(nodes, key[:1].upper() + key[1:], None)
+    if isinstance(cls, type) and issubclass(cls, PremisNode):
+        return cls
+    return None
+
+
+def _value_to_json(value):
+    if isinstance(value, PremisNode):
+        return node_to_dict(value)
+    return value
+
+
+def node_to_dict(node):
+    """
+    Converts a node, and everything below it, to its JSON form.
+
+    __Args__
+
+    1. node (PremisNode): the node
+
+    __Returns__
+
+    * (OrderedDict): the JSON object
+    """
+    fields = node.fields
+    if isinstance(node, (ExtendedNode, ExtensionNode)):
+        keys = fields
+    else:
+        keys = [key for key in node.field_order if key in fields]
+    result = OrderedDict()
+    for key in keys:
+        value = fields[key]
+        if isinstance(value, list):
+            result[key] = [_value_to_json(x) for x in value]
+        else:
+            result[key] = _value_to_json(value)
+    return result
+
+
+def _extension_from_dict(node, data):
+    # Fills an ExtendedNode or ExtensionNode from its JSON form
+    fields = OrderedDict()
+    for key, values in data.items():
+        if not isinstance(values, list):
+            raise ValueError("Extension field {} must be an array".format(key))
+        result = []
+        for value in values:
+            if isinstance(value, dict):
+                value = _extension_from_dict(ExtensionNode.__new__(ExtensionNode), value)
+                value.name = 'root'
+            elif not isinstance(value, str):
+                raise ValueError("Extension field {} holds a {}".format(key, type(value).__name__))
+            result.append(value)
+        fields[key] = result
+    node.fields = fields
+    return node
+
+
+def _value_from_json(key, value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        cls = _node_class(key)
+        if cls is None:
+            raise ValueError("{} doesn't hold nodes".format(key))
+        return node_from_dict(cls, value)
+    raise ValueError("{} holds a {}".format(key, type(value).__name__))
+
+
+def node_from_dict(cls, data):
+    """
+    Builds a node, and everything below it, from its JSON form.
+
+    The node's __init__ isn't run, but the nodes are checked against their
+    classes' field names and cardinality, and for the fields their __init__
+    requires.
+
+    __Args__
+
+    1. cls (type): the PremisNode class to build, eg Event
+    2. data (dict): the JSON object
+
+    __Returns__
+
+    * (PremisNode): the node
+    """
+    if not isinstance(data, dict):
+        raise ValueError("A {} must be an object".format(cls.__name__))
+    node = cls.__new__(cls)
+    node.name = cls.__name__[:1].lower() + cls.__name__[1:]
+    if issubclass(cls, ExtendedNode):
+        return _extension_from_dict(node, data)
+    for key in _required_fields(cls):
+        if key not in data:
+            raise ValueError("{} is missing its required field {}".format(cls.__name__, key))
+    fields = OrderedDict()
+    for key, value in data.items():
+        if key not in cls.field_order:
+            raise ValueError("{} has no field {}".format(cls.__name__, key))
+        repeatable = hasattr(cls, 'add_' + key)
+        if repeatable != isinstance(value, list):
+            raise ValueError("{}.{} must be {}".format(
+                cls.__name__, key, 'an array' if repeatable else 'a single value'))
+        if repeatable:
+            fields[key] = [_value_from_json(key, x) for x in value]
+        else:
+            fields[key] = _value_from_json(key, value)
+    node.fields = fields
+    return node
+
+
+def entity_from_dict(name, data):
+    """
+    Builds a top level node from its JSON form.
+
+    __Args__
+
+    1. name (str): 'object', 'event', 'agent' or 'rights'
+    2. data (dict): the JSON object
+
+    __Returns__
+
+    * (PremisNode): the node
+    """
+    cls = _node_class(name)
+    if cls is None or name not in ENTITY_KEYS.values():
+        raise ValueError("Unknown entity type: {}".format(name))
+    try:
+        return node_from_dict(cls, data)
+    except ValueError as e:
+        raise ValueError("Invalid {}: {}".format(name, e)) from e
+
+
+def record_to_dict(record):
+    """
+    Converts a record to its JSON form.
+
+    __Args__
+
+    1. record (PremisRecord): the record
+
+    __Returns__
+
+    * (OrderedDict): the JSON object
+    """
+    result = OrderedDict([('version', VERSION)])
+    result['objects'] = [node_to_dict(x) for x in record.get_object_list()]
+    result['events'] = [node_to_dict(x) for x in record.get_event_list()]
+    result['agents'] = [node_to_dict(x) for x in record.get_agent_list()]
+    result['rights'] = [node_to_dict(x) for x in record.get_rights_list()]
+    return result
+
+
+def _entity_lists(data):
+    # The entities in a record's JSON form, as kwargs for PremisRecord
+    if not isinstance(data, dict):
+        raise ValueError("A record must be an object")
+    kwargs = {}
+    for key, name in ENTITY_KEYS.items():
+        entities = data.get(key, [])
+        if not isinstance(entities, list):
+            raise ValueError("{} must be an array".format(key))
+        kwargs[key] = [entity_from_dict(name, x) for x in entities]
+    return kwargs
+
+
+def record_from_dict(data):
+    """
+    Builds a record from its JSON form.
+
+    __Args__
+
+    1. data (dict): the JSON object
+
+    __Returns__
+
+    * (PremisRecord): the record
+    """
+    # Imported here, pypremis.lib imports this module
+    from pypremis.lib import PremisRecord
+    return PremisRecord(**_entity_lists(data))
+
+
+def write_jsonl(record, f):
+    """
+    Writes the entities of a record to a file as JSON Lines, one at a time.
+
+    __Args__
+
+    1. record (PremisRecord): the record
+    2. f: a file object opened for writing text
+    """
+    for entity in record:
+        f.write(json.dumps(OrderedDict([('type', entity.get_name()),
+                                        ('node', node_to_dict(entity))])))
+        f.write('\n')
+
+
+def iter_jsonl(f):
+    """
+    Builds the entities in a JSON Lines file one at a time.
+
+    __Args__
+
+    1. f: a file object opened for reading text, or any iterable of lines
+
+    __Returns__
+
+    * (generator): (name, PremisNode) tuples, where name is one of
+    'object', 'event', 'agent' or 'rights'
+    """
+    for number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError as e:
+            raise ValueError("Invalid JSON on line {}: {}".format(number, e))
+        if not isinstance(entry, dict) or 'type' not in entry or 'node' not in entry:
+            raise ValueError("Line {} isn't an entity".format(number))
+        try:
+            node = entity_from_dict(entry['type'], entry['node'])
+        except ValueError as e:
+            raise ValueError("Line {}: {}".format(number, e)) from e
+        yield entry['type'], node
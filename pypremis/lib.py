@@ -1,6 +1,16 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
 import xml.etree.ElementTree as ET
+from time import perf_counter
+
+from pypremis import instrument
+from pypremis.compression import detect, infer, open_writer
 from pypremis.factories import XMLNodeFactory
 from pypremis.nodes import *
+from pypremis.source import SourceMap, scan, fingerprint
 
 
 """
@@ -8,6 +18,8 @@ from pypremis.nodes import *
 
 1. **PremisRecord** is a containing class meant to hold nodes
 and facilitate writing them to reading and writing serializations.
+2. **LazyEntity** stands in for a top level node that hasn't been built
+yet in records loaded with lazy=True.
 """
 
 
@@ -15,6 +27,47 @@ class DuplicateIdentifierError(ValueError):
     """Raised when an attempt is made to append a node with an existing identifier"""
 
 
+class LazyEntity(object):
+    """
+    A placeholder for a top level node in a lazily loaded record, holding
+    just enough to index the node and build it on demand.
+
+    __Attributes__
+
+    1. factory: the factory instance to build the node with
+    2. name: 'object', 'event', 'agent' or 'rights'
+    3. element: the source element
+    4. identifiers: the node's identifier subnodes, as built by
+    factory.buildIdentifiers()
+    5. source: the entity's (SourceMap, start, end) in its source file, if
+    the record is preserving its source. See PremisRecord.populate_from_file()
+    """
+    __slots__ = ('factory', 'name', 'element', 'identifiers', 'source')
+
+    def __init__(self, factory, name, element, identifiers, source=None):
+        self.factory = factory
+        self.name = name
+        self.element = element
+        self.identifiers = identifiers
+        self.source = source
+
+    def get_name(self):
+        return self.name
+
+    def materialize(self):
+        """
+        Builds the node.
+
+        __Returns__
+
+        * (PremisNode): the built node
+        """
+        node = self.factory.buildEntity(self.name, self.element)
+        if self.source is not None:
+            node._source = self.source + (fingerprint(node),)
+        return node
+
+
 class NodeSet:
     """
     A utility container class for internal use by PremisRecord to hold and retrieve pypremis nodes
@@ -27,6 +80,15 @@ class NodeSet:
     one identifier.
 
     The purpose of this subsidiary class is to facilitate the retrieval of nodes by identifier.
+
+    Entries in the node list may also be LazyEntity placeholders, which are
+    built and replaced by the node they stand for the first time they are
+    returned from .get_nodes().
+
+    Appending and building placeholders hold a per NodeSet lock, so a record
+    can be shared between threads (including on free-threaded builds of
+    python) as long as its nodes aren't modified while others read them.
+    Lookups of nodes that are already built don't lock.
     """
     def __init__(self):
         """
@@ -34,6 +96,9 @@ class NodeSet:
         """
         self.nodes = []
         self.identifiers = {}
+        # The number of LazyEntity placeholders in self.nodes
+        self.lazy = 0
+        self._lock = threading.Lock()
 
     def get_nodes(self, identifier=None):
         """
@@ -41,24 +106,63 @@ class NodeSet:
 
         If identifier is None, then return a list of all nodes in the NodeSet.
         """
+        if instrument.ENABLED:
+            instrument.count('lookups', 'identifier' if identifier is not None else 'all')
         try:
             identifier_type = type(identifier)
             if identifier_type is str:
-                return [self.nodes[self.identifiers[identifier]]]
+                return [self._get(self.identifiers[identifier])]
             if identifier_type is list:
-                return [self.nodes[self.identifiers[key]] for key in identifier]
+                return [self._get(self.identifiers[key]) for key in identifier]
         except KeyError:
             return [None]
 
         if identifier is None:
+            if self.lazy:
+                for index in range(len(self.nodes)):
+                    self._get(index)
             return self.nodes
 
         return []  # in the case of a nonsensical identifier, return an empty list
 
-    def append(self, node):
-        """
-        Add a node to a NodeSet. If there is an existing NodeSet node with the same identifier, it raises
-        a DuplicateIdentifierError.
+    def __getstate__(self):
+        # Locks can't be copied or pickled. Placeholders are built first, they
+        # hold on to their factory and its source. The identifiers are kept,
+        # rebuilding them would serialize every identifier node again.
+        if self.lazy:
+            for index in range(len(self.nodes)):
+                self._get(index)
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _get(self, index):
+        node = self.nodes[index]
+        if type(node) is LazyEntity:
+            with self._lock:
+                # Another thread may have built it while this one waited
+                node = self.nodes[index]
+                if type(node) is LazyEntity:
+                    node = node.materialize()
+                    self.nodes[index] = node
+                    self.lazy -= 1
+        return node
+
+    def __len__(self):
+        """
+        Returns the number of nodes in the NodeSet, without building any
+        that haven't been built yet.
+        """
+        return len(self.nodes)
+
+    @staticmethod
+    def identifier_keys(node):
+        """
+        Returns the identifier keys a node is indexed by: the XML serializations of its identifiers.
         """
         node_type = type(node)
 
@@ -77,6 +181,35 @@ class NodeSet:
             keys = [repr(rights_statement.get_rightsStatementIdentifier())
                     for rights_statement in node.get_rightsStatement()]
 
+        if node_type == LazyEntity:
+            keys = [repr(identifier) for identifier in node.identifiers]
+
+        return keys
+
+    def append(self, node, keys=None):
+        """
+        Add a node to a NodeSet. If there is an existing NodeSet node with the same identifier, it raises
+        a DuplicateIdentifierError.
+
+        keys may be given the node's identifier keys if they're already known (eg from a snapshot), to save
+        serializing its identifiers.
+        """
+        if instrument.ENABLED:
+            start = perf_counter()
+            with self._lock:
+                self._append(node, keys)
+            instrument.add_time('index', node.get_name(), perf_counter() - start)
+        else:
+            with self._lock:
+                self._append(node, keys)
+
+    def _append(self, node, keys=None):
+        if keys is None:
+            keys = self.identifier_keys(node)
+
+        if type(node) == LazyEntity:
+            self.lazy += 1
+
         index = len(self.nodes)
         self.nodes.append(node)
 
@@ -85,6 +218,9 @@ class NodeSet:
                 raise DuplicateIdentifierError
             self.identifiers[key] = index
 
+        if instrument.ENABLED:
+            instrument.count('identifiers_indexed', node.get_name(), len(keys))
+
 
 class PremisRecord(object):
     """
@@ -102,7 +238,8 @@ class PremisRecord(object):
     """
     def __init__(self,
                  objects=None, events=None, agents=None, rights=None,
-                 frompath=None):
+                 frompath=None, lazy=False, opaque_extensions=False,
+                 preserve_source=False, journal=True):
         """
         Initializes a PremisRecord object from either a list of
         pre-existing nodes or an existing xml file on disk. Requires
@@ -116,6 +253,16 @@ class PremisRecord(object):
         * rights (list):  a list to initially populate rights_list
         * frompath (list): a string meant to set the location of an originating
         xml file
+        * lazy (bool): when reading from a file, only build the identifiers of
+        each entity up front, and build the rest of each node the first time
+        it is accessed. See .populate_from_file()
+        * opaque_extensions (bool): when reading from a file, keep extension
+        content as xml until it is accessed. See .populate_from_file()
+        * preserve_source (bool): when reading from a file, remember where each
+        entity came from so unmodified ones can be copied from it as is when
+        writing. See .populate_from_file()
+        * journal (bool): when reading from a file, merge in the events from
+        its journal. See .populate_from_file()
         """
 
         if (frompath and (objects or events or agents or rights)) \
@@ -129,10 +276,14 @@ class PremisRecord(object):
         self.agents_list = NodeSet()
         self.rights_list = NodeSet()
         self.filepath = None
+        self._source = None
 
         if frompath:
             self.filepath = frompath
-            self.populate_from_file(XMLNodeFactory)
+            self.populate_from_file(XMLNodeFactory, lazy=lazy,
+                                    opaque_extensions=opaque_extensions,
+                                    preserve_source=preserve_source,
+                                    journal=journal)
         else:
             if objects:
                 for x in objects:
@@ -147,6 +298,19 @@ class PremisRecord(object):
                 for x in rights:
                     self.add_rights(x)
 
+    @classmethod
+    def _empty(cls):
+        # A record with no nodes, for loaders which fill its NodeSets
+        # themselves (see pypremis.snapshot)
+        record = cls.__new__(cls)
+        record.events_list = NodeSet()
+        record.objects_list = NodeSet()
+        record.agents_list = NodeSet()
+        record.rights_list = NodeSet()
+        record.filepath = None
+        record._source = None
+        return record
+
     def __iter__(self):
         """
         Yields each contained node.
@@ -343,6 +507,18 @@ class PremisRecord(object):
         """
         return self.filepath
 
+    def memory_report(self):
+        """
+        Reports how much memory the nodes in the record use, broken down by
+        node class, field and entity type. See pypremis.memory.
+
+        __Returns__
+
+        * (pypremis.memory.MemoryReport): the report
+        """
+        from pypremis.memory import memory_report
+        return memory_report(self)
+
     def validate(self):
         """
         Validates the contained record against the PREMIS specification.
@@ -353,7 +529,9 @@ class PremisRecord(object):
         """
         pass
 
-    def populate_from_file(self, factory=XMLNodeFactory, filepath=None):
+    def populate_from_file(self, factory=XMLNodeFactory, filepath=None, lazy=False,
+                           opaque_extensions=False, preserve_source=False,
+                           journal=True, workers=None):
         """
         Populates the object, event, agent, and rights lists from an existing
         premis xml file
@@ -363,32 +541,90 @@ class PremisRecord(object):
         1. factory (cls): A factory class which implements .find_events(),
         .find_agents(), .find_rights, and .find_objects(), which return
         iterators consisting of Event, Agent, Rights, and Object PremisNode
-        instances respectively.
+        instances respectively. If it also implements .iter_entities() that is
+        used instead, so each entity is built and indexed as it is read and
+        its source can be released straight away.
 
         __KWArgs__
 
         * filepath (str): A string which specifies the location of a serialization
         supported by the given factory class. If not provided the instances
         filepath attribute is assumed.
+        * lazy (bool): index each entity by its identifiers but defer building
+        it until it is first accessed, after which the built node is kept.
+        Requires a factory which also implements .iter_elements(),
+        .buildIdentifiers() and .buildEntity(). Errors in the body of an
+        entity are raised when it is built rather than here.
+        * opaque_extensions (bool): passed to the factory. With
+        XMLNodeFactory, extension content is kept as the source elements,
+        which are written back out as is and only built into ExtensionNodes if
+        they are accessed.
+        * preserve_source (bool): record the byte range of each entity in the
+        file. .write_to_file() then copies the bytes of entities which haven't
+        been modified since (or, with lazy=True, haven't even been built)
+        straight from the file, and only serializes new or modified ones.
+        Requires XMLNodeFactory and an uncompressed filepath on disk, and is
+        ignored otherwise.
+        * journal (bool): if the file has an event journal next to it (see
+        pypremis.journal), add the events from it to the record as well.
+        * workers (int): passed to the factory, for factories which build
+        entities in parallel such as pypremis.parallel.ParallelXMLNodeFactory.
+        Entities are still indexed in document order, so duplicate
+        identifiers are reported as they would be otherwise. Ignored with
+        lazy=True or preserve_source=True, which build entities as they're
+        read.
         """
         if filepath is None:
             if self.get_filepath() is None:
                 raise ValueError("No supplied filepath.")
             filepath = self.get_filepath()
-        factory = factory(filepath)
-        for event in factory.find_events():
-            self.add_event(event)
-        for agent in factory.find_agents():
-            self.add_agent(agent)
-        for rights in factory.find_rights():
-            self.add_rights(rights)
-        for obj in factory.find_objects():
-            self.add_object(obj)
-        # This fixes a weird bug where the premis xmlns was being written twice
-        # in the attributes of the root tag when calling .write_to_file() in
-        # cases where extension nodes contain children that are PremisNodes
-        ET.register_namespace('premis', "")
-        ET.register_namespace('xsi', "")
+        kwargs = {}
+        if opaque_extensions:
+            kwargs['opaque_extensions'] = True
+        if workers:
+            kwargs['workers'] = workers
+        factory = factory(filepath, **kwargs)
+        nodesets = {'object': self.objects_list, 'event': self.events_list,
+                    'agent': self.agents_list, 'rights': self.rights_list}
+        spans = None
+        if preserve_source and isinstance(factory, XMLNodeFactory) and \
+                isinstance(filepath, str) and detect(filepath) is None:
+            source = scan(filepath)
+            spans = iter([(name, (source, start, end) if start is not None else None)
+                          for name, start, end in source.entities])
+            self._source = source
+        if lazy or spans is not None:
+            for name, element in factory.iter_elements():
+                span = None
+                if spans is not None:
+                    expected, span = next(spans, (None, None))
+                    if expected != name:
+                        raise ValueError("{} changed while it was being read".format(filepath))
+                if lazy:
+                    nodesets[name].append(LazyEntity(factory, name, element,
+                                                     factory.buildIdentifiers(name, element),
+                                                     source=span))
+                    continue
+                node = factory.buildEntity(name, element)
+                if span is not None:
+                    node._source = span + (fingerprint(node),)
+                nodesets[name].append(node)
+        elif hasattr(factory, 'iter_entities'):
+            for name, node in factory.iter_entities():
+                nodesets[name].append(node)
+        else:
+            for event in factory.find_events():
+                self.add_event(event)
+            for agent in factory.find_agents():
+                self.add_agent(agent)
+            for rights in factory.find_rights():
+                self.add_rights(rights)
+            for obj in factory.find_objects():
+                self.add_object(obj)
+        if journal and isinstance(filepath, str) and os.path.exists(filepath + '.journal'):
+            # Imported here, pypremis.journal imports this module
+            from pypremis.journal import EventJournal, journal_path, merge_journal
+            merge_journal(self, EventJournal(journal_path(filepath)))
 
     def write(self, targetpath, xml_declaration=True,
                       encoding="unicode", method='xml'):
@@ -415,30 +651,304 @@ class PremisRecord(object):
         root.set('xmlns:premis', "http://www.loc.gov/premis/v3")
         root.set('xmlns:xsi', "http://www.w3.org/2001/XMLSchema-instance")
         root.set('version', "3.0")
-        for entry in self:
-            root.append(entry.toXML())
+        if instrument.ENABLED:
+            for entry in self:
+                start = perf_counter()
+                root.append(entry.toXML())
+                instrument.add_time('serialize', entry.get_name(), perf_counter() - start)
+        else:
+            for entry in self:
+                root.append(entry.toXML())
         return tree
 
     def to_xml(self, encoding='unicode', method='xml',
                short_empty_elements=True):
         tree = self.to_tree()
+        if instrument.ENABLED:
+            with instrument.timed('serialize', 'tostring'):
+                return ET.tostring(tree.getroot(), encoding=encoding,
+                                   method=method,
+                                   short_empty_elements=short_empty_elements)
         return ET.tostring(tree.getroot(), encoding=encoding,
                            method=method,
                            short_empty_elements=short_empty_elements)
 
+    def to_json(self, **kwargs):
+        """
+        Serializes the record as JSON, see pypremis.jsonform for its shape.
+
+        __KWArgs__
+
+        * Passed on to json.dumps(), eg indent
+
+        __Returns__
+
+        * (str): the JSON document
+        """
+        # Imported here, pypremis.jsonform imports this module
+        from pypremis.jsonform import record_to_dict
+        return json.dumps(record_to_dict(self), **kwargs)
+
+    @classmethod
+    def from_json(cls, text):
+        """
+        Builds a record from JSON written by .to_json(), without going
+        through xml.
+
+        __Args__
+
+        1. text (str): the JSON document
+
+        __Returns__
+
+        * (PremisRecord): the record
+        """
+        # Imported here, pypremis.jsonform imports this module
+        from pypremis.jsonform import _entity_lists
+        return cls(**_entity_lists(json.loads(text)))
+
+    def to_jsonl(self, f):
+        """
+        Writes the record's entities to a file object as JSON Lines, one
+        entity per line.
+
+        __Args__
+
+        1. f: a file object opened for writing text
+        """
+        # Imported here, pypremis.jsonform imports this module
+        from pypremis.jsonform import write_jsonl
+        write_jsonl(self, f)
+
+    @classmethod
+    def from_jsonl(cls, f):
+        """
+        Builds a record from JSON Lines written by .to_jsonl(), reading one
+        entity at a time.
+
+        __Args__
+
+        1. f: a file object opened for reading text, or any iterable of lines
+
+        __Returns__
+
+        * (PremisRecord): the record
+        """
+        # Imported here, pypremis.jsonform imports this module
+        from pypremis.jsonform import iter_jsonl
+        kwargs = {'objects': [], 'events': [], 'agents': [], 'rights': []}
+        for name, node in iter_jsonl(f):
+            kwargs['rights' if name == 'rights' else name + 's'].append(node)
+        return cls(**kwargs)
+
+    def to_snapshot(self, targetpath):
+        """
+        Writes the record to a binary snapshot, which loads in about half the
+        time of parsing xml. See pypremis.snapshot
+
+        __Args__
+
+        1. targetpath (str): where to write the snapshot
+        """
+        # Imported here, pypremis.snapshot imports this module
+        from pypremis.snapshot import write_snapshot
+        write_snapshot(self, targetpath)
+
+    @classmethod
+    def from_snapshot(cls, frompath, identifiers=None, use_mmap=False):
+        """
+        Builds a record from a snapshot written by .to_snapshot().
+
+        __Args__
+
+        1. frompath (str): the snapshot file
+
+        __KWArgs__
+
+        * identifiers (list): only load the entities with these identifiers,
+        as identifier nodes (eg an EventIdentifier) or their repr()s
+        * use_mmap (bool): map the snapshot into memory rather than reading
+        it all in
+
+        __Returns__
+
+        * (PremisRecord): the record
+        """
+        # Imported here, pypremis.snapshot imports this module
+        from pypremis.snapshot import Snapshot
+        with Snapshot(frompath, use_mmap=use_mmap) as snapshot:
+            return snapshot.to_record(identifiers)
+
     def write_to_file(self, targetpath, xml_declaration=True,
-                      encoding="unicode", method='xml'):
+                      encoding="unicode", method='xml', compression='infer',
+                      compresslevel=None):
         """
         Writes the contained premis data structure out to disk as the
         specified path as an xml document.
 
+        If the record was read with preserve_source=True and its source file
+        hasn't changed since, unmodified entities are copied from the source
+        file as is rather than serialized. See .populate_from_file()
+
         __Args__
 
         1. targetpath (str): a str corresponding to the intended location on disk
         to write the premis xml file to.
-        """
+
+        __KWArgs__
+
+        * compression (str): compress the file with 'gz', 'xz' or 'bz2', or
+        None not to. By default the compression is chosen by targetpath's
+        suffix, eg premis.xml.gz is written with gzip. Compressed files are
+        always serialized in full.
+        * compresslevel (int): the compression level, see
+        pypremis.compression.open_writer()
+        """
+        if compression == 'infer':
+            compression = infer(targetpath)
+        if compression is not None:
+            write = lambda path: self._write_compressed(path, compression, compresslevel)
+        elif isinstance(targetpath, str) and self._source is not None and \
+                self._source.is_spliceable() and self._source.is_current():
+            write = self._write_preserving
+        else:
+            write = self._write_tree
+        if instrument.ENABLED:
+            with instrument.timed('write', 'file'):
+                write(targetpath)
+            if isinstance(targetpath, str):
+                instrument.count('bytes_written', 'file', os.path.getsize(targetpath))
+            return
+        write(targetpath)
+
+    def _write_tree(self, targetpath):
         tree = self.to_tree()
         tree.write(targetpath,
                    xml_declaration=True,
                    encoding='unicode',
                    method='xml')
+
+    def _write_compressed(self, targetpath, compression, compresslevel):
+        tree = self.to_tree()
+        with open_writer(targetpath, compression, compresslevel) as f:
+            tree.write(f,
+                       xml_declaration=True,
+                       encoding='unicode',
+                       method='xml')
+
+    def _write_preserving(self, targetpath):
+        source = self._source
+        # Entities read from the source, by offset, and everything else
+        original = {}
+        new = {'object': [], 'event': [], 'agent': [], 'rights': []}
+        for nodeset in (self.objects_list, self.events_list,
+                        self.agents_list, self.rights_list):
+            for entry in nodeset.nodes:
+                if type(entry) is LazyEntity:
+                    span = entry.source
+                else:
+                    span = getattr(entry, '_source', None)
+                if span is not None and span[0] is source:
+                    original[span[1]] = (span, entry)
+                else:
+                    new[entry.get_name()].append(entry)
+
+        # New entities go after the last entity of the same kind from the
+        # source, or at the end if there weren't any.
+        order = sorted(original)
+        last = {}
+        for start in order:
+            last[original[start][1].get_name()] = start
+        after = {start: [] for start in order}
+        trailing = []
+        for name in ('object', 'event', 'agent', 'rights'):
+            if name in last:
+                after[last[name]].extend(new[name])
+            else:
+                trailing.extend(new[name])
+
+        same = os.path.exists(targetpath) and os.path.samefile(targetpath, source.path)
+        if same:
+            handle, outpath = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(targetpath)))
+            os.close(handle)
+        else:
+            outpath = targetpath
+        # Where each entity ends up in the output, as (entry, start, end,
+        # fingerprint or None if it was copied unmodified)
+        written = []
+        with open(source.path, 'rb') as src, open(outpath, 'wb') as out:
+
+            def copy(start, end):
+                src.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    chunk = src.read(min(remaining, 1024*1024))
+                    if not chunk:
+                        raise ValueError("{} was truncated".format(source.path))
+                    out.write(chunk)
+                    remaining -= len(chunk)
+
+            def serialize(node, print_=None):
+                if print_ is None:
+                    print_ = fingerprint(node)
+                start = out.tell()
+                out.write(ET.tostring(node.toXML(), encoding='utf-8'))
+                written.append((node, start, out.tell(), print_))
+
+            # New entities are indented like the first entity in the source
+            separator = b''
+            if order:
+                src.seek(source.root_start_end)
+                gap = src.read(order[0] - source.root_start_end)
+                if not gap.strip():
+                    separator = gap
+
+            copy(0, source.root_start_end)
+            position = source.root_start_end
+            for start in order:
+                span, entry = original[start]
+                copy(position, start)
+                position = span[2]
+                if type(entry) is LazyEntity:
+                    print_ = None
+                else:
+                    print_ = fingerprint(entry)
+                    if print_ == entry._source[3]:
+                        print_ = None
+                if print_ is None:
+                    begin = out.tell()
+                    copy(start, span[2])
+                    written.append((entry, begin, out.tell(), None))
+                else:
+                    serialize(entry, print_)
+                for node in after[start]:
+                    out.write(separator)
+                    serialize(node)
+            for node in trailing:
+                out.write(separator)
+                serialize(node)
+            root_end = out.tell() + source.root_end - position
+            copy(position, source.stat[0])
+
+        if not same:
+            return
+        shutil.copymode(source.path, outpath)
+        os.replace(outpath, targetpath)
+        # The rewritten file is now the record's source
+        rewritten = SourceMap(source.path)
+        st = os.stat(source.path)
+        rewritten.stat = (st.st_size, st.st_mtime_ns)
+        rewritten.root_start = source.root_start
+        rewritten.root_start_end = source.root_start_end
+        rewritten.root_end = root_end
+        rewritten.namespaces = source.namespaces
+        rewritten.encoding = source.encoding
+        for entry, start, end, print_ in written:
+            rewritten.entities.append((entry.get_name(), start, end))
+            if type(entry) is LazyEntity:
+                entry.source = (rewritten, start, end)
+            else:
+                if print_ is None:
+                    print_ = entry._source[3]
+                entry._source = (rewritten, start, end, print_)
+        self._source = rewritten
@@ -0,0 +1,253 @@
+import sys
+import tracemalloc
+
+from pypremis.lib import LazyEntity
+from pypremis.nodes import PremisNode
+
+
+"""
+### Memory footprint reporting for PremisRecords ###
+
+1. **memory_report()** walks the nodes held by a PremisRecord and attributes
+their deep byte sizes per node class, per field and per entity type. Objects
+reachable from more than one place (shared subnodes, interned strings) are
+only counted the first time they are seen. Entities of lazily loaded
+records which haven't been built yet are sized as they are, without being
+built.
+2. **MemoryReport** holds the results.
+3. **trace()** measures actual allocations made while running a callable
+(eg loading a record) with tracemalloc.
+"""
+
+
+class MemoryReport(object):
+    """
+    The results of memory_report().
+
+    __Attributes__
+
+    1. total: bytes attributed to the whole record
+    2. by_class: node class names mapped to the bytes of the nodes themselves,
+    including the strings they hold directly but not their child nodes
+    3. by_field: "Class.field" names mapped to the deep size of everything held
+    in that field, including child nodes
+    4. by_entity: top level node names (object, event, agent, rights) mapped to
+    the deep size of all those entities
+    5. index: the bytes used by the identifier indexes of the record's NodeSets
+    6. nodes: the number of distinct nodes visited
+    7. lazy: the number of entities which haven't been built yet, sized as
+    their LazyEntity placeholders and source elements
+    """
+    def __init__(self):
+        self.total = 0
+        self.by_class = {}
+        self.by_field = {}
+        self.by_entity = {}
+        self.index = 0
+        self.nodes = 0
+        self.lazy = 0
+
+    def as_dict(self):
+        return {
+            'total': self.total,
+            'by_class': dict(self.by_class),
+            'by_field': dict(self.by_field),
+            'by_entity': dict(self.by_entity),
+            'index': self.index,
+            'nodes': self.nodes,
+            'lazy': self.lazy
+        }
+
+    def format(self, top=10):
+        """
+        Render the report as a human readable table.
+
+        __KWArgs__
+
+        * top (int): the number of classes and fields to list
+
+        __Returns__
+
+        * (str): the table
+        """
+        lines = ["Total: {:,} bytes in {:,} nodes".format(self.total, self.nodes)]
+        if self.lazy:
+            lines.append("Not yet built: {:,} entities".format(self.lazy))
+
+        def section(title, data, limit=None):
+            lines.append("")
+            lines.append(title)
+            entries = sorted(data.items(), key=lambda x: -x[1])
+            if limit is not None:
+                entries = entries[:limit]
+            for name, size in entries:
+                share = size / self.total if self.total else 0
+                lines.append("  {:<48} {:>14,} {:>7.1%}".format(name, size, share))
+
+        section("By entity:", dict(self.by_entity, index=self.index))
+        section("By class:", self.by_class, top)
+        section("By field:", self.by_field, top)
+        return "\n".join(lines)
+
+    def __str__(self):
+        return self.format()
+
+
+def _shallow(obj, seen):
+    # sys.getsizeof of obj, or 0 if it's already been counted
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    return sys.getsizeof(obj)
+
+
+def _elements_size(elements, seen):
+    # The size of some xml elements and everything beneath them
+    size = 0
+    for element in elements:
+        for x in element.iter():
+            size += _shallow(x, seen) + (_shallow(x.text, seen) if x.text else 0)
+    return size
+
+
+def _node_size(node, report, seen, keep):
+    """
+    Recursively size a node, updating report. Returns the deep size.
+    """
+    if id(node) in seen:
+        return 0
+    keep.append(node)
+    report.nodes += 1
+    cls = type(node).__name__
+    own = _shallow(node, seen)
+    if hasattr(node, '__dict__'):
+        own += _shallow(node.__dict__, seen)
+        for value in node.__dict__.values():
+            if isinstance(value, (str, bytes)):
+                own += _shallow(value, seen)
+    payload = getattr(node, '_payload', None)
+    if payload is not None:
+        # Opaque extension content (see ExtendedNode.set_payload()) is
+        # measured as is rather than built just to be measured
+        size = _shallow(payload, seen) + _elements_size(payload, seen)
+        own += size
+        name = "{}.<payload>".format(cls)
+        report.by_field[name] = report.by_field.get(name, 0) + size
+        fields = node._fields
+    else:
+        fields = node.fields
+    own += _shallow(fields, seen)
+    children = 0
+    for key, value in fields.items():
+        own += _shallow(key, seen)
+        if isinstance(value, list):
+            values = value
+            direct = _shallow(value, seen)
+        else:
+            values = [value]
+            direct = 0
+        nested = 0
+        for entry in values:
+            if isinstance(entry, PremisNode):
+                nested += _node_size(entry, report, seen, keep)
+            else:
+                direct += _shallow(entry, seen)
+        own += direct
+        children += nested
+        name = "{}.{}".format(cls, key)
+        report.by_field[name] = report.by_field.get(name, 0) + direct + nested
+    # Child nodes are attributed to their own classes
+    report.by_class[cls] = report.by_class.get(cls, 0) + own
+    return own + children
+
+
+def _lazy_size(placeholder, report, seen, keep):
+    """
+    Size a LazyEntity placeholder and the source element it holds, without
+    building it. Returns the deep size.
+    """
+    keep.append(placeholder)
+    report.lazy += 1
+    element = _elements_size([placeholder.element], seen)
+    direct = _shallow(placeholder.identifiers, seen)
+    nested = 0
+    for node in placeholder.identifiers:
+        nested += _node_size(node, report, seen, keep)
+    own = _shallow(placeholder, seen) + element + direct
+    for name, size in (('element', element), ('identifiers', direct + nested)):
+        name = "LazyEntity.{}".format(name)
+        report.by_field[name] = report.by_field.get(name, 0) + size
+    # The identifier nodes are attributed to their own classes
+    report.by_class['LazyEntity'] = report.by_class.get('LazyEntity', 0) + own
+    return own + nested
+
+
+def memory_report(record):
+    """
+    Build a MemoryReport for a PremisRecord.
+
+    __Args__
+
+    1. record (PremisRecord): the record to report on
+
+    __Returns__
+
+    * (MemoryReport): the report
+    """
+    report = MemoryReport()
+    seen = set()
+    # Holds a reference to everything counted, so ids in seen can't be
+    # recycled by anything allocated while the walk is running.
+    keep = []
+    for nodeset in (record.objects_list, record.events_list,
+                    record.agents_list, record.rights_list):
+        # .nodes rather than .get_nodes(), which would build placeholders
+        for node in nodeset.nodes:
+            if type(node) is LazyEntity:
+                size = _lazy_size(node, report, seen, keep)
+            else:
+                size = _node_size(node, report, seen, keep)
+            name = node.get_name()
+            report.by_entity[name] = report.by_entity.get(name, 0) + size
+        report.index += _shallow(nodeset.identifiers, seen) + _shallow(nodeset.nodes, seen)
+        for key in nodeset.identifiers:
+            report.index += _shallow(key, seen)
+    report.total = sum(report.by_entity.values()) + report.index
+    return report
+
+
+def trace(func, *args, **kwargs):
+    """
+    Run a callable under tracemalloc and report what it allocated.
+
+    __Args__
+
+    1. func (callable): eg lambda: PremisRecord(frompath='premis.xml')
+
+    __KWArgs__
+
+    * All args and kwargs are passed to func
+
+    __Returns__
+
+    * (tuple): (the return value of func, a dict with the 'current' and
+    'peak' traced bytes and the 'top' ten allocating source lines)
+    """
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    baseline = tracemalloc.get_traced_memory()[0]
+    try:
+        result = func(*args, **kwargs)
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        if not already_tracing:
+            tracemalloc.stop()
+    top = []
+    for stat in after.compare_to(before, 'lineno')[:10]:
+        frame = stat.traceback[0]
+        top.append(("{}:{}".format(frame.filename, frame.lineno), stat.size_diff))
+    return result, {'current': current - baseline, 'peak': peak - baseline, 'top': top}
@@ -0,0 +1,121 @@
+import xml.etree.ElementTree as ET
+
+from pypremis.compression import reading
+from pypremis.factories import XMLNodeFactory, ENTITY_TAGS
+from pypremis.lib import PremisRecord, NodeSet, DuplicateIdentifierError
+
+
+"""
+### Reading PREMIS embedded in METS documents ###
+
+METS documents usually carry PREMIS in the xmlData of their amdSec's
+digiprovMD (and techMD, rightsMD, sourceMD) sections, either as a whole
+premis:premis record or as single entities. The reader here streams the
+METS document, builds each PREMIS entity it comes across with the
+XMLNodeFactory builders, and drops everything else as soon as it has been
+read, so memory use doesn't grow with the size of the METS file.
+
+1. **iter_entities()** yields the PREMIS entities of a METS document along
+with the IDs of the METS sections they came from.
+2. **load_record()** gathers them into a PremisRecord.
+"""
+
+
+METS_NS = 'http://www.loc.gov/METS/'
+
+_METS = '{' + METS_NS + '}'
+
+
+def iter_entities(metsfile, opaque_extensions=False):
+    """
+    Streams a METS document, yielding the PREMIS entities embedded in it in
+    document order.
+
+    __Args__
+
+    1. metsfile: the path to a METS xml file, or a file object. Compressed
+    files are decompressed as they're read, see pypremis.compression
+
+    __KWArgs__
+
+    * opaque_extensions (bool): see XMLNodeFactory
+
+    __Returns__
+
+    * (generator): (name, PremisNode, sections) tuples, where name is one of
+    'object', 'event', 'agent' or 'rights', and sections is a dict of the
+    enclosing METS elements with an ID, by local name, eg {'amdSec': 'AMD1',
+    'digiprovMD': 'EVENT1'}
+    """
+    factory = XMLNodeFactory(metsfile, opaque_extensions=opaque_extensions)
+    # The open elements, and the (local name, ID) of the open METS elements
+    stack = []
+    sections = []
+    # The PREMIS entity being read, if any
+    entity = None
+    with reading(metsfile) as source:
+        for event, element in ET.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                stack.append(element)
+                if entity is None:
+                    tag = element.tag
+                    if tag in ENTITY_TAGS:
+                        entity = element
+                    elif tag.startswith(_METS):
+                        sections.append((tag[len(_METS):], element.get('ID')))
+                continue
+            stack.pop()
+            if entity is not None:
+                if element is not entity:
+                    # Kept until the whole entity has been read
+                    continue
+                entity = None
+                name = ENTITY_TAGS[element.tag]
+                yield (name, factory.buildEntity(name, element),
+                       {local: id for local, id in sections if id is not None})
+            elif element.tag.startswith(_METS):
+                sections.pop()
+            if stack:
+                # Detach everything read so far; its siblings before it
+                # already have been
+                del stack[-1][:]
+
+
+def load_record(metsfile, opaque_extensions=False):
+    """
+    Gathers the PREMIS entities embedded in a METS document into a record.
+
+    The same entity is often repeated across sections, eg an agent in the
+    digiprovMD of every event it took part in. Repeats equal to the first
+    occurrence are dropped, repeats of an identifier with different content
+    raise a DuplicateIdentifierError.
+
+    __Args__
+
+    1. metsfile: the path to a METS xml file, or a file object
+
+    __KWArgs__
+
+    * opaque_extensions (bool): see XMLNodeFactory
+
+    __Returns__
+
+    * (tuple): the PremisRecord, and a dict of the identifier keys of its
+    nodes (see PremisRecord.get_event()) mapped to the list of the METS
+    sections (as yielded by iter_entities()) each node appeared in
+    """
+    record = PremisRecord._empty()
+    nodesets = {'object': record.objects_list, 'event': record.events_list,
+                'agent': record.agents_list, 'rights': record.rights_list}
+    found = {}
+    for name, node, ids in iter_entities(metsfile, opaque_extensions=opaque_extensions):
+        nodeset = nodesets[name]
+        keys = NodeSet.identifier_keys(node)
+        indexes = {nodeset.identifiers[key] for key in keys if key in nodeset.identifiers}
+        if not indexes:
+            nodeset.append(node, keys=keys)
+        elif len(indexes) != 1 or nodeset.nodes[indexes.pop()] != node:
+            raise DuplicateIdentifierError
+        for key in keys:
+            found.setdefault(key, []).append(ids)
+    return record, found
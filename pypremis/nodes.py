@@ -1,6 +1,11 @@
+import copy
+import sys
+import threading
 import xml.etree.ElementTree as ET
 from collections import OrderedDict
 
+from pypremis import instrument
+
 
 """
 ### Classes meant to model entries in the PREMIS data model ###
@@ -21,6 +26,136 @@ of the PREMIS data model.
 """
 
 
+# Namespaces which PremisRecord.to_tree() declares on its root element
+QUALIFIED_NAMESPACES = (
+    ('{http://www.loc.gov/premis/v3}', 'premis:'),
+    ('{http://www.w3.org/2001/XMLSchema-instance}', 'xsi:'),
+)
+
+
+def qualify(name):
+    """
+    Rewrites an ElementTree {namespace}name in the premis or xsi namespaces
+    as premis:name or xsi:name, the way the nodes name their own elements.
+
+    Leaving those to ElementTree would make the output depend on the process
+    wide ET.register_namespace() registry, and declare the namespaces a second
+    time on the root element.
+
+    __Args__
+
+    1. name (str): a tag or attribute name
+
+    __Returns__
+
+    * (str): the name to serialize
+    """
+    if name[:1] == '{':
+        for namespace, prefix in QUALIFIED_NAMESPACES:
+            if name.startswith(namespace):
+                return prefix + name[len(namespace):]
+    return name
+
+
+def _qualify_elements(elements):
+    # Returns the elements if none of their names need qualifying, otherwise
+    # qualified copies of them
+    def unqualified(element):
+        return any(
+            isinstance(x.tag, str) and qualify(x.tag) != x.tag or
+            any(qualify(key) != key for key in x.attrib)
+            for x in element.iter()
+        )
+    if not any(unqualified(x) for x in elements):
+        return elements
+    result = []
+    for element in elements:
+        element = copy.deepcopy(element)
+        for x in element.iter():
+            if isinstance(x.tag, str):
+                x.tag = qualify(x.tag)
+            if x.attrib:
+                x.attrib = {qualify(key): value for key, value in x.attrib.items()}
+        result.append(element)
+    return result
+
+
+# Attributes which _pack_node() encodes itself rather than as plain state
+_PACKED = frozenset(('fields', '_fields', 'name', '_payload', '_qualified', '_payload_lock'))
+
+# Each class's ({field name: position in field_order}, default name,
+# attribute holding its fields)
+_class_info = {}
+
+
+def _get_class_info(cls):
+    info = _class_info.get(cls)
+    if info is None:
+        # Most nodes are named after their class, eg EventIdentifier ->
+        # eventIdentifier
+        name = cls.__name__
+        info = _class_info[cls] = (
+            {key: i for i, key in enumerate(cls.field_order)},
+            name[:1].lower() + name[1:],
+            '_fields' if issubclass(cls, ExtendedNode) else 'fields',
+        )
+    return info
+
+
+def _pack_node(node):
+    # A compact form of a node for pickling, as (class, name, keys, values[,
+    # payload[, extra]]). Field names in field_order are written as a bytes
+    # string of their positions in it rather than as strs, and the node's
+    # name is left out if it's the default for its class.
+    cls = type(node)
+    positions, default_name, attribute = _class_info.get(cls) or _get_class_info(cls)
+    state = node.__dict__
+    payload = state.get('_payload')
+    if payload is None:
+        fields = state[attribute]
+        try:
+            keys = bytes([positions[key] for key in fields])
+        except (KeyError, ValueError):
+            # Extension content, or a field from outside field_order
+            keys = tuple(fields)
+        values = tuple(fields.values())
+    else:
+        keys = values = ()
+    name = state['name']
+    if name == default_name:
+        name = None
+    if len(state) > 2:
+        extra = {key: value for key, value in state.items() if key not in _PACKED}
+        if extra:
+            return (cls, name, keys, values, payload, extra)
+    if payload is not None:
+        return (cls, name, keys, values, payload)
+    return (cls, name, keys, values)
+
+
+def _rebuild_node(cls, name, keys, values, payload=None, extra=None):
+    """
+    Recreates a node pickled by PremisNode.__reduce__(), without running its
+    __init__.
+    """
+    positions, default_name, attribute = _class_info.get(cls) or _get_class_info(cls)
+    node = cls.__new__(cls)
+    state = node.__dict__
+    if type(keys) is bytes:
+        state[attribute] = OrderedDict(zip(map(cls.field_order.__getitem__, keys), values))
+    else:
+        # Interned so the many copies of each extension field name across a
+        # record share one str
+        state[attribute] = OrderedDict(zip(map(sys.intern, keys), values))
+    state['name'] = default_name if name is None else name
+    if payload is not None:
+        state['_payload'] = payload
+        state['_payload_lock'] = threading.Lock()
+    if extra:
+        state.update(extra)
+    return node
+
+
 class PremisNode(object):
     """
     A super class for developing functionality for all "standard" premis nodes
@@ -49,6 +184,8 @@ class PremisNode(object):
 
         self._set_fields(OrderedDict())
         self._set_name(nodeName)
+        if instrument.ENABLED:
+            instrument.count('nodes_built', nodeName)
 
     def __repr__(self):
         """
@@ -61,6 +198,12 @@ class PremisNode(object):
         """
         return ET.tostring(self.toXML()).decode('utf-8')
 
+    def __reduce__(self):
+        """
+        Pickles the node compactly, see _pack_node()
+        """
+        return (_rebuild_node, _pack_node(self))
+
     def __eq__(self, other):
         """
         Recursively test equality to another PremisNode instance.
@@ -297,7 +440,9 @@ class PremisNode(object):
         for key in self.field_order:
             if key not in self.fields:
                 continue
-            values = [self.fields[x] for x in self.fields if x is key]
+            # Looked up by equality, field names unpickled in another
+            # process aren't the same str objects as those in field_order
+            values = [self.fields[key]]
             for value in values:
                 if isinstance(value, str):
                     e = ET.Element('premis:'+key)
@@ -323,6 +468,13 @@ class PremisNode(object):
 
 
 class ExtendedNode(PremisNode):
+    # Child elements not yet built into fields, see set_payload()
+    _payload = None
+    # The payload as .toXML() serializes it
+    _qualified = None
+    # Held while building the payload into fields, only while there is one
+    _payload_lock = None
+
     def __init__(self, rootName):
         """
         See documentation in PremisNode.__init__()
@@ -357,16 +509,70 @@ class ExtendedNode(PremisNode):
         """
         self._add_to_field(key, value, override)
 
+    @property
+    def fields(self):
+        lock = self._payload_lock
+        if lock is not None:
+            with lock:
+                # Another thread may have built them while this one waited
+                payload = self._payload
+                if payload is not None:
+                    # Imported here, factories imports this module
+                    from pypremis.factories import build_extension_fields
+                    fields = build_extension_fields(ExtendedNode('root'), payload).fields
+                    self._fields = fields
+                    self._payload = None
+                    self._qualified = None
+                    self._payload_lock = None
+        return self._fields
+
+    @fields.setter
+    def fields(self, value):
+        self._fields = value
+
+    def set_payload(self, payload):
+        """
+        Sets the node's content to opaque xml, which is emitted as is by
+        .toXML() and only built into fields the first time they are
+        accessed. Replaces any existing fields.
+
+        The elements are appended to the output of .toXML() rather than
+        copied, so they shouldn't be modified through it.
+
+        __Args__
+
+        1. payload (list): ET.Elements, the node's child elements
+        """
+        self._fields = OrderedDict()
+        self._payload = list(payload)
+        self._qualified = None
+        self._payload_lock = threading.Lock()
+
+    def get_payload(self):
+        """
+        returns the opaque children set with .set_payload(), or None if
+        there are none or they have since been built into fields.
+
+        __Returns__
+
+        * (list or None): ET.Elements
+        """
+        return self._payload
+
     def toXML(self):
         """
-        wraps ExtensionNode.toXML(). Temporarily sets self.name to include
-        premis: namespace.
+        wraps ExtensionNode.toXML(), naming the root element in the premis:
+        namespace.
         """
-        orig_name = self.name
-        self.name = 'premis:'+self.name
-        result = ExtensionNode.toXML(self)
-        self.name = orig_name
-        return result
+        if self._payload is not None:
+            root = ET.Element('premis:'+self.name)
+            payload = self._qualified
+            if payload is None:
+                # Worked out once, set_payload() resets it
+                payload = self._qualified = _qualify_elements(self._payload)
+            root.extend(payload)
+            return root
+        return ExtensionNode._toXML(self, 'premis:'+self.name)
 
 
 class ExtensionNode(PremisNode):
@@ -411,9 +617,13 @@ class ExtensionNode(PremisNode):
         return an ElementTree.Element object which models the node as xml.
         see PremisNode.toXML()
         """
-        root = ET.Element(self.name)
-        for key in self.fields:
-            value = self.fields[key]
+        return self._toXML(self.name)
+
+    def _toXML(self, name):
+        root = ET.Element(name)
+        for field in self.fields:
+            value = self.fields[field]
+            key = qualify(field)
             if isinstance(value, str):
                 e = ET.Element(key)
                 e.text = value
@@ -798,7 +1008,7 @@ class Object(PremisNode):
         root = ET.Element('premis:'+self.name)
         root.set("xsi:type", 'premis:'+self.get_objectCategory())
         for key in self.field_order:
-            if key is "objectCategory":
+            if key == "objectCategory":
                 continue
             if key not in self.fields:
                 continue
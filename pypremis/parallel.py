@@ -0,0 +1,146 @@
+import io
+import os
+from xml.sax.saxutils import quoteattr
+
+from pypremis.compression import detect
+from pypremis.factories import XMLNodeFactory
+from pypremis.source import scan
+
+
+"""
+### Building the entities of one PREMIS xml file in parallel ###
+
+The top level entities of a PREMIS record are independent of each other, so
+a large file can be split into runs of whole entities by byte range (see
+pypremis.source.scan()) and each run built in a separate process.
+
+1. **ParallelXMLNodeFactory** is an XMLNodeFactory whose .iter_entities()
+builds the file's entities in a pool of worker processes, yielding them in
+document order. Pass it to PremisRecord.populate_from_file() along with
+workers=n to use it.
+
+Splitting the file and pickling the built nodes back from the workers costs
+more than it saves on one core, and on small files. benchmarks.parallel
+compares it with a serial load, to check it's worthwhile on a given machine.
+"""
+
+
+# Files with fewer bytes than this per worker aren't worth splitting up
+MIN_CHUNK_SIZE = 256 * 1024
+
+
+def _build_chunk(path, start, end, prolog, epilog, opaque_extensions):
+    # Runs in the worker processes. Reads the entities between start and end
+    # and builds them inside a root element declaring the same namespaces as
+    # the file's own.
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    if len(data) != end - start:
+        raise ValueError("{} changed while it was being read".format(path))
+    factory = XMLNodeFactory(io.BytesIO(prolog + data + epilog),
+                             opaque_extensions=opaque_extensions)
+    return list(factory.iter_entities())
+
+
+class ParallelXMLNodeFactory(XMLNodeFactory):
+    """
+    An XMLNodeFactory which builds the entities of a file in worker
+    processes.
+
+    Only .iter_entities() runs in parallel. Files that can't be split (file
+    objects, compressed or UTF-16 files, files with empty entity elements) or
+    that are too small to be worth it are built serially, as are the other
+    methods.
+    """
+    def __init__(self, xmlfile, opaque_extensions=False, workers=None, chunk_size=None):
+        """
+        __Args__
+
+        1. xmlfile: the path to a PREMIS xml serialization on disk, or a file
+        object
+
+        __KWArgs__
+
+        * opaque_extensions (bool): see XMLNodeFactory
+        * workers (int): the number of worker processes. Defaults to the
+        number of cpus.
+        * chunk_size (int): roughly how many bytes of entities each worker
+        builds at a time. Defaults to splitting the file into four chunks per
+        worker, but no smaller than MIN_CHUNK_SIZE.
+        """
+        XMLNodeFactory.__init__(self, xmlfile, opaque_extensions=opaque_extensions)
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+
+    def _chunks(self):
+        # Returns (source, [(start, end)]) runs of whole entities, or None if
+        # the file can't be split
+        if not isinstance(self.xmlfile, str) or self.workers < 2 or \
+                detect(self.xmlfile) is not None:
+            return None
+        source = scan(self.xmlfile)
+        if source.utf16 or not source.entities or \
+                any(start is None for name, start, end in source.entities):
+            return None
+        first = source.entities[0][1]
+        last = source.entities[-1][2]
+        chunk_size = self.chunk_size
+        if chunk_size is None:
+            chunk_size = max((last - first) // (self.workers * 4), MIN_CHUNK_SIZE)
+        chunks = []
+        start = None
+        for name, entity_start, entity_end in source.entities:
+            if start is None:
+                start = entity_start
+            if entity_end - start >= chunk_size:
+                chunks.append((start, entity_end))
+                start = None
+        if start is not None:
+            chunks.append((start, last))
+        return source, chunks
+
+    def _wrapper(self, source):
+        # The xml declaration and a root element declaring the file's
+        # namespaces, and its end tag
+        prolog = ''
+        if source.encoding is not None:
+            prolog = '<?xml version="1.0" encoding={}?>'.format(quoteattr(source.encoding))
+        declarations = ''.join(
+            ' {}={}'.format('xmlns:' + prefix if prefix else 'xmlns', quoteattr(uri))
+            for prefix, uri in sorted(source.namespaces.items())
+        )
+        encoding = source.encoding or 'utf-8'
+        return ((prolog + '<chunk' + declarations + '>').encode(encoding),
+                '</chunk>'.encode(encoding))
+
+    def iter_entities(self):
+        """
+        Builds the top level entities of the record in worker processes and
+        yields them in document order.
+
+        __Returns__
+
+        * (generator): (name, PremisNode) tuples, where name is one of
+        'object', 'event', 'agent' or 'rights'
+        """
+        split = self._chunks()
+        if split is None or len(split[1]) < 2:
+            yield from XMLNodeFactory.iter_entities(self)
+            return
+        source, chunks = split
+        prolog, epilog = self._wrapper(source)
+        # Imported here, only parallel loads need it
+        from concurrent.futures import ProcessPoolExecutor
+        count = len(chunks)
+        with ProcessPoolExecutor(min(self.workers, count)) as pool:
+            results = pool.map(_build_chunk,
+                               [self.xmlfile] * count,
+                               [start for start, end in chunks],
+                               [end for start, end in chunks],
+                               [prolog] * count, [epilog] * count,
+                               [self.opaque_extensions] * count)
+            for entities in results:
+                yield from entities
+        if not source.is_current():
+            raise ValueError("{} changed while it was being read".format(self.xmlfile))
@@ -0,0 +1,350 @@
+import heapq
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from pypremis.lib import PremisRecord
+
+
+"""
+### Scheduling rolling fixity audits ###
+
+1. **AuditScheduler** indexes the most recent fixity check Event for every
+Object in a set of records and hands out batches of objects to verify,
+least recently verified first, within an I/O budget.
+2. **AuditItem** is a single object handed out by the scheduler.
+"""
+
+
+def parse_datetime(value):
+    """
+    Parse an eventDateTime value into a POSIX timestamp. Values without a
+    timezone are assumed to be UTC.
+
+    __Args__
+
+    1. value (str): the eventDateTime value
+
+    __Returns__
+
+    * (float or None): the timestamp, or None if the value couldn't be parsed
+    """
+    value = value.strip()
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _optional(getter, *args):
+    try:
+        return getter(*args)
+    except KeyError:
+        return None
+
+
+def _object_size(obj):
+    for characteristics in _optional(obj.get_objectCharacteristics) or []:
+        size = _optional(characteristics.get_size)
+        if size:
+            try:
+                return int(size)
+            except ValueError:
+                pass
+    return 0
+
+
+class AuditItem(object):
+    """
+    An object due for verification.
+
+    __Attributes__
+
+    1. record: the path (or key) of the record holding the object
+    2. identifierType: the objectIdentifierType the object is indexed by
+    3. identifierValue: the objectIdentifierValue the object is indexed by
+    4. size: the object's size in bytes, 0 if unknown
+    5. last_verified: the timestamp of the latest fixity check, 0 if never
+    """
+    def __init__(self, record, identifierType, identifierValue, size, last_verified):
+        self.record = record
+        self.identifierType = identifierType
+        self.identifierValue = identifierValue
+        self.size = size
+        self.last_verified = last_verified
+
+    def __repr__(self):
+        return "<AuditItem {} {}:{}>".format(self.record, self.identifierType,
+                                              self.identifierValue)
+
+
+class AuditScheduler(object):
+    """
+    A priority scheduler for rolling fixity audits.
+
+    The latest fixity check time of every object is kept in a SQLite index
+    along with the stat information of the record it came from, so repeat
+    calls to .scan() only reload records that have changed on disk. In memory
+    the objects are kept in a heap ordered by (last verified, size) which
+    .next_batch() pops from until the I/O budget is spent.
+
+    Objects handed out by .next_batch() aren't handed out again until they
+    are re-queued, either by .mark_verified() or by a scan picking up new
+    events for them.
+    """
+    def __init__(self, path=':memory:', eventType='fixity check'):
+        """
+        __KWArgs__
+
+        * path (str): the location of the sqlite index. Defaults to an in
+        memory database.
+        * eventType (str): the eventType that counts as a verification
+        """
+        self.path = path
+        self.eventType = eventType
+        self._lock = threading.Lock()
+        self._heap = []
+        self._current = {}
+        self._seq = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "record TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER);"
+            "CREATE TABLE IF NOT EXISTS objects ("
+            "record TEXT NOT NULL, identifierType TEXT NOT NULL, "
+            "identifierValue TEXT NOT NULL, size INTEGER NOT NULL, "
+            "last_verified REAL NOT NULL, "
+            "PRIMARY KEY (record, identifierType, identifierValue));"
+        )
+        self._conn.commit()
+        for row in self._conn.execute("SELECT * FROM objects"):
+            self._push(row[:3], row[4], row[3])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._current)
+
+    def _push(self, key, last_verified, size):
+        self._seq += 1
+        self._current[key] = self._seq
+        heapq.heappush(self._heap, (last_verified, size, self._seq, key))
+
+    def scan(self, records):
+        """
+        Index the fixity check events in a set of records. Records given as
+        paths are skipped if their size and mtime haven't changed since they
+        were last indexed.
+
+        Objects are filed under their record's key, which has to stay the
+        same from one run to the next: a path, the path a PremisRecord was
+        read from, or a key given along with the record.
+
+        __Args__
+
+        1. records (iterable): paths to premis xml files, PremisRecords read
+        from a path, or (key, PremisRecord) tuples
+
+        __Returns__
+
+        * (int): the number of records that were (re)indexed
+        """
+        count = 0
+        for record in records:
+            if isinstance(record, tuple):
+                key, record = record
+                self.index_record(key, record)
+                count += 1
+                continue
+            if isinstance(record, PremisRecord):
+                key = record.get_filepath()
+                if not isinstance(key, str):
+                    raise ValueError("A PremisRecord without a path needs a key, "
+                                     "pass it as a (key, record) tuple")
+                self.index_record(key, record)
+                count += 1
+                continue
+            st = os.stat(record)
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT size, mtime_ns FROM records WHERE record = ?", (record,)
+                ).fetchone()
+            if row is not None and tuple(row) == (st.st_size, st.st_mtime_ns):
+                continue
+            self.index_record(record, PremisRecord(frompath=record),
+                              stat=(st.st_size, st.st_mtime_ns))
+            count += 1
+        return count
+
+    def index_record(self, key, record, stat=None):
+        """
+        (Re)index the objects in a single record.
+
+        __Args__
+
+        1. key (str): the name to file the record's objects under, usually
+        its path
+        2. record (PremisRecord): the record
+
+        __KWArgs__
+
+        * stat (tuple): the (size, mtime_ns) of the record's file, used to
+        skip it in future scans if it hasn't changed
+        """
+        objects = {}
+        lookup = {}
+        for obj in record.get_object_list():
+            identifiers = [(x.get_objectIdentifierType(), x.get_objectIdentifierValue())
+                           for x in obj.get_objectIdentifier()]
+            entry = [identifiers[0], _object_size(obj), 0.0]
+            objects[identifiers[0]] = entry
+            for identifier in identifiers:
+                lookup[identifier] = entry
+
+        # The eventDateTime index: for every object the newest fixity check
+        # linking to it.
+        for event in record.get_event_list():
+            if event.get_eventType() != self.eventType:
+                continue
+            when = parse_datetime(event.get_eventDateTime())
+            if when is None:
+                continue
+            for link in _optional(event.get_linkingObjectIdentifier) or []:
+                entry = lookup.get((link.get_linkingObjectIdentifierType(),
+                                    link.get_linkingObjectIdentifierValue()))
+                if entry is not None and when > entry[2]:
+                    entry[2] = when
+
+        with self._lock:
+            stale = self._conn.execute(
+                "SELECT identifierType, identifierValue FROM objects WHERE record = ?", (key,)
+            ).fetchall()
+            for identifier in stale:
+                self._current.pop((key,) + tuple(identifier), None)
+            self._conn.execute("DELETE FROM objects WHERE record = ?", (key,))
+            self._conn.executemany(
+                "INSERT INTO objects VALUES (?, ?, ?, ?, ?)",
+                [(key, x[0][0], x[0][1], x[1], x[2]) for x in objects.values()]
+            )
+            if stat is not None:
+                self._conn.execute("INSERT OR REPLACE INTO records VALUES (?, ?, ?)",
+                                   (key,) + tuple(stat))
+            self._conn.commit()
+            for identifier, size, last_verified in objects.values():
+                self._push((key,) + identifier, last_verified, size)
+
+    def mark_verified(self, record, identifierType, identifierValue, when=None):
+        """
+        Record that an object was verified and queue it again behind
+        everything verified before it.
+
+        __Args__
+
+        1. record (str): the key the object's record was indexed under
+        2. identifierType (str): the object's objectIdentifierType
+        3. identifierValue (str): the object's objectIdentifierValue
+
+        __KWArgs__
+
+        * when (float): the timestamp of the verification, defaults to now
+        """
+        if when is None:
+            when = time.time()
+        key = (record, identifierType, identifierValue)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size FROM objects WHERE record = ? AND identifierType = ? "
+                "AND identifierValue = ?", key
+            ).fetchone()
+            if row is None:
+                raise KeyError(key)
+            self._conn.execute(
+                "UPDATE objects SET last_verified = ? WHERE record = ? AND "
+                "identifierType = ? AND identifierValue = ?", (when,) + key
+            )
+            self._conn.commit()
+            self._push(key, when, row[0])
+
+    def forget(self, key):
+        """
+        Drop a record's objects from the index, eg once the record has been
+        deleted.
+
+        __Args__
+
+        1. key (str): the key the record was indexed under
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT identifierType, identifierValue FROM objects WHERE record = ?", (key,)
+            ).fetchall()
+            for identifier in rows:
+                self._current.pop((key,) + tuple(identifier), None)
+            self._conn.execute("DELETE FROM objects WHERE record = ?", (key,))
+            self._conn.execute("DELETE FROM records WHERE record = ?", (key,))
+            self._conn.commit()
+
+    def prune(self):
+        """
+        Drop the objects of records indexed from paths which no longer exist.
+        Records indexed under keys of their own are left alone, see forget().
+
+        __Returns__
+
+        * (list): the keys of the records dropped
+        """
+        with self._lock:
+            keys = [x[0] for x in self._conn.execute("SELECT record FROM records")]
+        missing = [x for x in keys if not os.path.exists(x)]
+        for key in missing:
+            self.forget(key)
+        return missing
+
+    def next_batch(self, budget):
+        """
+        Pop the objects most in need of verification, oldest first, until
+        their combined size would exceed the budget. At least one object is
+        always returned if any are queued, so objects larger than the budget
+        still get their turn.
+
+        __Args__
+
+        1. budget (int): the number of bytes that may be read
+
+        __Returns__
+
+        * (list): AuditItems
+        """
+        batch = []
+        spent = 0
+        with self._lock:
+            while self._heap:
+                last_verified, size, seq, key = self._heap[0]
+                if self._current.get(key) != seq:
+                    # Superseded by a later push, or already handed out
+                    heapq.heappop(self._heap)
+                    continue
+                if batch and spent + size > budget:
+                    break
+                heapq.heappop(self._heap)
+                del self._current[key]
+                spent += size
+                batch.append(AuditItem(key[0], key[1], key[2], size, last_verified))
+        return batch
+
+    def close(self):
+        """
+        Close the underlying database connection.
+        """
+        self._conn.close()
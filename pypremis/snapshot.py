@@ -0,0 +1,438 @@
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from collections import OrderedDict
+
+from pypremis import nodes
+from pypremis.lib import PremisRecord
+from pypremis.nodes import PremisNode, _get_class_info
+
+
+"""
+### Binary snapshots of PREMIS records ###
+
+A snapshot holds a record in a form that loads in about half the time of
+parsing its xml, for caching records which are reloaded often. Snapshots are tied to this
+library's node classes, they aren't an interchange format (see
+pypremis.jsonform for that).
+
+A snapshot file, all integers little endian, is laid out as:
+
+1. A header: the magic bytes b'PREMISSN', the format version (u16), flags
+(u16, unused), the number of entities (u32), the offsets of the string
+table (u64) and the directory (u64), and the schema hash (8 bytes), see
+schema_hash().
+2. The entities, each a block of its length in bytes (u32) followed by that
+many bytes of u32 words encoding the node, see below.
+3. The string table: the number of strings (u32), the length of their
+utf-8 encoding in bytes (u32), and the strings joined by NUL characters.
+Every string in the record (field values, identifier types, event types,
+agent roles, extension element names, ...) is stored once, and entities
+refer to them by index.
+4. The directory: for each entity in order, the offset of its block (u64),
+its kind (u32, 0 object, 1 event, 2 agent, 3 rights) and the number of its
+identifier keys (u32), followed by the string indices of every entity's keys
+(u32 each) in the same order. The keys are those PremisRecord indexes nodes
+by, so entities can be looked up and loaded without decoding the others.
+
+A node is encoded as the string indices of its class name and its name,
+its number of fields, then each field as a key word and a value. The key
+word is the field's position in its class's field_order shifted left one
+bit, or a string index shifted left one bit with the low bit set for fields
+outside field_order (extension content). A value is one word, whose low two
+bits say what it is: 0, a string whose index is the rest of the word; 1, a
+node, encoded as above in the following words; 2, a list whose length is
+the rest of the word, followed by its items.
+
+1. **write_snapshot()** writes a record to a snapshot file.
+PremisRecord.to_snapshot() wraps it.
+2. **Snapshot** reads a snapshot file, loading all its entities or just the
+ones asked for. PremisRecord.from_snapshot() wraps it.
+"""
+
+
+MAGIC = b'PREMISSN'
+VERSION = 2
+
+HEADER = struct.Struct('<8sHHIQQ8s')
+BLOCK_LENGTH = struct.Struct('<I')
+STRINGS = struct.Struct('<II')
+DIRECTORY_ENTRY = struct.Struct('<QII')
+
+KINDS = ('object', 'event', 'agent', 'rights')
+
+_STRING = 0
+_NODE = 1
+_LIST = 2
+
+
+class SnapshotError(ValueError):
+    """Raised when a file isn't a snapshot this version can read"""
+
+
+class _Encoder(object):
+    # Encodes nodes as lists of words, collecting their strings in a table
+    def __init__(self):
+        self.strings = []
+        self.indexes = {}
+
+    def string(self, value):
+        index = self.indexes.get(value)
+        if index is None:
+            if '\0' in value:
+                raise SnapshotError("Strings in snapshots can't contain NUL characters")
+            index = self.indexes[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+    def node(self, node, words):
+        cls = type(node)
+        positions = _get_class_info(cls)[0]
+        fields = node.fields
+        words.append(self.string(cls.__name__))
+        words.append(self.string(node.name))
+        words.append(len(fields))
+        for key, value in fields.items():
+            position = positions.get(key)
+            if position is None:
+                words.append(self.string(key) << 1 | 1)
+            else:
+                words.append(position << 1)
+            self.value(value, words)
+
+    def value(self, value, words):
+        if isinstance(value, str):
+            words.append(self.string(value) << 2)
+        elif isinstance(value, PremisNode):
+            words.append(_NODE)
+            self.node(value, words)
+        elif isinstance(value, list):
+            words.append(len(value) << 2 | _LIST)
+            for item in value:
+                self.value(item, words)
+        else:
+            raise SnapshotError("Can't store a {} in a snapshot".format(type(value).__name__))
+
+
+_schema_hash = None
+
+
+def schema_hash():
+    """
+    Hashes the node classes as snapshots encode them: every PremisNode
+    class's name, field_order and the attribute holding its fields. Snapshots
+    store fields by their position in field_order, so one written against
+    different classes can't be read back, and is refused.
+
+    __Returns__
+
+    * (bytes): the first 8 bytes of the sha256 of the schema
+    """
+    global _schema_hash
+    if _schema_hash is None:
+        classes = []
+        for name, cls in vars(nodes).items():
+            if isinstance(cls, type) and issubclass(cls, PremisNode) and cls.__name__ == name:
+                classes.append((name, tuple(cls.field_order), _get_class_info(cls)[2]))
+        _schema_hash = hashlib.sha256(repr(sorted(classes)).encode('utf-8')).digest()[:8]
+    return _schema_hash
+
+
+def _entity_keys(nodeset):
+    # The identifier keys of each node in a NodeSet, by index
+    keys = [[] for _ in range(len(nodeset))]
+    for key, index in nodeset.identifiers.items():
+        keys[index].append(key)
+    return keys
+
+
+def write_snapshot(record, path):
+    """
+    Writes a record to a snapshot file. The file is replaced atomically.
+
+    __Args__
+
+    1. record (PremisRecord): the record
+    2. path (str): where to write the snapshot
+    """
+    encoder = _Encoder()
+    directory = []
+    key_indexes = []
+    directory_name = os.path.dirname(os.path.abspath(path))
+    handle, tmp_path = tempfile.mkstemp(dir=directory_name, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            f.write(bytes(HEADER.size))
+            nodesets = (record.objects_list, record.events_list,
+                        record.agents_list, record.rights_list)
+            for kind, nodeset in enumerate(nodesets):
+                for node, keys in zip(nodeset.get_nodes(), _entity_keys(nodeset)):
+                    words = []
+                    encoder.node(node, words)
+                    block = struct.pack('<{}I'.format(len(words)), *words)
+                    directory.append((f.tell(), kind, len(keys)))
+                    key_indexes.extend(encoder.string(key) for key in keys)
+                    f.write(BLOCK_LENGTH.pack(len(block)))
+                    f.write(block)
+            strings_offset = f.tell()
+            data = '\0'.join(encoder.strings).encode('utf-8')
+            f.write(STRINGS.pack(len(encoder.strings), len(data)))
+            f.write(data)
+            directory_offset = f.tell()
+            for entry in directory:
+                f.write(DIRECTORY_ENTRY.pack(*entry))
+            f.write(struct.pack('<{}I'.format(len(key_indexes)), *key_indexes))
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, 0, len(directory),
+                                strings_offset, directory_offset, schema_hash()))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class Snapshot(object):
+    """
+    A snapshot file opened for reading.
+
+    The header, string table and directory are read when it's opened, and
+    entities are decoded as they're asked for.
+
+    __Attributes__
+
+    1. path: the snapshot file
+    2. identifiers: a dict of identifier keys (as PremisRecord indexes them)
+    mapped to the position of their entity in the snapshot
+    """
+    def __init__(self, path, use_mmap=False):
+        """
+        __Args__
+
+        1. path (str): the snapshot file
+
+        __KWArgs__
+
+        * use_mmap (bool): map the file into memory rather than reading it
+        all in, which is cheaper when only a few entities are loaded from a
+        large snapshot
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            if use_mmap:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._data = f.read()
+        try:
+            self._read_index()
+        except BaseException:
+            self.close()
+            raise
+        self._classes = {}
+
+    def _read_index(self):
+        data = self._data
+        if len(data) < HEADER.size:
+            raise SnapshotError("{} isn't a snapshot".format(self.path))
+        magic, version, flags, count, strings_offset, directory_offset, schema = \
+            HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise SnapshotError("{} isn't a snapshot".format(self.path))
+        if version != VERSION:
+            raise SnapshotError("{} is a version {} snapshot, only version {} can be read".format(
+                self.path, version, VERSION))
+        if schema != schema_hash():
+            raise SnapshotError("{} was written with different node classes, it has to be "
+                                "rebuilt from the record".format(self.path))
+        try:
+            string_count, length = STRINGS.unpack_from(data, strings_offset)
+            start = strings_offset + STRINGS.size
+            strings = bytes(data[start:start + length]).decode('utf-8').split('\0')
+            if len(strings) != string_count and string_count:
+                raise SnapshotError("{} has a damaged string table".format(self.path))
+            self._strings = [sys.intern(x) for x in strings]
+            entries = [DIRECTORY_ENTRY.unpack_from(data, directory_offset + i * DIRECTORY_ENTRY.size)
+                       for i in range(count)]
+            keys_offset = directory_offset + count * DIRECTORY_ENTRY.size
+            key_count = sum(entry[2] for entry in entries)
+            key_indexes = struct.unpack_from('<{}I'.format(key_count), data, keys_offset)
+        except (struct.error, UnicodeDecodeError):
+            raise SnapshotError("{} is truncated or damaged".format(self.path))
+        self._entries = entries
+        self._keys = []
+        self.identifiers = {}
+        position = 0
+        for index, (offset, kind, number) in enumerate(entries):
+            keys = [self._strings[x] for x in key_indexes[position:position + number]]
+            position += number
+            self._keys.append(keys)
+            for key in keys:
+                self.identifiers[key] = index
+
+    def close(self):
+        """
+        Closes the snapshot. Nodes already loaded from it stay usable.
+        """
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _class(self, index):
+        # (class, field_order, attribute holding its fields) for the class
+        # named by a string index
+        info = self._classes.get(index)
+        if info is None:
+            cls = getattr(nodes, self._strings[index], None)
+            if not (isinstance(cls, type) and issubclass(cls, PremisNode)):
+                raise SnapshotError("{} names an unknown node class {}".format(
+                    self.path, self._strings[index]))
+            info = self._classes[index] = (cls, cls.field_order, _get_class_info(cls)[2])
+        return info
+
+    def _decode_node(self, words, pos):
+        # Returns the node starting at words[pos] and the position after it.
+        # Strings, most values, are decoded inline rather than by
+        # ._decode_value().
+        strings = self._strings
+        info = self._classes.get(words[pos]) or self._class(words[pos])
+        cls, field_order, attribute = info
+        node = cls.__new__(cls)
+        state = node.__dict__
+        state['name'] = strings[words[pos + 1]]
+        count = words[pos + 2]
+        pos += 3
+        fields = OrderedDict()
+        for _ in range(count):
+            key = words[pos]
+            key = strings[key >> 1] if key & 1 else field_order[key >> 1]
+            word = words[pos + 1]
+            if word & 3 == _STRING:
+                fields[key] = strings[word >> 2]
+                pos += 2
+            else:
+                fields[key], pos = self._decode_value(words, pos + 1)
+        state[attribute] = fields
+        return node, pos
+
+    def _decode_value(self, words, pos):
+        word = words[pos]
+        kind = word & 3
+        if kind == _STRING:
+            return self._strings[word >> 2], pos + 1
+        if kind == _NODE:
+            return self._decode_node(words, pos + 1)
+        strings = self._strings
+        values = []
+        pos += 1
+        for _ in range(word >> 2):
+            word = words[pos]
+            if word & 3 == _STRING:
+                values.append(strings[word >> 2])
+                pos += 1
+            else:
+                value, pos = self._decode_value(words, pos)
+                values.append(value)
+        return values, pos
+
+    def entity(self, index):
+        """
+        Decodes one entity.
+
+        __Args__
+
+        1. index (int): the entity's position in the snapshot
+
+        __Returns__
+
+        * (tuple): (name, PremisNode), where name is one of 'object',
+        'event', 'agent' or 'rights'
+        """
+        offset, kind, number = self._entries[index]
+        try:
+            length = BLOCK_LENGTH.unpack_from(self._data, offset)[0]
+            words = struct.unpack_from('<{}I'.format(length // 4), self._data,
+                                       offset + BLOCK_LENGTH.size)
+            node, pos = self._decode_node(words, 0)
+        except (struct.error, IndexError):
+            raise SnapshotError("{} is truncated or damaged".format(self.path))
+        return KINDS[kind], node
+
+    def get(self, identifier):
+        """
+        Decodes the entity with an identifier.
+
+        __Args__
+
+        1. identifier: an identifier key (as PremisRecord indexes them), or
+        the identifier node itself, eg an EventIdentifier
+
+        __Returns__
+
+        * (PremisNode): the entity, or None if the snapshot has no entity
+        with that identifier
+        """
+        if isinstance(identifier, PremisNode):
+            identifier = repr(identifier)
+        index = self.identifiers.get(identifier)
+        if index is None:
+            return None
+        return self.entity(index)[1]
+
+    def _indexes(self, identifiers):
+        if identifiers is None:
+            return range(len(self._entries))
+        indexes = set()
+        for identifier in identifiers:
+            if isinstance(identifier, PremisNode):
+                identifier = repr(identifier)
+            if identifier not in self.identifiers:
+                raise KeyError(identifier)
+            indexes.add(self.identifiers[identifier])
+        return sorted(indexes)
+
+    def iter_entities(self, identifiers=None):
+        """
+        Decodes the snapshot's entities one at a time, in order.
+
+        __KWArgs__
+
+        * identifiers (list): only decode the entities with these
+        identifiers (keys or identifier nodes, see .get())
+
+        __Returns__
+
+        * (generator): (name, PremisNode) tuples
+        """
+        for index in self._indexes(identifiers):
+            yield self.entity(index)
+
+    def to_record(self, identifiers=None):
+        """
+        Builds a record from the snapshot's entities.
+
+        __KWArgs__
+
+        * identifiers (list): only include the entities with these
+        identifiers (keys or identifier nodes, see .get())
+
+        __Returns__
+
+        * (PremisRecord): the record
+        """
+        record = PremisRecord._empty()
+        nodesets = (record.objects_list, record.events_list,
+                    record.agents_list, record.rights_list)
+        for index in self._indexes(identifiers):
+            kind = self._entries[index][1]
+            nodesets[kind].append(self.entity(index)[1], keys=self._keys[index])
+        return record
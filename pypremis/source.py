@@ -0,0 +1,227 @@
+import os
+from xml.parsers import expat
+
+from pypremis.nodes import ExtendedNode, PremisNode
+
+
+"""
+### Locating the source bytes of entities in PREMIS xml files ###
+
+1. **scan()** makes a single expat pass over a PREMIS xml file and returns a
+SourceMap recording where the root tag and each top level entity (object,
+event, agent, rights) start and end in the file, without building anything.
+2. **SourceMap** holds the results, and can tell whether the file has
+changed since it was scanned.
+3. **fingerprint()** summarises the content of a PremisNode so that later
+modifications to it can be detected.
+"""
+
+
+PREMIS_NS = "http://www.loc.gov/premis/v3"
+XSI_NS = "http://www.w3.org/2001/XMLSchema-instance"
+
+ENTITY_NAMES = ('object', 'event', 'agent', 'rights')
+
+
+class SourceMap(object):
+    """
+    The layout of a PREMIS xml file.
+
+    __Attributes__
+
+    1. path: the file's location
+    2. stat: the (size, mtime_ns) of the file when it was scanned
+    3. root_start: the offset of the root element's start tag
+    4. root_start_end: the offset just past the root element's start tag
+    5. root_end: the offset of the root element's end tag, or None if the
+    root element is empty (<premis:premis/>)
+    6. namespaces: the prefixes declared on the root element, mapped to their
+    namespace names. The default namespace is under ''.
+    7. entities: (name, start, end) tuples for each top level entity, in
+    document order. start and end are None for entities whose extent
+    couldn't be determined.
+    8. encoding: the encoding named in the xml declaration, if any
+    """
+    def __init__(self, path):
+        self.path = path
+        self.stat = None
+        self.root_start = None
+        self.root_start_end = None
+        self.root_end = None
+        self.namespaces = {}
+        self.entities = []
+        self.encoding = None
+        self.utf16 = False
+
+    def is_current(self):
+        """
+        Checks whether the file is unchanged since it was scanned.
+
+        __Returns__
+
+        * (bool): True if the file's size and mtime are as they were
+        """
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        return (st.st_size, st.st_mtime_ns) == self.stat
+
+    def is_spliceable(self):
+        """
+        Checks whether newly serialized entities can be spliced in between
+        the file's own bytes: the file must be UTF-8, declare the premis and
+        xsi prefixes the way PremisNode.toXML() uses them on its root, and
+        have a root element with an end tag.
+
+        __Returns__
+
+        * (bool): a bool denoting whether the file can be spliced into
+        """
+        return (
+            not self.utf16 and
+            (self.encoding is None or self.encoding.lower().replace('_', '-') in ('utf-8', 'utf8')) and
+            self.namespaces.get('premis') == PREMIS_NS and
+            self.namespaces.get('xsi') == XSI_NS and
+            self.root_end is not None
+        )
+
+
+def _declarations(attrs):
+    result = {}
+    for key, value in attrs.items():
+        if key == 'xmlns':
+            result[''] = value
+        elif key.startswith('xmlns:'):
+            result[key[len('xmlns:'):]] = value
+    return result
+
+
+def _tag_end(f, offset):
+    """
+    Find the offset just past the tag starting at offset, skipping over
+    quoted attribute values.
+    """
+    f.seek(offset)
+    quote = None
+    position = offset
+    while True:
+        chunk = f.read(512)
+        if not chunk:
+            return None
+        for i, byte in enumerate(chunk):
+            if quote is not None:
+                if byte == quote:
+                    quote = None
+            elif byte in (0x22, 0x27):  # " and '
+                quote = byte
+            elif byte == 0x3e:  # >
+                return position + i + 1
+        position += len(chunk)
+
+
+def scan(path):
+    """
+    Locate the root tag and top level entities of a PREMIS xml file.
+
+    __Args__
+
+    1. path (str): the location of the file
+
+    __Returns__
+
+    * (SourceMap): the file's layout
+    """
+    result = SourceMap(path)
+    st = os.stat(path)
+    result.stat = (st.st_size, st.st_mtime_ns)
+    parser = expat.ParserCreate()
+    # Ends are recorded as the offset of the end tag and resolved to the
+    # offset past it once parsing is done
+    pending = []
+    state = {'depth': 0}
+
+    def start(name, attrs):
+        depth = state['depth']
+        state['depth'] = depth + 1
+        if depth == 0:
+            result.root_start = parser.CurrentByteIndex
+            result.namespaces = _declarations(attrs)
+        elif depth == 1:
+            prefix, _, local = name.rpartition(':')
+            namespaces = result.namespaces
+            if 'xmlns' in attrs or 'xmlns:' + prefix in attrs:
+                namespaces = dict(namespaces, **_declarations(attrs))
+            if local in ENTITY_NAMES and namespaces.get(prefix) == PREMIS_NS:
+                state['entity'] = [local, parser.CurrentByteIndex]
+                pending.append(state['entity'])
+            else:
+                state['entity'] = None
+
+    def end(name):
+        state['depth'] -= 1
+        depth = state['depth']
+        if depth == 0:
+            result.root_end = parser.CurrentByteIndex
+        elif depth == 1 and state.get('entity') is not None:
+            state['entity'].append(parser.CurrentByteIndex)
+            state['entity'] = None
+
+    def declaration(version, encoding, standalone):
+        result.encoding = encoding
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.XmlDeclHandler = declaration
+
+    with open(path, 'rb') as f:
+        head = f.read(2)
+        result.utf16 = head in (b'\xff\xfe', b'\xfe\xff')
+        f.seek(0)
+        parser.ParseFile(f)
+
+        result.root_start_end = _tag_end(f, result.root_start)
+        if result.root_end == result.root_start:
+            # <premis:premis ... />
+            result.root_end = None
+        for name, start_offset, end_offset in pending:
+            if end_offset == start_offset:
+                # An empty element, there's nothing to preserve
+                result.entities.append((name, None, None))
+            else:
+                result.entities.append((name, start_offset, _tag_end(f, end_offset)))
+    return result
+
+
+def fingerprint(node):
+    """
+    Summarise the content of a PremisNode and everything below it. Two nodes
+    with the same fingerprint have the same content, barring hash collisions.
+
+    Extension content that hasn't been built yet (see
+    ExtendedNode.set_payload()) is summarised by identity rather than built.
+
+    __Args__
+
+    1. node (PremisNode): the node
+
+    __Returns__
+
+    * (int): the fingerprint
+    """
+    return hash(_summary(node))
+
+
+def _summary(node):
+    if isinstance(node, ExtendedNode) and node.get_payload() is not None:
+        return (node.name, '<payload>', id(node.get_payload()))
+    parts = [node.name]
+    for key, value in node.fields.items():
+        parts.append(key)
+        if isinstance(value, list):
+            parts.append(tuple(_summary(x) if isinstance(x, PremisNode) else x for x in value))
+        elif isinstance(value, PremisNode):
+            parts.append(_summary(value))
+        else:
+            parts.append(value)
+    return tuple(parts)
@@ -0,0 +1,137 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from pypremis import aio
+from pypremis.compression import detect
+from pypremis.lib import PremisRecord
+from pypremis.nodes import *
+
+
+class AioTestCase(unittest.TestCase):
+    """Tests for the asyncio interfaces
+
+    Uses kitchen-sink.xml, so should be run from the 'tests' directory.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'premis.xml')
+        shutil.copy('kitchen-sink.xml', self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def event(self, value):
+        return Event(EventIdentifier('uuid', value), 'virus check', '2020-01-01T00:00:00')
+
+    def test_load_save(self):
+        async def main():
+            record = await aio.load(self.path)
+            record.add_event(self.event('a'))
+            out = os.path.join(self.tmpdir, 'out.xml')
+            await aio.save(record, out)
+            return record, await aio.load(out)
+        record, saved = asyncio.run(main())
+        self.assertEqual(record, saved)
+        self.assertEqual(os.listdir(self.tmpdir).count('out.xml'), 1)
+        self.assertEqual(len(os.listdir(self.tmpdir)), 2)
+
+    def test_save_in_place(self):
+        async def main():
+            record = await aio.load(self.path, preserve_source=True)
+            record.add_event(self.event('a'))
+            await aio.save(record, self.path)
+            return record
+        record = asyncio.run(main())
+        self.assertEqual(PremisRecord(frompath=self.path), record)
+        self.assertTrue(record._source.is_current())
+
+    def test_save_keeps_compression(self):
+        PremisRecord(frompath=self.path).write_to_file(self.path, compression='gz')
+
+        async def main():
+            record = await aio.load(self.path)
+            record.add_event(self.event('a'))
+            await aio.save(record, self.path)
+            return record
+        record = asyncio.run(main())
+        self.assertEqual(detect(self.path), 'gz')
+        self.assertEqual(PremisRecord(frompath=self.path), record)
+
+    def test_iterators(self):
+        async def main():
+            names = [name async for name, node in aio.iter_entities(self.path, chunk_size=5)]
+            events = [node async for node in aio.iter_events(self.path)]
+            return names, events
+        names, events = asyncio.run(main())
+        self.assertEqual(len(names), 29)
+        self.assertEqual(events, PremisRecord(frompath=self.path).get_event_list())
+
+    def test_early_exit(self):
+        async def main():
+            async for node in aio.iter_objects(self.path, chunk_size=1):
+                return node
+        self.assertIsInstance(asyncio.run(main()), Object)
+
+    def test_bounded(self):
+        executor = aio.AsyncExecutor(max_workers=2, max_pending=3)
+        lock = threading.Lock()
+        state = {'running': 0, 'most': 0}
+
+        def job():
+            with lock:
+                state['running'] += 1
+                state['most'] = max(state['most'], state['running'])
+            threading.Event().wait(0.01)
+            with lock:
+                state['running'] -= 1
+
+        async def main():
+            await asyncio.gather(*[executor.run(job) for x in range(20)])
+        asyncio.run(main())
+        executor.shutdown()
+        self.assertEqual(state['most'], 2)
+
+    def test_cancelled_save(self):
+        record = PremisRecord(frompath=self.path)
+        record.add_event(self.event('a'))
+        with open(self.path, 'rb') as f:
+            original = f.read()
+        started = threading.Event()
+        release = threading.Event()
+        executor = aio.AsyncExecutor(max_workers=1)
+
+        def block():
+            started.set()
+            release.wait()
+
+        async def main():
+            blocker = asyncio.ensure_future(executor.run(block))
+            while not started.is_set():
+                await asyncio.sleep(0.001)
+            task = asyncio.ensure_future(aio.save(record, self.path, executor=executor))
+            while executor.pending < 2:
+                await asyncio.sleep(0.001)
+            task.cancel()
+            # Wait for the cancellation to reach the queued job, which
+            # can't start while block() holds the only thread
+            while executor.cancelled < 1:
+                await asyncio.sleep(0.001)
+            release.set()
+            await blocker
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        asyncio.run(main())
+        executor.shutdown()
+        self.assertEqual((executor.pending, executor.cancelled), (0, 1))
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), original)
+        self.assertEqual(os.listdir(self.tmpdir), ['premis.xml'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import gzip
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from pypremis.archives import iter_members, iter_records, load_archives
+from pypremis.lib import PremisRecord
+
+
+class ArchivesTestCase(unittest.TestCase):
+    """Tests for loading records from zip and tar packages
+
+    Uses kitchen-sink.xml, so should be run from the 'tests' directory.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.record = PremisRecord(frompath='kitchen-sink.xml')
+        with open('kitchen-sink.xml', 'rb') as f:
+            self.data = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_zip(self, name, members):
+        path = os.path.join(self.tmpdir, name)
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+            for member, data in members.items():
+                z.writestr(member, data)
+        return path
+
+    def make_tar(self, name, members, mode='w:gz'):
+        path = os.path.join(self.tmpdir, name)
+        with tarfile.open(path, mode) as t:
+            for member, data in members.items():
+                info = tarfile.TarInfo(member)
+                info.size = len(data)
+                t.addfile(info, io.BytesIO(data))
+        return path
+
+    def test_zip(self):
+        path = self.make_zip('aip.zip', {
+            'aip/data/file.txt': b'not premis',
+            'aip/metadata/premis.xml': self.data,
+            'metadata/premis.xml': self.data,
+        })
+        records = list(iter_records(path))
+        self.assertEqual([name for name, record in records],
+                         ['aip/metadata/premis.xml', 'metadata/premis.xml'])
+        for name, record in records:
+            self.assertEqual(record, self.record)
+
+    def test_tar(self):
+        for mode in ('w', 'w:gz', 'w:xz', 'w:bz2'):
+            path = self.make_tar('aip.tar', {'aip/metadata/premis.xml': self.data}, mode)
+            [(name, record)] = list(iter_records(path, lazy=True))
+            self.assertEqual(name, 'aip/metadata/premis.xml')
+            self.assertEqual(record, self.record)
+
+    def test_patterns(self):
+        path = self.make_zip('aip.zip', {
+            'aip/metadata/premis.xml': self.data,
+            'aip/metadata/premis-2.xml.gz': gzip.compress(self.data),
+        })
+        names = [name for name, f in iter_members(path, patterns='*/premis-*.xml.gz')]
+        self.assertEqual(names, ['aip/metadata/premis-2.xml.gz'])
+        records = list(iter_records(path, patterns=['*premis*']))
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[1][1], self.record)
+
+    def test_not_an_archive(self):
+        with self.assertRaises(ValueError):
+            list(iter_members('kitchen-sink.xml'))
+
+    def test_load_archives(self):
+        paths = [self.make_zip('a.zip', {'a/metadata/premis.xml': self.data}),
+                 self.make_tar('b.tar.gz', {'b/metadata/premis.xml': self.data}),
+                 self.make_zip('c.zip', {'c/data/file.txt': b'no premis'})]
+        for workers in (None, 2):
+            results = list(load_archives(paths, workers=workers, opaque_extensions=True))
+            self.assertEqual([(archive, name) for archive, name, record in results],
+                             [(paths[0], 'a/metadata/premis.xml'),
+                              (paths[1], 'b/metadata/premis.xml')])
+            for archive, name, record in results:
+                self.assertEqual(record.to_xml(), self.record.to_xml())
+
+
+if __name__ == '__main__':
+    unittest.main()
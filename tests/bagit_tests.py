@@ -0,0 +1,100 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from pypremis import bagit
+
+
+class BagItTestCase(unittest.TestCase):
+    """Tests for building Object nodes from BagIt manifests"""
+
+    def setUp(self):
+        # The bag is a subdirectory, so there's room for files outside it
+        self.tmpdir = tempfile.mkdtemp()
+        self.bag = os.path.join(self.tmpdir, 'bag')
+        os.makedirs(os.path.join(self.bag, 'data', 'sub'))
+        self.payload = {
+            'data/a.txt': b'first file',
+            'data/sub/b c.pdf': b'%PDF-1.4',
+        }
+        sha256 = []
+        md5 = []
+        for name, data in self.payload.items():
+            with open(os.path.join(self.bag, *name.split('/')), 'wb') as f:
+                f.write(data)
+            sha256.append("{}  {}\n".format(hashlib.sha256(data).hexdigest(), name))
+            md5.append("{} {}\n".format(hashlib.md5(data).hexdigest(), name))
+        self.write('bagit.txt', "BagIt-Version: 1.0\nTag-File-Character-Encoding: UTF-8\n")
+        self.write('manifest-sha256.txt', "".join(sha256))
+        self.write('manifest-md5.txt', "".join(md5))
+        with open(os.path.join(self.bag, 'bagit.txt'), 'rb') as f:
+            tag_digest = hashlib.sha256(f.read()).hexdigest()
+        self.write('tagmanifest-sha256.txt', "{} bagit.txt\n".format(tag_digest))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, text):
+        with open(os.path.join(self.bag, name), 'w') as f:
+            f.write(text)
+
+    def test_objects_from_manifests(self):
+        objects = list(bagit.iter_bag_objects(self.bag, messageDigestOriginator='depositor'))
+        self.assertEqual(len(objects), 2)
+        for obj in objects:
+            name = 'data/' + obj.get_originalName()
+            data = self.payload[name]
+            characteristics = obj.get_objectCharacteristics(0)
+            self.assertEqual(characteristics.get_size(), str(len(data)))
+            fixity = characteristics.get_fixity()
+            self.assertEqual([x.get_messageDigestAlgorithm() for x in fixity], ['SHA-256', 'MD5'])
+            self.assertEqual(fixity[0].get_messageDigest(), hashlib.sha256(data).hexdigest())
+            self.assertEqual(fixity[1].get_messageDigest(), hashlib.md5(data).hexdigest())
+            self.assertEqual(fixity[0].get_messageDigestOriginator(), 'depositor')
+
+    def test_algorithm_filter_and_tags(self):
+        record = bagit.load_bag(self.bag, include_tags=True, algorithms=['sha256'])
+        objects = record.get_object_list()
+        self.assertEqual(len(objects), 3)
+        self.assertIn('bagit.txt', [x.get_originalName() for x in objects])
+        for obj in objects:
+            self.assertEqual(len(obj.get_objectCharacteristics(0).get_fixity()), 1)
+
+    def test_no_tagmanifest(self):
+        os.remove(os.path.join(self.bag, 'tagmanifest-sha256.txt'))
+        objects = list(bagit.iter_bag_objects(self.bag, include_tags=True))
+        self.assertEqual(len(objects), 2)
+
+    def test_entries_outside_bag(self):
+        outside = os.path.join(self.tmpdir, 'outside.txt')
+        with open(outside, 'wb') as f:
+            f.write(b'not in the bag')
+        for relpath in ['../outside.txt', 'data/../../outside.txt', outside, '.']:
+            self.write('manifest-sha256.txt', "{}  {}\n".format('0' * 64, relpath))
+            with self.assertRaises(bagit.BagItError):
+                list(bagit.iter_bag_objects(self.bag, algorithms=['sha256']))
+
+    def test_empty_bag(self):
+        for name in ('manifest-sha256.txt', 'manifest-md5.txt'):
+            self.write(name, "")
+        record = bagit.load_bag(self.bag)
+        self.assertEqual(record.get_object_list(), [])
+        self.assertEqual(len(list(record)), 0)
+
+    def test_spot_check(self):
+        list(bagit.iter_bag_objects(self.bag, sample_rate=1))
+        with open(os.path.join(self.bag, 'data', 'a.txt'), 'wb') as f:
+            f.write(b'tampered')
+        with self.assertRaises(bagit.BagItError):
+            list(bagit.iter_bag_objects(self.bag, sample_rate=1))
+
+    def test_not_a_bag(self):
+        os.remove(os.path.join(self.bag, 'bagit.txt'))
+        with self.assertRaises(bagit.BagItError):
+            list(bagit.iter_bag_objects(self.bag))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+
+from benchmarks.synthetic import generate_nodes, generate_record, generate_values, build_nodes
+from benchmarks.compare import compare
+
+
+class SyntheticRecordTestCase(unittest.TestCase):
+    """Tests for the benchmark record generator"""
+
+    def test_shape(self):
+        objects, events, agents, rights = generate_nodes(objects=4, events_per_object=3,
+                                                         agents=2, rights=2)
+        self.assertEqual((len(objects), len(events), len(agents), len(rights)), (4, 12, 2, 2))
+
+    def test_deterministic(self):
+        self.assertEqual(generate_record(objects=3, seed=7).to_xml(),
+                         generate_record(objects=3, seed=7).to_xml())
+        self.assertNotEqual(generate_record(objects=3, seed=7).to_xml(),
+                            generate_record(objects=3, seed=8).to_xml())
+
+    def test_values_build_the_same_nodes(self):
+        values = generate_values(objects=3, seed=7)
+        self.assertEqual(build_nodes(values), build_nodes(values))
+        self.assertEqual(build_nodes(values), generate_nodes(objects=3, seed=7))
+
+    def test_compare(self):
+        old = {'params': {}, 'results': {'parse': {'best': 1.0}, 'to_xml': {'best': 1.0}}}
+        new = {'params': {}, 'results': {'parse': {'best': 1.5}, 'to_xml': {'best': 0.9}}}
+        rows, regressions = compare(old, new)
+        self.assertEqual(regressions, ['parse'])
+        self.assertEqual(len(rows), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from pypremis.nodes import *
+from pypremis import characterize
+from pypremis.fixity import FixityCache
+
+
+class CharacterizeTestCase(unittest.TestCase):
+    """Tests for building Object nodes from a directory tree"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tmpdir, 'sub', 'deeper'))
+        self.files = {
+            'a.pdf': b'%PDF-1.4 not really a pdf',
+            os.path.join('sub', 'b.png'): b'\x89PNG\r\n\x1a\nrest',
+            os.path.join('sub', 'deeper', 'c.txt'): b'plain text',
+        }
+        for name, data in self.files.items():
+            with open(os.path.join(self.tmpdir, name), 'wb') as f:
+                f.write(data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_sniff_format(self):
+        self.assertEqual(characterize.sniff_format(b'%PDF-1.7'), 'application/pdf')
+        self.assertEqual(characterize.sniff_format(b'????', 'x.txt'), 'text/plain')
+        self.assertEqual(characterize.sniff_format(b'????'), characterize.UNKNOWN_FORMAT)
+        bmp = b'BM' + (70).to_bytes(4, 'little') + bytes(4) + (54).to_bytes(4, 'little') + \
+            (40).to_bytes(4, 'little')
+        self.assertEqual(characterize.sniff_format(bmp), 'image/bmp')
+        self.assertEqual(characterize.sniff_format(b'BMW service history\n', 'x.txt'),
+                         'text/plain')
+        self.assertEqual(characterize.sniff_format(b'ID3\x04\x00\x00\x00\x00\x01\x7f'),
+                         'audio/mpeg')
+        self.assertEqual(characterize.sniff_format(b'ID3 tags to fix\n', 'x.txt'), 'text/plain')
+
+    def test_walk(self):
+        objects = list(characterize.walk(self.tmpdir, algorithms=['SHA-256', 'MD5'], workers=2))
+        self.assertEqual(len(objects), 3)
+        by_name = {x.get_originalName(): x for x in objects}
+        self.assertEqual(set(by_name), set(self.files))
+        for name, data in self.files.items():
+            obj = by_name[name]
+            self.assertEqual(obj.get_objectCategory(), 'file')
+            characteristics = obj.get_objectCharacteristics(0)
+            self.assertEqual(characteristics.get_size(), str(len(data)))
+            self.assertEqual(characteristics.get_fixity(0).get_messageDigestAlgorithm(), 'SHA-256')
+            self.assertEqual(characteristics.get_fixity(0).get_messageDigest(),
+                             hashlib.sha256(data).hexdigest())
+            self.assertEqual(characteristics.get_fixity(1).get_messageDigest(),
+                             hashlib.md5(data).hexdigest())
+            self.assertEqual(obj.get_storage(0).get_contentLocation().get_contentLocationValue(),
+                             os.path.join(self.tmpdir, name))
+        formats = {x: by_name[x].get_objectCharacteristics(0).get_format(0)
+                   .get_formatDesignation().get_formatName() for x in by_name}
+        self.assertEqual(formats['a.pdf'], 'application/pdf')
+        self.assertEqual(formats[os.path.join('sub', 'b.png')], 'image/png')
+        self.assertEqual(formats[os.path.join('sub', 'deeper', 'c.txt')], 'text/plain')
+
+    def test_characterize_with_cache(self):
+        with FixityCache() as cache:
+            record = characterize.characterize(self.tmpdir, cache=cache)
+            self.assertEqual(len(record.get_object_list()), 3)
+            again = characterize.characterize(self.tmpdir, cache=cache)
+        first = sorted(x.get_objectCharacteristics(0).get_fixity(0).get_messageDigest()
+                       for x in record.get_object_list())
+        second = sorted(x.get_objectCharacteristics(0).get_fixity(0).get_messageDigest()
+                        for x in again.get_object_list())
+        self.assertEqual(first, second)
+
+    def test_empty_directory(self):
+        empty = os.path.join(self.tmpdir, 'empty')
+        os.mkdir(empty)
+        record = characterize.characterize(empty)
+        self.assertEqual(record.get_object_list(), [])
+        self.assertEqual(len(list(record)), 0)
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), "needs symlinks")
+    def test_symlink_cycle(self):
+        os.symlink(self.tmpdir, os.path.join(self.tmpdir, 'sub', 'loop'))
+        os.symlink(os.path.join(self.tmpdir, 'sub'), os.path.join(self.tmpdir, 'again'))
+        found = [x[1] for x in characterize.iter_files(self.tmpdir, follow_symlinks=True)]
+        # sub is reached through again first, and not walked a second time
+        self.assertEqual(sorted(found), sorted(
+            x.replace('sub', 'again', 1) if x.startswith('sub') else x for x in self.files))
+
+    def test_unreadable_file(self):
+        locked = os.path.join(self.tmpdir, 'sub', 'b.png')
+        original = open
+
+        def fake_open(path, *args, **kwargs):
+            if path == locked:
+                raise PermissionError(13, 'Permission denied', path)
+            return original(path, *args, **kwargs)
+
+        errors = []
+        with mock.patch('builtins.open', fake_open):
+            objects = list(characterize.walk(self.tmpdir, workers=1,
+                                             on_error=lambda *args: errors.append(args)))
+        self.assertEqual(sorted(x.get_originalName() for x in objects),
+                         sorted(x for x in self.files if x != os.path.join('sub', 'b.png')))
+        self.assertEqual([(path, type(e)) for path, e in errors], [(locked, PermissionError)])
+
+    def test_messageDigestOriginator(self):
+        for obj in characterize.walk(self.tmpdir, messageDigestOriginator='depositor'):
+            fixity = obj.get_objectCharacteristics(0).get_fixity(0)
+            self.assertEqual(fixity.get_messageDigestOriginator(), 'depositor')
+
+    def test_unreadable_directory(self):
+        locked = os.path.join(self.tmpdir, 'sub', 'deeper')
+        scandir = os.scandir
+
+        def fake_scandir(path):
+            if path == locked:
+                raise PermissionError(13, 'Permission denied', path)
+            return scandir(path)
+
+        errors = []
+        with mock.patch.object(characterize.os, 'scandir', fake_scandir):
+            found = [x[1] for x in characterize.iter_files(
+                self.tmpdir, on_error=lambda *args: errors.append(args))]
+        self.assertEqual(sorted(found), sorted(x for x in self.files if 'deeper' not in x))
+        self.assertEqual([x[0] for x in errors], [locked])
+
+
+if __name__ == '__main__':
+    unittest.main()
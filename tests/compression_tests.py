@@ -0,0 +1,133 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import shutil
+import tempfile
+import unittest
+
+from pypremis.compression import detect, infer, for_target, reading
+from pypremis.factories import XMLNodeFactory
+from pypremis.journal import EventJournal, compact, journal_path
+from pypremis.lib import PremisRecord
+from pypremis.nodes import *
+
+
+CODECS = {'gz': gzip, 'xz': lzma, 'bz2': bz2}
+
+
+class CompressionTestCase(unittest.TestCase):
+    """Tests for reading and writing compressed records
+
+    Uses kitchen-sink.xml, so should be run from the 'tests' directory.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.record = PremisRecord(frompath='kitchen-sink.xml')
+        self.plain = os.path.join(self.tmpdir, 'premis.xml')
+        self.record.write_to_file(self.plain)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def path(self, name):
+        return os.path.join(self.tmpdir, name)
+
+    def test_round_trip(self):
+        with open(self.plain, 'rb') as f:
+            expected = f.read()
+        for compression, codec in CODECS.items():
+            path = self.path('premis.xml.' + compression)
+            self.record.write_to_file(path)
+            self.assertEqual(detect(path), compression)
+            with codec.open(path, 'rb') as f:
+                self.assertEqual(f.read(), expected)
+            self.assertEqual(PremisRecord(frompath=path), self.record)
+            self.assertEqual(PremisRecord(frompath=path, lazy=True), self.record)
+            self.assertLess(os.path.getsize(path), len(expected))
+
+    def test_detected_by_content(self):
+        for compression, codec in CODECS.items():
+            path = self.path('premis-' + compression)
+            with open(self.plain, 'rb') as src, codec.open(path, 'wb') as dst:
+                dst.write(src.read())
+            self.assertEqual(PremisRecord(frompath=path), self.record)
+            events = list(XMLNodeFactory(path).iter_events())
+            self.assertEqual(events, self.record.get_event_list())
+
+    def test_file_objects(self):
+        path = self.path('premis.xml.gz')
+        self.record.write_to_file(path)
+        with open(path, 'rb') as f:
+            data = f.read()
+            f.seek(0)
+            self.assertEqual(PremisRecord(frompath=f), self.record)
+        f = io.BytesIO(data)
+        self.assertEqual(detect(f), 'gz')
+        self.assertEqual(f.tell(), 0)
+        self.assertEqual(PremisRecord(frompath=f), self.record)
+        self.assertIsNone(detect(io.StringIO('<premis/>')))
+
+    def test_explicit(self):
+        path = self.path('premis')
+        self.record.write_to_file(path, compression='xz', compresslevel=1)
+        self.assertEqual(detect(path), 'xz')
+        self.assertEqual(PremisRecord(frompath=path), self.record)
+        path = self.path('premis.xml.gz')
+        self.record.write_to_file(path, compression=None)
+        self.assertIsNone(detect(path))
+        with self.assertRaises(ValueError):
+            self.record.write_to_file(path, compression='zip')
+
+    def test_levels(self):
+        for level in (1, 9):
+            path = self.path('premis{}.xml.bz2'.format(level))
+            self.record.write_to_file(path, compresslevel=level)
+            self.assertEqual(PremisRecord(frompath=path), self.record)
+
+    def test_infer(self):
+        self.assertEqual(infer('a/premis.xml.GZ'), 'gz')
+        self.assertEqual(infer('premis.xml.bz2'), 'bz2')
+        self.assertIsNone(infer('premis.xml'))
+        self.assertIsNone(infer(io.BytesIO()))
+
+    def test_for_target(self):
+        self.assertEqual(for_target(self.path('new.xml.xz')), 'xz')
+        self.assertIsNone(for_target(self.path('new.xml')))
+        self.assertIsNone(for_target(self.plain))
+        self.record.write_to_file(self.plain, compression='bz2')
+        self.assertEqual(for_target(self.plain), 'bz2')
+        # The suffix wins over the contents
+        self.assertEqual(for_target(self.plain + '.gz'), 'gz')
+        shutil.copy(self.plain, self.plain + '.gz')
+        self.assertEqual(for_target(self.plain + '.gz'), 'gz')
+
+    def test_reading_plain(self):
+        with reading(self.plain) as source:
+            self.assertEqual(source, self.plain)
+
+    def test_preserve_source_ignored(self):
+        path = self.path('premis.xml.gz')
+        self.record.write_to_file(path)
+        record = PremisRecord(frompath=path, preserve_source=True)
+        record.add_event(Event(EventIdentifier('uuid', 'new'), 'validation', '2020-01-01'))
+        record.write_to_file(path)
+        self.assertEqual(detect(path), 'gz')
+        self.assertEqual(PremisRecord(frompath=path), record)
+
+    def test_compact_keeps_compression(self):
+        path = self.path('premis')
+        self.record.write_to_file(path, compression='gz')
+        journal = EventJournal(journal_path(path))
+        event = Event(EventIdentifier('uuid', 'journalled'), 'validation', '2020-01-01')
+        journal.append([event])
+        self.assertEqual(compact(path, fsync=False), 1)
+        self.assertEqual(detect(path), 'gz')
+        self.assertEqual(PremisRecord(frompath=path).get_event(repr(event.get_eventIdentifier())),
+                         event)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import copy
+import io
+import threading
+import unittest
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+from pypremis.lib import PremisRecord
+from pypremis.nodes import *
+
+
+EXTENDED = (
+    '<premis:premis xmlns:premis="http://www.loc.gov/premis/v3" '
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+    'xmlns:mix="http://www.loc.gov/mix/v20">'
+    '<premis:agent><premis:agentIdentifier>'
+    '<premis:agentIdentifierType>t</premis:agentIdentifierType>'
+    '<premis:agentIdentifierValue>v</premis:agentIdentifierValue>'
+    '</premis:agentIdentifier>'
+    '<premis:agentExtension>'
+    '<mix:mix xsi:type="mix:example"><mix:imageWidth>10</mix:imageWidth></mix:mix>'
+    '<premis:note>a premis element</premis:note>'
+    '</premis:agentExtension>'
+    '</premis:agent></premis:premis>'
+)
+
+THREADS = 32
+
+
+class ConcurrencyTestCase(unittest.TestCase):
+    """Tests for serializing and parsing records from many threads at once
+
+    Uses kitchen-sink.xml, so should be run from the 'tests' directory.
+    """
+
+    def run_threads(self, func):
+        barrier = threading.Barrier(THREADS)
+
+        def task(_):
+            barrier.wait()
+            return [func() for x in range(5)]
+
+        with ThreadPoolExecutor(THREADS) as pool:
+            results = list(pool.map(task, range(THREADS)))
+        return [x for result in results for x in result]
+
+    def test_serialize_same_record(self):
+        record = PremisRecord(frompath='kitchen-sink.xml')
+        expected = record.to_xml()
+        results = self.run_threads(record.to_xml)
+        self.assertEqual(set(results), {expected})
+
+    def test_serialize_extensions(self):
+        for opaque in (False, True):
+            record = PremisRecord(frompath=io.BytesIO(EXTENDED.encode('utf-8')),
+                                  opaque_extensions=opaque)
+            expected = record.to_xml()
+            results = self.run_threads(record.to_xml)
+            self.assertEqual(set(results), {expected})
+            # Declared once, whatever the global namespace registry holds
+            root = ET.fromstring(expected)
+            extension = root.find('.//{http://www.loc.gov/premis/v3}agentExtension')
+            if opaque:
+                # Built extension nodes don't keep attributes
+                self.assertEqual(extension[0].get('{http://www.w3.org/2001/XMLSchema-instance}type'),
+                                 'mix:example')
+            self.assertEqual(extension[1].tag, '{http://www.loc.gov/premis/v3}note')
+            self.assertIn('<premis:note>', expected)
+
+    def test_parse_while_serializing(self):
+        record = PremisRecord(frompath='kitchen-sink.xml')
+        expected = record.to_xml()
+
+        def task():
+            parsed = PremisRecord(frompath='kitchen-sink.xml')
+            return parsed.to_xml() + record.to_xml()
+
+        results = self.run_threads(task)
+        self.assertEqual(set(results), {expected + expected})
+
+    def test_lazy_shared_record(self):
+        record = PremisRecord(frompath='kitchen-sink.xml', lazy=True)
+        keys = list(record.events_list.identifiers)
+        results = self.run_threads(lambda: [record.get_event(key) for key in keys])
+        # Every thread got the same node for each identifier
+        for nodes in results:
+            self.assertEqual([id(x) for x in nodes], [id(x) for x in results[0]])
+        self.assertEqual(record.events_list.lazy, 0)
+        self.assertEqual(results[0], PremisRecord(frompath='kitchen-sink.xml').get_event_list())
+
+    def test_opaque_shared_extension(self):
+        record = PremisRecord(frompath=io.BytesIO(EXTENDED.encode('utf-8')),
+                              opaque_extensions=True)
+        extension = record.get_agent_list()[0].get_agentExtension()[0]
+        results = self.run_threads(lambda: id(extension.fields))
+        # Built once, and every thread got the same fields
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(len(extension.fields), 2)
+        self.assertIsNone(extension.get_payload())
+
+    def test_opaque_extensions_build_independently(self):
+        # Each record's payloads are built under their own lock, and copies
+        # get locks of their own
+        records = [PremisRecord(frompath=io.BytesIO(EXTENDED.encode('utf-8')),
+                                opaque_extensions=True) for x in range(THREADS)]
+        copies = [copy.deepcopy(x) for x in records[:2]]
+        records += copies
+        extensions = [x.get_agent_list()[0].get_agentExtension()[0] for x in records]
+        locks = [x._payload_lock for x in extensions]
+        self.assertEqual(len(set(map(id, locks))), len(records))
+        with ThreadPoolExecutor(THREADS) as pool:
+            results = list(pool.map(lambda x: len(x.fields), extensions))
+        self.assertEqual(set(results), {2})
+
+    def test_registry_untouched(self):
+        before = dict(ET._namespace_map)
+        record = PremisRecord(frompath=io.BytesIO(EXTENDED.encode('utf-8')))
+        record.to_xml()
+        self.assertEqual(ET._namespace_map, before)
+
+
+if __name__ == '__main__':
+    unittest.main()
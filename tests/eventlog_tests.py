@@ -0,0 +1,196 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from pypremis import eventlog
+from pypremis.eventlog import EventLogger
+from pypremis.journal import EventJournal, journal_path, compact
+from pypremis.lib import PremisRecord, DuplicateIdentifierError, LazyEntity
+from pypremis.nodes import *
+
+
+class EventLoggerTestCase(unittest.TestCase):
+    """Tests for the buffered event logger
+
+    Uses kitchen-sink.xml, so should be run from the 'tests' directory.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'premis.xml')
+        shutil.copy('kitchen-sink.xml', self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def event(self, value, eventType='virus check'):
+        return Event(EventIdentifier('uuid', value), eventType, '2020-01-01T00:00:00')
+
+    def test_many_producers(self):
+        record = PremisRecord(frompath=self.path)
+        logger = EventLogger(batch_size=50, flush_interval=0.05)
+
+        def produce(n):
+            for x in range(100):
+                logger.log(record, self.event('{}-{}'.format(n, x)))
+                # Every producer also logs an event the others log
+                logger.log(record, self.event('shared-{}'.format(x)))
+
+        threads = [threading.Thread(target=produce, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        logger.close()
+        self.assertEqual(len(record.get_event_list()), 23 + 800 + 100)
+        self.assertEqual(logger.applied, 900)
+        self.assertEqual(logger.skipped, 700)
+        self.assertEqual(logger.errors, [])
+
+    def test_flush_interval(self):
+        record = PremisRecord(frompath=self.path)
+        with EventLogger(batch_size=1000, flush_interval=0.01) as logger:
+            logger.log(record, self.event('a'))
+            self.assertTrue(logger.flush(timeout=5))
+            self.assertEqual(len(record.get_event_list()), 24)
+
+    def test_conflict_reported(self):
+        record = PremisRecord(frompath=self.path)
+        reported = []
+        with EventLogger(on_error=lambda *args: reported.append(args)) as logger:
+            logger.log(record, self.event('a'))
+            logger.log(record, self.event('a', eventType='replication'))
+        self.assertEqual(len(record.get_event_list()), 24)
+        self.assertEqual(len(reported), 1)
+        self.assertIsInstance(reported[0][2], DuplicateIdentifierError)
+        self.assertEqual(logger.errors, reported)
+
+    def test_journal_path(self):
+        with EventLogger(fsync=False) as logger:
+            for x in range(3):
+                logger.log(self.path, self.event(str(x)))
+            logger.log(self.path, self.event('0'))
+        self.assertEqual(len(list(EventJournal(journal_path(self.path)))), 3)
+        self.assertEqual(len(PremisRecord(frompath=self.path).get_event_list()), 26)
+
+    def test_journal_record(self):
+        record = PremisRecord(frompath=self.path)
+        with EventLogger(journal=True, fsync=False) as logger:
+            logger.log(record, self.event('a'))
+        self.assertEqual(len(record.get_event_list()), 24)
+        self.assertEqual(len(PremisRecord(frompath=self.path).get_event_list()), 24)
+
+    def test_closed(self):
+        logger = EventLogger()
+        logger.close()
+        with self.assertRaises(ValueError):
+            logger.log(self.path, self.event('a'))
+        with self.assertRaises(ValueError):
+            logger.flush()
+
+    def failing_append(self):
+        # Makes the next EventJournal.append() fail
+        original = EventJournal.append
+        calls = []
+
+        def append(journal, events):
+            calls.append(events)
+            if len(calls) == 1:
+                raise OSError("disk full")
+            return original(journal, events)
+
+        return mock.patch.object(EventJournal, 'append', append)
+
+    def test_failed_write_path(self):
+        with self.failing_append(), EventLogger(fsync=False) as logger:
+            logger.log(self.path, self.event('a'))
+            logger.log(self.path, self.event('a', eventType='replication'))
+            logger.flush()
+            # The conflict, and the event in the failed write
+            self.assertEqual([(type(e), event.get_eventType()) for record, event, e in logger.errors],
+                             [(DuplicateIdentifierError, 'replication'), (OSError, 'virus check')])
+            self.assertEqual(logger.applied, 0)
+            logger.log(self.path, self.event('a'))
+        self.assertEqual(logger.applied, 1)
+        self.assertEqual(len(list(EventJournal(journal_path(self.path)))), 1)
+
+    def test_failed_write_record(self):
+        record = PremisRecord(frompath=self.path)
+        with self.failing_append(), EventLogger(journal=True, fsync=False) as logger:
+            logger.log(record, self.event('a'))
+            logger.flush()
+            self.assertEqual(len(logger.errors), 1)
+            self.assertEqual(len(record.get_event_list()), 23)
+            logger.log(record, self.event('a'))
+        self.assertEqual(len(record.get_event_list()), 24)
+        self.assertEqual(len(PremisRecord(frompath=self.path).get_event_list()), 24)
+
+    def test_seen_follows_journal(self):
+        with EventLogger(fsync=False) as logger:
+            logger.log(self.path, self.event('a'))
+            logger.flush()
+            # Compacted, and the event appended again by someone else
+            compact(self.path, fsync=False)
+            EventJournal(journal_path(self.path), fsync=False).append(
+                self.event('b', eventType='replication'))
+            logger.log(self.path, self.event('b', eventType='replication'))
+            logger.log(self.path, self.event('c'))
+        self.assertEqual((logger.applied, logger.skipped), (2, 1))
+        self.assertEqual(len(PremisRecord(frompath=self.path).get_event_list()), 26)
+
+    def test_conflict_with_file(self):
+        record = PremisRecord(frompath=self.path)
+        existing = record.get_event_list()[0]
+        conflicting = Event(existing.get_eventIdentifier(), 'replication', '2020-01-01T00:00:00')
+        with EventLogger(fsync=False) as logger:
+            logger.log(self.path, existing)
+            logger.log(self.path, conflicting)
+            logger.log(self.path, self.event('a'))
+        self.assertEqual((logger.applied, logger.skipped), (1, 1))
+        self.assertEqual([(x[1], type(x[2])) for x in logger.errors],
+                         [(conflicting, DuplicateIdentifierError)])
+        # Still loads with its journal
+        self.assertEqual(len(PremisRecord(frompath=self.path, journal=True).get_event_list()), 24)
+
+    def test_failed_apply_keeps_running(self):
+        record = PremisRecord(frompath=self.path)
+        with mock.patch.object(EventLogger, '_apply_record', side_effect=OSError("gone")):
+            with EventLogger(fsync=False) as logger:
+                logger.log(record, self.event('a'))
+                self.assertTrue(logger.flush(timeout=5))
+                logger.log(self.path, self.event('b'))
+                self.assertTrue(logger.flush(timeout=5))
+        self.assertEqual([type(x[2]) for x in logger.errors], [OSError])
+        self.assertEqual(logger.applied, 1)
+
+    def test_lazy_lookup_fails(self):
+        record = PremisRecord(frompath=self.path, lazy=True)
+        identifier = record.events_list.nodes[0].identifiers[0]
+        event = Event(identifier, 'replication', '2020-01-01T00:00:00')
+        with mock.patch.object(LazyEntity, 'materialize', side_effect=ValueError("broken")):
+            with EventLogger(fsync=False) as logger:
+                logger.log(record, event)
+                self.assertTrue(logger.flush(timeout=5))
+                logger.log(record, self.event('a'))
+        self.assertEqual([(x[1], type(x[2])) for x in logger.errors], [(event, ValueError)])
+        self.assertEqual(logger.applied, 1)
+
+    def test_seen_bounded(self):
+        paths = []
+        for x in range(eventlog.SEEN_JOURNALS + 5):
+            paths.append(os.path.join(self.tmpdir, '{}.xml'.format(x)))
+        with EventLogger(fsync=False) as logger:
+            for path in paths:
+                logger.log(path, self.event('a'))
+                logger.flush()
+            self.assertEqual(len(logger._seen), eventlog.SEEN_JOURNALS)
+            # Still spotted from the journal itself
+            logger.log(paths[0], self.event('a'))
+        self.assertEqual(logger.skipped, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+from pypremis.lib import PremisRecord
+from pypremis.nodes import *
+
+
+RECORD = (
+    '<premis:premis xmlns:premis="http://www.loc.gov/premis/v3" '
+    'xmlns:mix="http://www.loc.gov/mix/v20">'
+    '<premis:agent><premis:agentIdentifier>'
+    '<premis:agentIdentifierType>t</premis:agentIdentifierType>'
+    '<premis:agentIdentifierValue>v</premis:agentIdentifierValue>'
+    '</premis:agentIdentifier>'
+    '<premis:agentExtension>\n'
+    '  <mix:mix><mix:BasicImageInformation><mix:imageWidth>10</mix:imageWidth>'
+    '<mix:imageHeight>20</mix:imageHeight></mix:BasicImageInformation></mix:mix>\n'
+    '  <mix:note>flat</mix:note>\n'
+    '</premis:agentExtension>'
+    '</premis:agent></premis:premis>'
+)
+
+MIX = '{http://www.loc.gov/mix/v20}'
+
+
+class OpaqueExtensionTestCase(unittest.TestCase):
+    """Tests for keeping extension content as serialized xml"""
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.xml')
+        with os.fdopen(handle, 'w') as f:
+            f.write(RECORD)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def extension(self, record):
+        return record.get_agent_list()[0].get_agentExtension()[0]
+
+    def test_kept_opaque_until_accessed(self):
+        extension = self.extension(PremisRecord(frompath=self.path, opaque_extensions=True))
+        self.assertEqual(len(extension.get_payload()), 2)
+        self.assertEqual(extension.get_field(MIX + 'note'), ['flat'])
+        self.assertIsNone(extension.get_payload())
+        info = extension.get_field(MIX + 'mix')[0].get_field(MIX + 'BasicImageInformation')[0]
+        self.assertEqual(info.get_field(MIX + 'imageWidth'), ['10'])
+
+    def test_matches_built(self):
+        built = PremisRecord(frompath=self.path)
+        opaque = PremisRecord(frompath=self.path, opaque_extensions=True)
+        self.assertEqual(built.to_xml(), opaque.to_xml())
+        self.assertIsNotNone(self.extension(opaque).get_payload())
+        self.assertEqual(self.extension(built), self.extension(opaque))
+
+    def test_modified_after_access(self):
+        opaque = PremisRecord(frompath=self.path, opaque_extensions=True)
+        extension = self.extension(opaque)
+        extension.add_to_field(MIX + 'note', 'another')
+        self.assertIn('another', opaque.to_xml())
+        self.assertIn('imageHeight', opaque.to_xml())
+
+    def test_memory_report_leaves_payload(self):
+        opaque = PremisRecord(frompath=self.path, opaque_extensions=True)
+        report = opaque.memory_report()
+        self.assertIn('AgentExtension.<payload>', report.by_field)
+        self.assertIsNotNone(self.extension(opaque).get_payload())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pypremis.nodes import *
+from pypremis.lib import PremisRecord
+from pypremis import fixity
+from pypremis.scheduler import parse_datetime
+
+
+def make_object(identifier, path, digest):
+    format = Format(formatDesignation=FormatDesignation('text'))
+    characteristics = ObjectCharacteristics(format, fixity=Fixity('SHA-256', digest))
+    storage = Storage(contentLocation=ContentLocation('filepath', path))
+    return Object(ObjectIdentifier('local', identifier), 'file', characteristics, storage=storage)
+
+
+class FixityVerifierTestCase(unittest.TestCase):
+    """Tests for re-hashing content on disk and recording fixity check events"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'content.txt')
+        with open(self.path, 'wb') as f:
+            f.write(b'hello world')
+        self.digest = hashlib.sha256(b'hello world').hexdigest()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_normalize_algorithm(self):
+        self.assertEqual(fixity.normalize_algorithm('SHA-256'), 'sha256')
+        self.assertEqual(fixity.normalize_algorithm('MD5'), 'md5')
+        self.assertIsNone(fixity.normalize_algorithm('not a real hash'))
+
+    def test_success(self):
+        obj = make_object('1', self.path, self.digest)
+        result = fixity.FixityVerifier().check_object(obj)
+        self.assertEqual(result.outcome, fixity.SUCCESS)
+
+    def test_failure_and_missing(self):
+        changed = make_object('1', self.path, hashlib.sha256(b'other').hexdigest())
+        missing = make_object('2', os.path.join(self.tmpdir, 'gone'), self.digest)
+        results = list(fixity.FixityVerifier(workers=2).iter_results([changed, missing]))
+        self.assertEqual([x.outcome for x in results], [fixity.FAILURE, fixity.MISSING])
+
+    def test_relative_paths(self):
+        obj = make_object('1', 'content.txt', self.digest)
+        result = fixity.FixityVerifier(root=self.tmpdir).check_object(obj)
+        self.assertEqual(result.outcome, fixity.SUCCESS)
+
+    def test_events_written_to_records(self):
+        agent = LinkingAgentIdentifier('local', 'auditor', 'executing program')
+        records = [PremisRecord(objects=[make_object(str(i), self.path, self.digest)])
+                   for i in range(3)]
+        verifier = fixity.FixityVerifier(linkingAgentIdentifier=agent, link_objects=True)
+        output = verifier.verify_records(records)
+        self.assertEqual(len(output), 3)
+        for record, results in output:
+            self.assertEqual(len(results), 1)
+            event = record.get_event_list()[0]
+            self.assertEqual(event.get_eventType(), 'fixity check')
+            self.assertEqual(event.get_eventOutcomeInformation(0).get_eventOutcome(), fixity.SUCCESS)
+            self.assertEqual(event.get_linkingAgentIdentifier(0), agent)
+            obj = record.get_object_list()[0]
+            self.assertEqual(event.get_linkingObjectIdentifier(0).get_linkingObjectIdentifierValue(),
+                             obj.get_objectIdentifier(0).get_objectIdentifierValue())
+            self.assertEqual(obj.get_linkingEventIdentifier(0).get_linkingEventIdentifierValue(),
+                             event.get_eventIdentifier().get_eventIdentifierValue())
+
+    def test_event_datetime_has_offset(self):
+        obj = make_object('1', self.path, self.digest)
+        verifier = fixity.FixityVerifier()
+        event = verifier.build_event(verifier.check_object(obj))
+        value = event.get_eventDateTime()
+        self.assertTrue(value.endswith('+00:00'), value)
+        self.assertLess(abs(parse_datetime(value) - time.time()), 60)
+
+    def test_write_back(self):
+        record_path = os.path.join(self.tmpdir, 'premis.xml')
+        PremisRecord(objects=[make_object('1', self.path, self.digest)]).write_to_file(record_path)
+        fixity.FixityVerifier().verify_record(record_path, write=True)
+        reloaded = PremisRecord(frompath=record_path)
+        self.assertEqual(len(reloaded.get_event_list()), 1)
+
+
+class FixityCacheTestCase(unittest.TestCase):
+    """Tests for skipping re-hashing of unchanged files"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'content.txt')
+        with open(self.path, 'wb') as f:
+            f.write(b'hello world')
+        self.digest = hashlib.sha256(b'hello world').hexdigest()
+        self.cache = fixity.FixityCache(os.path.join(self.tmpdir, 'cache.sqlite'))
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_unchanged_file_is_not_rehashed(self):
+        verifier = fixity.FixityVerifier(cache=self.cache)
+        first = verifier.check_object(make_object('1', self.path, self.digest))
+        self.assertFalse(first.cached)
+        second = verifier.check_object(make_object('1', self.path, self.digest))
+        self.assertTrue(second.cached)
+        self.assertEqual(second.outcome, fixity.SUCCESS)
+
+    def test_changed_file_is_rehashed(self):
+        verifier = fixity.FixityVerifier(cache=self.cache)
+        verifier.check_object(make_object('1', self.path, self.digest))
+        with open(self.path, 'wb') as f:
+            f.write(b'goodbye world')
+        result = verifier.check_object(make_object('1', self.path, self.digest))
+        self.assertFalse(result.cached)
+        self.assertEqual(result.outcome, fixity.FAILURE)
+
+    def test_max_age_forces_rehash(self):
+        key = fixity.FixityCache.stat_key(self.path)
+        self.cache.put(key, 'sha256', self.digest, verified=0)
+        self.assertEqual(self.cache.get(key, 'sha256'), self.digest)
+        self.cache.max_age_days = 1
+        self.assertIsNone(self.cache.get(key, 'sha256'))
+
+    def test_fixity_node(self):
+        node = self.cache.fixity(self.path, 'SHA-256', 'pypremis')
+        self.assertEqual(node.get_messageDigest(), self.digest)
+        self.assertEqual(node.get_messageDigestOriginator(), 'pypremis')
+
+
+if __name__ == '__main__':
+    unittest.main()
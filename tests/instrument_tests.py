@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+
+from pypremis import instrument
+from pypremis.lib import PremisRecord
+
+
+class InstrumentTestCase(unittest.TestCase):
+    """Tests for the opt-in instrumentation hooks
+
+    Uses kitchen-sink.xml, so should be run from the 'tests' directory.
+    """
+
+    def tearDown(self):
+        instrument.disable()
+        instrument.reset()
+
+    def test_disabled_records_nothing(self):
+        PremisRecord(frompath='kitchen-sink.xml').to_xml()
+        self.assertEqual(instrument.stats(), {'timings': {}, 'counts': {}})
+
+    def test_load_and_save(self):
+        seen = []
+        instrument.enable(lambda *args: seen.append(args))
+        record = PremisRecord(frompath='kitchen-sink.xml')
+        record.get_event_list()
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            record.write_to_file(path)
+            size = os.path.getsize(path)
+        finally:
+            os.remove(path)
+        stats = instrument.stats()
+        self.assertEqual(stats['timings']['parse']['document']['calls'], 1)
+        self.assertEqual(stats['timings']['build']['event']['calls'], 23)
+        self.assertEqual(stats['timings']['index']['object']['calls'], 2)
+        self.assertEqual(stats['timings']['serialize']['rights']['calls'], 1)
+        self.assertEqual(stats['timings']['write']['file']['calls'], 1)
+        self.assertEqual(stats['counts']['nodes_built']['event'], 23)
+        self.assertEqual(stats['counts']['identifiers_indexed']['object'], 3)
+        self.assertEqual(stats['counts']['bytes_written']['file'], size)
+        self.assertGreater(stats['counts']['elements_visited']['document'], 100)
+        self.assertIn(('time', 'build', 'agent'), [x[:3] for x in seen])
+        self.assertIn(('count', 'nodes_built', 'agent', 1), seen)
+
+    def test_disable_keeps_stats(self):
+        instrument.enable()
+        PremisRecord(frompath='kitchen-sink.xml')
+        instrument.disable()
+        before = instrument.stats()
+        PremisRecord(frompath='kitchen-sink.xml')
+        self.assertEqual(instrument.stats(), before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from pypremis import journal
+from pypremis.journal import EventJournal, JournalError, journal_path, compact
+from pypremis.lib import PremisRecord, DuplicateIdentifierError
+from pypremis.nodes import *
+
+
+class JournalTestCase(unittest.TestCase):
+    """Tests for event journals
+
+    Uses kitchen-sink.xml, so should be run from the 'tests' directory.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'premis.xml')
+        shutil.copy('kitchen-sink.xml', self.path)
+        self.journal = EventJournal(journal_path(self.path), fsync=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def event(self, value, eventType='virus check'):
+        return Event(EventIdentifier('uuid', value), eventType, '2020-01-01T00:00:00')
+
+    def test_round_trip(self):
+        events = [self.event(str(x)) for x in range(5)]
+        self.journal.append(events[:2])
+        self.journal.append(events[2:])
+        self.assertEqual(list(self.journal), events)
+
+    def test_merged_on_load(self):
+        self.journal.append([self.event('a'), self.event('b')])
+        record = PremisRecord(frompath=self.path)
+        self.assertEqual(len(record.get_event_list()), 25)
+        self.assertIsNotNone(record.get_event(repr(EventIdentifier('uuid', 'a'))))
+        self.assertEqual(len(PremisRecord(frompath=self.path, journal=False).get_event_list()), 23)
+
+    def test_torn_append_skipped(self):
+        self.journal.append(self.event('a'))
+        with open(self.journal.path, 'ab') as f:
+            f.write(b'{"type": "event", "xml": "<premis:ev')
+        self.journal.append(self.event('b'))
+        self.assertEqual([x.get_eventIdentifier().get_eventIdentifierValue() for x in self.journal],
+                         ['a', 'b'])
+        self.assertEqual(self.journal.skipped, 1)
+
+    def test_invalid_entry(self):
+        with open(self.journal.path, 'w') as f:
+            f.write('{"type": "event", "xml": "<premis:event/>"}\n')
+        with self.assertRaises(JournalError):
+            list(self.journal)
+
+    def test_duplicates(self):
+        self.journal.append([self.event('a'), self.event('a')])
+        self.assertEqual(len(PremisRecord(frompath=self.path).get_event_list()), 24)
+        self.journal.append(self.event('a', eventType='replication'))
+        with self.assertRaises(DuplicateIdentifierError):
+            PremisRecord(frompath=self.path)
+
+    def test_compact(self):
+        self.journal.append([self.event(str(x)) for x in range(3)])
+        self.assertEqual(compact(self.path, fsync=False), 3)
+        self.assertFalse(self.journal.exists())
+        self.assertFalse(os.path.exists(self.journal.lock_path))
+        record = PremisRecord(frompath=self.path)
+        self.assertEqual(len(record.get_event_list()), 26)
+        self.assertEqual(compact(self.path), 0)
+
+    def test_interrupted_compact(self):
+        # The record was rewritten but the journal wasn't removed
+        self.journal.append([self.event(str(x)) for x in range(3)])
+        with open(self.journal.path, 'rb') as f:
+            saved = f.read()
+        compact(self.path, fsync=False)
+        with open(self.journal.path, 'wb') as f:
+            f.write(saved)
+        self.assertEqual(len(PremisRecord(frompath=self.path).get_event_list()), 26)
+        self.assertEqual(compact(self.path, fsync=False), 0)
+        self.assertFalse(self.journal.exists())
+
+    def test_partial_line_kept(self):
+        # An append still being written when the journal is compacted
+        self.journal.append(self.event('a'))
+        with open(self.journal.path, 'ab') as f:
+            f.write(b'{"type": "event", "xml": "<premis:ev')
+        self.assertEqual(compact(self.path, fsync=False), 1)
+        with open(self.journal.path, 'rb') as f:
+            self.assertEqual(f.read(), b'{"type": "event", "xml": "<premis:ev')
+
+    def test_append_during_compact(self):
+        count = 200
+        started = threading.Event()
+
+        def appender():
+            other = EventJournal(journal_path(self.path), fsync=False)
+            for x in range(count):
+                other.append(self.event('appended-{}'.format(x)))
+                started.set()
+
+        thread = threading.Thread(target=appender)
+        thread.start()
+        started.wait()
+        added = 0
+        while thread.is_alive():
+            added += compact(self.path, fsync=False)
+        thread.join()
+        added += compact(self.path, fsync=False)
+        self.assertEqual(added, count)
+        self.assertFalse(self.journal.exists())
+        self.assertFalse(os.path.exists(self.journal.lock_path))
+        self.assertEqual(len(PremisRecord(frompath=self.path).get_event_list()), 23 + count)
+
+    @unittest.skipIf(journal.fcntl is None, "needs fcntl")
+    def test_lock_file_removed_while_waiting(self):
+        acquired = threading.Event()
+        holders = []
+
+        def waiter():
+            with self.journal.locked():
+                holders.append(os.path.exists(self.journal.lock_path))
+                acquired.set()
+
+        with self.journal.locked():
+            thread = threading.Thread(target=waiter)
+            thread.start()
+            self.assertFalse(acquired.wait(0.1))
+            # As compact() does, before its lock is released
+            os.remove(self.journal.lock_path)
+        thread.join()
+        # The waiter took the lock again on a new lock file
+        self.assertEqual(holders, [True])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import io
+import json
+import unittest
+
+from pypremis.jsonform import node_to_dict, node_from_dict, iter_jsonl
+from pypremis.lib import PremisRecord
+from pypremis.nodes import *
+
+
+EXTENDED = (
+    '<premis:premis xmlns:premis="http://www.loc.gov/premis/v3" '
+    'xmlns:mix="http://www.loc.gov/mix/v20">'
+    '<premis:agent><premis:agentIdentifier>'
+    '<premis:agentIdentifierType>t</premis:agentIdentifierType>'
+    '<premis:agentIdentifierValue>v</premis:agentIdentifierValue>'
+    '</premis:agentIdentifier>'
+    '<premis:agentExtension><mix:mix><mix:imageWidth>10</mix:imageWidth></mix:mix>'
+    '<mix:note>a</mix:note><mix:note>b</mix:note></premis:agentExtension>'
+    '</premis:agent></premis:premis>'
+)
+
+
+class JSONTestCase(unittest.TestCase):
+    """Tests for reading and writing records as JSON
+
+    Uses kitchen-sink.xml, so should be run from the 'tests' directory.
+    """
+
+    def test_round_trip(self):
+        record = PremisRecord(frompath='kitchen-sink.xml')
+        result = PremisRecord.from_json(record.to_json())
+        self.assertEqual(result, record)
+        self.assertEqual(result.to_xml(), record.to_xml())
+
+    def test_jsonl_round_trip(self):
+        record = PremisRecord(frompath='kitchen-sink.xml')
+        f = io.StringIO()
+        record.to_jsonl(f)
+        lines = f.getvalue().splitlines()
+        self.assertEqual(len(lines), len(list(record)))
+        self.assertEqual([json.loads(x)['type'] for x in lines],
+                         [x.get_name() for x in record])
+        f.seek(0)
+        result = PremisRecord.from_jsonl(f)
+        self.assertEqual(result, record)
+        self.assertEqual(result.to_xml(), record.to_xml())
+
+    def test_shape(self):
+        record = PremisRecord(frompath='kitchen-sink.xml')
+        data = json.loads(record.to_json())
+        self.assertEqual(data['version'], '3.0')
+        self.assertEqual([len(data[x]) for x in ('objects', 'events', 'agents', 'rights')],
+                         [2, 23, 3, 1])
+        event = data['events'][0]
+        # Keys follow field_order, repeatable fields are arrays
+        self.assertEqual(list(event), [x for x in Event.field_order if x in event])
+        self.assertIsInstance(event['eventIdentifier'], dict)
+        self.assertIsInstance(event['eventOutcomeInformation'], list)
+
+    def test_extensions(self):
+        for opaque in (False, True):
+            record = PremisRecord(frompath=io.BytesIO(EXTENDED.encode('utf-8')),
+                                  opaque_extensions=opaque)
+            data = json.loads(record.to_json())
+            extension = data['agents'][0]['agentExtension'][0]
+            self.assertEqual(extension['{http://www.loc.gov/mix/v20}note'], ['a', 'b'])
+            self.assertEqual(extension['{http://www.loc.gov/mix/v20}mix'],
+                             [{'{http://www.loc.gov/mix/v20}imageWidth': ['10']}])
+            result = PremisRecord.from_json(json.dumps(data))
+            self.assertEqual(result.to_xml(), record.to_xml())
+
+    def test_node(self):
+        identifier = EventIdentifier('type', 'value')
+        data = node_to_dict(identifier)
+        self.assertEqual(data, {'eventIdentifierType': 'type',
+                                'eventIdentifierValue': 'value'})
+        result = node_from_dict(EventIdentifier, data)
+        self.assertEqual(result, identifier)
+        self.assertEqual(result.get_name(), 'eventIdentifier')
+
+    def test_unknown_field(self):
+        with self.assertRaises(ValueError):
+            node_from_dict(EventIdentifier, {'eventIdentifierType': 'type', 'colour': 'red'})
+
+    def test_cardinality(self):
+        with self.assertRaises(ValueError):
+            node_from_dict(EventIdentifier, {'eventIdentifierType': ['type']})
+        with self.assertRaises(ValueError):
+            node_from_dict(Event, {'eventOutcomeInformation': {}})
+
+    def test_required_fields(self):
+        with self.assertRaisesRegex(ValueError, 'object.*objectIdentifier'):
+            PremisRecord.from_json('{"objects":[{"objectCategory":"file"}]}')
+        with self.assertRaisesRegex(ValueError, 'EventIdentifier.*eventIdentifierValue'):
+            node_from_dict(Event, {'eventIdentifier': {'eventIdentifierType': 'type'},
+                                   'eventType': 'type', 'eventDateTime': 'now'})
+        with self.assertRaisesRegex(ValueError, 'linkingEventIdentifierType'):
+            node_from_dict(LinkingEventIdentifier, {'linkingEventIdentifierValue': 'value'})
+        node_from_dict(LinkingEventIdentifier, {'linkingEventIdentifierType': 'type',
+                                                'linkingEventIdentifierValue': 'value'})
+        with self.assertRaisesRegex(ValueError, 'Line 1.*eventType'):
+            list(iter_jsonl(['{"type": "event", "node": {"eventIdentifier": '
+                             '{"eventIdentifierType": "t", "eventIdentifierValue": "v"}, '
+                             '"eventDateTime": "now"}}']))
+
+    def test_bad_lines(self):
+        with self.assertRaises(ValueError):
+            list(iter_jsonl(['{"type": "thing", "node": {}}']))
+        with self.assertRaises(ValueError):
+            list(iter_jsonl(['not json']))
+        self.assertEqual(list(iter_jsonl(['', '\n'])), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
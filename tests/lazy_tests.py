@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+from pypremis.lib import PremisRecord, LazyEntity, DuplicateIdentifierError
+from pypremis.nodes import *
+
+
+class LazyTestCase(unittest.TestCase):
+    """Tests for records loaded with lazy=True
+
+    Uses kitchen-sink.xml, so should be run from the 'tests' directory.
+    """
+
+    def setUp(self):
+        self.record = PremisRecord(frompath='kitchen-sink.xml', lazy=True)
+
+    def test_nothing_built_up_front(self):
+        for nodeset in (self.record.objects_list, self.record.events_list,
+                        self.record.agents_list, self.record.rights_list):
+            self.assertEqual(nodeset.lazy, len(nodeset))
+            for entry in nodeset.nodes:
+                self.assertIsInstance(entry, LazyEntity)
+        self.assertEqual(len(self.record.events_list), 23)
+        self.assertEqual(len(self.record.objects_list), 2)
+
+    def test_lookup_builds_and_caches(self):
+        key = list(self.record.events_list.identifiers)[0]
+        event = self.record.get_event(key)
+        self.assertIsInstance(event, Event)
+        self.assertIs(self.record.get_event(key), event)
+        self.assertEqual(self.record.events_list.lazy, 22)
+        self.assertEqual(repr(event.get_eventIdentifier()), key)
+
+    def test_missing_identifier(self):
+        self.assertIsNone(self.record.get_event('nope'))
+        self.assertEqual(self.record.events_list.lazy, 23)
+
+    def test_matches_eager(self):
+        eager = PremisRecord(frompath='kitchen-sink.xml')
+        self.assertEqual(sorted(eager.objects_list.identifiers),
+                         sorted(self.record.objects_list.identifiers))
+        self.assertEqual(eager.to_xml(), self.record.to_xml())
+        self.assertEqual(self.record.events_list.lazy, 0)
+        self.assertTrue(eager == self.record)
+
+    def test_duplicate_identifiers_detected(self):
+        event = ('<premis:event><premis:eventIdentifier>'
+                 '<premis:eventIdentifierType>t</premis:eventIdentifierType>'
+                 '<premis:eventIdentifierValue>v</premis:eventIdentifierValue>'
+                 '</premis:eventIdentifier></premis:event>')
+        handle, path = tempfile.mkstemp(suffix='.xml')
+        with os.fdopen(handle, 'w') as f:
+            f.write('<premis:premis xmlns:premis="http://www.loc.gov/premis/v3">'
+                    + event * 2 + '</premis:premis>')
+        try:
+            with self.assertRaises(DuplicateIdentifierError):
+                PremisRecord(frompath=path, lazy=True)
+        finally:
+            os.remove(path)
+
+    def test_errors_deferred_until_built(self):
+        handle, path = tempfile.mkstemp(suffix='.xml')
+        with os.fdopen(handle, 'w') as f:
+            # No eventType or eventDateTime
+            f.write('<premis:premis xmlns:premis="http://www.loc.gov/premis/v3">'
+                    '<premis:event><premis:eventIdentifier>'
+                    '<premis:eventIdentifierType>t</premis:eventIdentifierType>'
+                    '<premis:eventIdentifierValue>v</premis:eventIdentifierValue>'
+                    '</premis:eventIdentifier></premis:event></premis:premis>')
+        try:
+            record = PremisRecord(frompath=path, lazy=True)
+            self.assertEqual(len(record.events_list), 1)
+            with self.assertRaises(ValueError):
+                record.get_event_list()
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
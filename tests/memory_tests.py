@@ -0,0 +1,52 @@
+import unittest
+
+from pypremis.nodes import *
+from pypremis.lib import PremisRecord
+from pypremis.memory import memory_report, trace
+
+
+class MemoryReportTestCase(unittest.TestCase):
+    """Tests for PremisRecord.memory_report()
+
+    Uses kitchen-sink.xml, so should be run from the 'tests' directory.
+    """
+
+    def test_kitchen_sink(self):
+        record = PremisRecord(frompath='kitchen-sink.xml')
+        report = record.memory_report()
+        self.assertEqual(set(report.by_entity), {'object', 'event', 'agent', 'rights'})
+        self.assertEqual(report.total, sum(report.by_entity.values()) + report.index)
+        self.assertEqual(sum(report.by_class.values()), sum(report.by_entity.values()))
+        self.assertGreater(report.by_entity['event'], report.by_entity['agent'])
+        self.assertIn('Event.eventIdentifier', report.by_field)
+        self.assertIn('Total:', report.format())
+
+    def test_shared_nodes_counted_once(self):
+        identifier = LinkingObjectIdentifier('local', 'x' * 10000)
+        events = [Event(EventIdentifier('local', str(i)), 'test', 'now',
+                        linkingObjectIdentifier=identifier) for i in range(5)]
+        report = PremisRecord(events=events).memory_report()
+        self.assertLess(report.by_class['LinkingObjectIdentifier'], 20000)
+        self.assertEqual(report.nodes, 11)
+
+    def test_lazy_stays_lazy(self):
+        record = PremisRecord(frompath='kitchen-sink.xml', lazy=True)
+        report = record.memory_report()
+        self.assertEqual(report.lazy, 29)
+        self.assertEqual(record.events_list.lazy, 23)
+        self.assertGreater(report.by_field['LazyEntity.element'], 0)
+        self.assertEqual(report.total, sum(report.by_entity.values()) + report.index)
+        self.assertEqual(sum(report.by_class.values()), sum(report.by_entity.values()))
+        self.assertIn('Not yet built: 29 entities', report.format())
+        record.get_event_list()
+        self.assertEqual(record.memory_report().lazy, 6)
+
+    def test_trace(self):
+        record, traced = trace(lambda: PremisRecord(frompath='kitchen-sink.xml'))
+        self.assertEqual(len(record.get_event_list()), 23)
+        self.assertGreater(traced['peak'], 0)
+        self.assertGreaterEqual(traced['peak'], traced['current'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+
+from pypremis.lib import PremisRecord, DuplicateIdentifierError
+from pypremis.mets import iter_entities, load_record
+from pypremis.nodes import *
+
+
+HEAD = ('<mets:mets xmlns:mets="http://www.loc.gov/METS/" '
+        'xmlns:premis="http://www.loc.gov/premis/v3" '
+        'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" OBJID="aip">'
+        '<mets:metsHdr CREATEDATE="2020-01-01T00:00:00"/>')
+TAIL = ('<mets:fileSec><mets:fileGrp><mets:file ID="FILE1"/></mets:fileGrp></mets:fileSec>'
+        '<mets:structMap><mets:div/></mets:structMap></mets:mets>')
+
+
+def section(kind, id, content, wrap_id=None):
+    wrap = '<mets:mdWrap MDTYPE="PREMIS"{}><mets:xmlData>{}</mets:xmlData></mets:mdWrap>'.format(
+        ' ID="{}"'.format(wrap_id) if wrap_id else '', content)
+    return '<mets:{0} ID="{1}">{2}</mets:{0}>'.format(kind, id, wrap)
+
+
+class METSTestCase(unittest.TestCase):
+    """Tests for reading PREMIS embedded in METS
+
+    Uses kitchen-sink.xml, so should be run from the 'tests' directory.
+    """
+
+    def setUp(self):
+        self.record = PremisRecord(frompath='kitchen-sink.xml')
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def kitchen_sink_mets(self):
+        sections = []
+        for i, obj in enumerate(self.record.get_object_list()):
+            sections.append(section('techMD', 'TECH{}'.format(i), repr(obj)))
+        agents = ''.join(repr(x) for x in self.record.get_agent_list())
+        for i, event in enumerate(self.record.get_event_list()):
+            # Each event's section repeats the agents
+            sections.append(section('digiprovMD', 'EVENT{}'.format(i),
+                                    '<premis:premis version="3.0">{}{}</premis:premis>'.format(
+                                        repr(event), agents)))
+        sections.append(section('rightsMD', 'RIGHTS', repr(self.record.get_rights_list()[0]),
+                                wrap_id='WRAP'))
+        return HEAD + '<mets:amdSec ID="AMD1">' + ''.join(sections) + '</mets:amdSec>' + TAIL
+
+    def test_load_record(self):
+        text = self.kitchen_sink_mets()
+        record, found = load_record(io.BytesIO(text.encode('utf-8')))
+        self.assertEqual(record, self.record)
+        rights = self.record.get_rights_list()[0]
+        key = repr(rights.get_rightsStatement()[0].get_rightsStatementIdentifier())
+        self.assertEqual(found[key], [{'amdSec': 'AMD1', 'rightsMD': 'RIGHTS', 'mdWrap': 'WRAP'}])
+        agent = self.record.get_agent_list()[0]
+        self.assertEqual(len(found[repr(agent.get_agentIdentifier()[0])]), 23)
+        event = self.record.get_event_list()[4]
+        self.assertEqual(found[repr(event.get_eventIdentifier())],
+                         [{'amdSec': 'AMD1', 'digiprovMD': 'EVENT4'}])
+
+    def test_iter_entities(self):
+        path = os.path.join(self.tmpdir, 'mets.xml.gz')
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write(self.kitchen_sink_mets())
+        entities = list(iter_entities(path, opaque_extensions=True))
+        self.assertEqual(len(entities), 2 + 23 * 4 + 1)
+        name, node, sections = entities[2]
+        self.assertEqual((name, sections), ('event', {'amdSec': 'AMD1', 'digiprovMD': 'EVENT0'}))
+        self.assertEqual(node, self.record.get_event_list()[0])
+
+    def test_conflicting_duplicates(self):
+        first = Event(EventIdentifier('uuid', 'a'), 'validation', '2020-01-01')
+        second = Event(EventIdentifier('uuid', 'a'), 'ingestion', '2020-01-01')
+        text = HEAD + '<mets:amdSec>' + section('digiprovMD', 'A', repr(first)) + \
+            section('digiprovMD', 'B', repr(second)) + '</mets:amdSec>' + TAIL
+        with self.assertRaises(DuplicateIdentifierError):
+            load_record(io.BytesIO(text.encode('utf-8')))
+
+    def write_events(self, path, count):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(HEAD + '<mets:amdSec ID="AMD1">')
+            for i in range(count):
+                event = Event(EventIdentifier('uuid', str(i)), 'validation', '2020-01-01',
+                              eventDetailInformation=EventDetailInformation(eventDetail='x' * 200))
+                f.write(section('digiprovMD', 'E{}'.format(i), repr(event)))
+            f.write('</mets:amdSec>' + TAIL)
+
+    def peak(self, path):
+        tracemalloc.start()
+        try:
+            count = sum(1 for _ in iter_entities(path))
+            return count, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_bounded_memory(self):
+        small = os.path.join(self.tmpdir, 'small.xml')
+        large = os.path.join(self.tmpdir, 'large.xml')
+        self.write_events(small, 200)
+        self.write_events(large, 4000)
+        small_count, small_peak = self.peak(small)
+        large_count, large_peak = self.peak(large)
+        self.assertEqual((small_count, large_count), (200, 4000))
+        # Twenty times the entities, nowhere near twenty times the memory
+        self.assertLess(large_peak, small_peak * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
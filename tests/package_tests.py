@@ -0,0 +1,33 @@
+import subprocess
+import sys
+import unittest
+
+import pypremis
+
+
+class PackageTestCase(unittest.TestCase):
+    """Tests for the lazily resolved package namespace"""
+
+    def test_import_is_lazy(self):
+        code = ("import sys, pypremis; "
+                "print(sorted(x for x in sys.modules if x.startswith('pypremis.') "
+                "or x in ('xml.etree.ElementTree', 'sqlite3', 'concurrent.futures')))")
+        output = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(output.strip(), b'[]')
+
+    def test_attributes(self):
+        from pypremis.lib import PremisRecord, DuplicateIdentifierError
+        from pypremis.fixity import FixityVerifier
+        self.assertIs(pypremis.PremisRecord, PremisRecord)
+        self.assertIs(pypremis.DuplicateIdentifierError, DuplicateIdentifierError)
+        self.assertIs(pypremis.FixityVerifier, FixityVerifier)
+        self.assertIs(pypremis.nodes, sys.modules['pypremis.nodes'])
+        for name in pypremis.__all__:
+            self.assertIn(name, dir(pypremis))
+            getattr(pypremis, name)
+        with self.assertRaises(AttributeError):
+            pypremis.not_a_thing
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pypremis import parallel
+from pypremis.factories import XMLNodeFactory
+from pypremis.lib import PremisRecord, DuplicateIdentifierError
+from pypremis.parallel import ParallelXMLNodeFactory
+
+
+DEFAULT_NAMESPACE = (
+    '<?xml version="1.0" encoding="ISO-8859-1"?>\n'
+    '<premis xmlns="http://www.loc.gov/premis/v3" version="3.0">\n'
+    '  <agent><agentIdentifier><agentIdentifierType>t</agentIdentifierType>'
+    '<agentIdentifierValue>{}</agentIdentifierValue></agentIdentifier>'
+    '<agentName>caf\xe9</agentName></agent>\n'
+    '  <agent><agentIdentifier><agentIdentifierType>t</agentIdentifierType>'
+    '<agentIdentifierValue>b</agentIdentifierValue></agentIdentifier></agent>\n'
+    '</premis>\n'
+)
+
+
+class ParallelTestCase(unittest.TestCase):
+    """Tests for building entities in worker processes
+
+    Uses kitchen-sink.xml, so should be run from the 'tests' directory.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.min_chunk_size = parallel.MIN_CHUNK_SIZE
+        parallel.MIN_CHUNK_SIZE = 1
+
+    def tearDown(self):
+        parallel.MIN_CHUNK_SIZE = self.min_chunk_size
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, text, encoding='utf-8'):
+        path = os.path.join(self.tmpdir, 'premis.xml')
+        with open(path, 'w', encoding=encoding) as f:
+            f.write(text)
+        return path
+
+    def load(self, path):
+        record = PremisRecord._empty()
+        record.populate_from_file(ParallelXMLNodeFactory, filepath=path, workers=2)
+        return record
+
+    def test_document_order(self):
+        expected = list(XMLNodeFactory('kitchen-sink.xml').iter_entities())
+        for chunk_size in (1, 2000, 10 ** 9):
+            factory = ParallelXMLNodeFactory('kitchen-sink.xml', workers=2, chunk_size=chunk_size)
+            self.assertEqual(list(factory.iter_entities()), expected)
+
+    def test_record(self):
+        record = PremisRecord._empty()
+        record.populate_from_file(ParallelXMLNodeFactory, filepath='kitchen-sink.xml', workers=3)
+        self.assertEqual(record, PremisRecord(frompath='kitchen-sink.xml'))
+        self.assertEqual(len(record.get_event_list()), 23)
+
+    def test_chunks(self):
+        source, chunks = ParallelXMLNodeFactory('kitchen-sink.xml', workers=2,
+                                                chunk_size=1)._chunks()
+        self.assertEqual(chunks, [(start, end) for name, start, end in source.entities])
+
+    def test_default_namespace_and_encoding(self):
+        path = self.write(DEFAULT_NAMESPACE.format('a'), encoding='iso-8859-1')
+        record = self.load(path)
+        self.assertEqual(record, PremisRecord(frompath=path))
+        self.assertEqual(record.get_agent_list()[0].get_agentName(), ['caf\xe9'])
+
+    def test_duplicates(self):
+        path = self.write(DEFAULT_NAMESPACE.format('b'))
+        with self.assertRaises(DuplicateIdentifierError):
+            self.load(path)
+
+    def test_serial_fallback(self):
+        with open('kitchen-sink.xml', 'rb') as f:
+            entities = list(ParallelXMLNodeFactory(f, workers=2).iter_entities())
+        self.assertEqual(len(entities), 29)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import copy
+import copyreg
+import io
+import pickle
+import unittest
+from unittest import mock
+
+from pypremis.lib import PremisRecord, NodeSet
+from pypremis.nodes import *
+
+
+EXTENDED = (
+    '<premis:premis xmlns:premis="http://www.loc.gov/premis/v3" '
+    'xmlns:mix="http://www.loc.gov/mix/v20">'
+    '<premis:agent><premis:agentIdentifier>'
+    '<premis:agentIdentifierType>t</premis:agentIdentifierType>'
+    '<premis:agentIdentifierValue>v</premis:agentIdentifierValue>'
+    '</premis:agentIdentifier>'
+    '<premis:agentExtension><mix:mix><mix:imageWidth>10</mix:imageWidth></mix:mix>'
+    '<mix:note>a</mix:note><mix:note>b</mix:note></premis:agentExtension>'
+    '</premis:agent></premis:premis>'
+)
+
+
+class PickleTestCase(unittest.TestCase):
+    """Tests for the compact pickling of nodes and records
+
+    Uses kitchen-sink.xml, so should be run from the 'tests' directory.
+    """
+
+    def round_trip(self, obj):
+        return pickle.loads(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+
+    def test_record(self):
+        record = PremisRecord(frompath='kitchen-sink.xml')
+        result = self.round_trip(record)
+        self.assertEqual(result, record)
+        self.assertEqual(result.to_xml(), record.to_xml())
+        key = list(record.events_list.identifiers)[0]
+        self.assertEqual(result.get_event(key), record.get_event(key))
+
+    def test_identifiers_kept(self):
+        record = PremisRecord(frompath='kitchen-sink.xml')
+        data = pickle.dumps(record.events_list, pickle.HIGHEST_PROTOCOL)
+        # Loaded as they are, not serialized again from the nodes
+        with mock.patch.object(NodeSet, 'identifier_keys', side_effect=AssertionError):
+            result = pickle.loads(data)
+        self.assertEqual(result.identifiers, record.events_list.identifiers)
+        self.assertEqual(copy.deepcopy(record.objects_list).identifiers,
+                         record.objects_list.identifiers)
+
+    def test_lazy_record(self):
+        record = PremisRecord(frompath='kitchen-sink.xml', lazy=True)
+        result = self.round_trip(record)
+        self.assertEqual(result.events_list.lazy, 0)
+        self.assertEqual(result, PremisRecord(frompath='kitchen-sink.xml'))
+
+    def test_extensions(self):
+        for opaque in (False, True):
+            record = PremisRecord(frompath=io.BytesIO(EXTENDED.encode('utf-8')),
+                                  opaque_extensions=opaque)
+            result = self.round_trip(record)
+            extension = result.get_agent_list()[0].get_agentExtension()[0]
+            self.assertEqual(extension.get_payload() is not None, opaque)
+            self.assertEqual(result.to_xml(), record.to_xml())
+            self.assertEqual(extension.get_field('{http://www.loc.gov/mix/v20}note'), ['a', 'b'])
+
+    def test_names_and_attributes(self):
+        node = ExtensionNode()
+        node.set_name('custom')
+        node.add_to_field('{http://example.org}key', 'value')
+        node.note = 'kept'
+        result = self.round_trip(node)
+        self.assertEqual(result.get_name(), 'custom')
+        self.assertEqual(result.note, 'kept')
+        self.assertEqual(repr(result), repr(node))
+        identifier = self.round_trip(EventIdentifier('uuid', 'a'))
+        self.assertEqual(identifier.get_name(), 'eventIdentifier')
+        self.assertEqual(identifier.get_eventIdentifierValue(), 'a')
+
+    def test_smaller_than_instance_dicts(self):
+        record = PremisRecord(frompath='kitchen-sink.xml')
+
+        class DefaultPickler(pickle.Pickler):
+            def reducer_override(self, obj):
+                if isinstance(obj, PremisNode):
+                    return copyreg.__newobj__, (type(obj),), obj.__dict__.copy()
+                return NotImplemented
+
+        default = io.BytesIO()
+        DefaultPickler(default, pickle.HIGHEST_PROTOCOL).dump(record)
+        compact = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+        self.assertLess(len(compact), len(default.getvalue()))
+
+    def test_deepcopy(self):
+        record = PremisRecord(frompath='kitchen-sink.xml')
+        event = record.get_event_list()[0]
+        result = copy.deepcopy(event)
+        self.assertEqual(result, event)
+        self.assertIsNot(result.get_eventIdentifier(), event.get_eventIdentifier())
+
+
+if __name__ == '__main__':
+    unittest.main()
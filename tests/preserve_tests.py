@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pypremis.lib import PremisRecord
+from pypremis.nodes import *
+from pypremis.source import scan
+
+
+class PreserveSourceTestCase(unittest.TestCase):
+    """Tests for writing records read with preserve_source=True
+
+    Uses kitchen-sink.xml, so should be run from the 'tests' directory.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'premis.xml')
+        shutil.copy('kitchen-sink.xml', self.path)
+        with open(self.path, 'rb') as f:
+            self.original = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read(self, path=None):
+        with open(path or self.path, 'rb') as f:
+            return f.read()
+
+    def event(self, value):
+        return Event(EventIdentifier('uuid', value), 'validation', '2020-01-01T00:00:00')
+
+    def test_scan(self):
+        source = scan(self.path)
+        self.assertTrue(source.is_spliceable())
+        self.assertEqual(len(source.entities), 29)
+        for name, start, end in source.entities:
+            chunk = self.original[start:end]
+            self.assertTrue(chunk.startswith(b'<premis:' + name.encode('ascii')))
+            self.assertTrue(chunk.endswith(b'</premis:' + name.encode('ascii') + b'>'))
+
+    def test_unmodified_copy_is_identical(self):
+        target = os.path.join(self.tmpdir, 'copy.xml')
+        PremisRecord(frompath=self.path, preserve_source=True).write_to_file(target)
+        self.assertEqual(self.read(target), self.original)
+
+    def test_added_event_in_place(self):
+        record = PremisRecord(frompath=self.path, preserve_source=True)
+        record.add_event(self.event('new-1'))
+        record.write_to_file(self.path)
+        written = self.read()
+        self.assertTrue(written.startswith(self.original[:self.original.index(b'<premis:agent>')]))
+        self.assertTrue(self.original.endswith(written[written.index(b'new-1'):].split(b'</premis:event>', 1)[1]))
+        reread = PremisRecord(frompath=self.path)
+        self.assertEqual(len(reread.get_event_list()), 24)
+        self.assertTrue(reread == record)
+
+        # The rewritten file becomes the source for the next save
+        record.add_event(self.event('new-2'))
+        record.write_to_file(self.path)
+        self.assertEqual(len(PremisRecord(frompath=self.path).get_event_list()), 25)
+        self.assertIn(b'new-1', self.read())
+
+    def test_modified_entity_is_reserialized(self):
+        record = PremisRecord(frompath=self.path, preserve_source=True)
+        record.get_object_list()[0].set_originalName('changed.txt')
+        target = os.path.join(self.tmpdir, 'copy.xml')
+        record.write_to_file(target)
+        reread = PremisRecord(frompath=target)
+        self.assertEqual(reread.get_object_list()[0].get_originalName(), 'changed.txt')
+        self.assertTrue(reread == record)
+
+    def test_lazy_entities_are_copied_unbuilt(self):
+        record = PremisRecord(frompath=self.path, lazy=True, preserve_source=True)
+        record.add_event(self.event('new-1'))
+        target = os.path.join(self.tmpdir, 'copy.xml')
+        record.write_to_file(target)
+        self.assertEqual(record.events_list.lazy, 23)
+        self.assertEqual(len(PremisRecord(frompath=target).get_event_list()), 24)
+
+    def test_changed_source_falls_back(self):
+        record = PremisRecord(frompath=self.path, preserve_source=True)
+        with open(self.path, 'ab') as f:
+            f.write(b'\n')
+        target = os.path.join(self.tmpdir, 'copy.xml')
+        record.write_to_file(target)
+        self.assertNotEqual(self.read(target), self.original)
+        self.assertTrue(PremisRecord(frompath=target) == record)
+
+    def test_undeclared_xsi_falls_back(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'<premis:premis xmlns:premis="http://www.loc.gov/premis/v3">'
+                    b'<premis:event><premis:eventIdentifier>'
+                    b'<premis:eventIdentifierType>t</premis:eventIdentifierType>'
+                    b'<premis:eventIdentifierValue>v</premis:eventIdentifierValue>'
+                    b'</premis:eventIdentifier><premis:eventType>x</premis:eventType>'
+                    b'<premis:eventDateTime>y</premis:eventDateTime></premis:event>'
+                    b'</premis:premis>')
+        record = PremisRecord(frompath=self.path, preserve_source=True)
+        self.assertFalse(record._source.is_spliceable())
+        target = os.path.join(self.tmpdir, 'copy.xml')
+        record.write_to_file(target)
+        self.assertTrue(PremisRecord(frompath=target) == record)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pypremis.nodes import *
+from pypremis.lib import PremisRecord
+from pypremis.scheduler import AuditScheduler, parse_datetime
+
+
+def make_object(identifier, size):
+    format = Format(formatDesignation=FormatDesignation('text'))
+    characteristics = ObjectCharacteristics(format, size=str(size))
+    return Object(ObjectIdentifier('local', identifier), 'file', characteristics)
+
+
+def make_check(number, identifier, when):
+    return Event(EventIdentifier('local', str(number)), 'fixity check', when,
+                 linkingObjectIdentifier=LinkingObjectIdentifier('local', identifier))
+
+
+class AuditSchedulerTestCase(unittest.TestCase):
+    """Tests for ordering fixity audits by event history"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.record_path = os.path.join(self.tmpdir, 'premis.xml')
+        record = PremisRecord(
+            objects=[make_object('a', 100), make_object('b', 200),
+                     make_object('c', 300), make_object('never', 50)],
+            events=[make_check(1, 'a', '2016-01-01T00:00:00'),
+                    make_check(2, 'a', '2012-01-01T00:00:00'),
+                    make_check(3, 'b', '2014-01-01T00:00:00'),
+                    make_check(4, 'c', '2015-01-01T00:00:00Z')]
+        )
+        record.write_to_file(self.record_path)
+        self.db = os.path.join(self.tmpdir, 'schedule.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_parse_datetime(self):
+        self.assertEqual(parse_datetime('1970-01-01T00:01:00'), 60)
+        self.assertEqual(parse_datetime('1970-01-01T00:01:00Z'), 60)
+        self.assertIsNone(parse_datetime('last tuesday'))
+
+    def test_oldest_first_within_budget(self):
+        with AuditScheduler(self.db) as scheduler:
+            self.assertEqual(scheduler.scan([self.record_path]), 1)
+            batch = scheduler.next_batch(400)
+            self.assertEqual([x.identifierValue for x in batch], ['never', 'b'])
+            batch = scheduler.next_batch(1)
+            self.assertEqual([x.identifierValue for x in batch], ['c'])
+            batch = scheduler.next_batch(1000)
+            self.assertEqual([x.identifierValue for x in batch], ['a'])
+            self.assertEqual(scheduler.next_batch(1000), [])
+
+    def test_incremental_scan(self):
+        with AuditScheduler(self.db) as scheduler:
+            self.assertEqual(scheduler.scan([self.record_path]), 1)
+            self.assertEqual(scheduler.scan([self.record_path]), 0)
+        with AuditScheduler(self.db) as scheduler:
+            # State survives reopening the index
+            self.assertEqual(len(scheduler), 4)
+            self.assertEqual(scheduler.scan([self.record_path]), 0)
+            record = PremisRecord(frompath=self.record_path)
+            record.add_event(make_check(5, 'never', '2017-01-01T00:00:00'))
+            record.write_to_file(self.record_path)
+            os.utime(self.record_path, ns=(time.time_ns() + 10**9,) * 2)
+            self.assertEqual(scheduler.scan([self.record_path]), 1)
+            batch = scheduler.next_batch(10000)
+            self.assertEqual([x.identifierValue for x in batch], ['b', 'c', 'a', 'never'])
+
+    def test_mark_verified_requeues(self):
+        with AuditScheduler() as scheduler:
+            scheduler.scan([self.record_path])
+            item = scheduler.next_batch(1)[0]
+            self.assertEqual(item.identifierValue, 'never')
+            scheduler.mark_verified(item.record, item.identifierType, item.identifierValue)
+            values = [x.identifierValue for x in scheduler.next_batch(10000)]
+            self.assertEqual(values, ['b', 'c', 'a', 'never'])
+
+    def test_record_keys(self):
+        with AuditScheduler() as scheduler:
+            record = PremisRecord(frompath=self.record_path)
+            self.assertEqual(scheduler.scan([record]), 1)
+            self.assertEqual({x.record for x in scheduler.next_batch(10000)},
+                             {self.record_path})
+            record.set_filepath(None)
+            with self.assertRaises(ValueError):
+                scheduler.scan([record])
+            self.assertEqual(scheduler.scan([('aip-1', record)]), 1)
+            self.assertEqual({x.record for x in scheduler.next_batch(10000)}, {'aip-1'})
+
+    def test_forget_and_prune(self):
+        with AuditScheduler(self.db) as scheduler:
+            scheduler.scan([self.record_path, ('aip-1', PremisRecord(frompath=self.record_path))])
+            self.assertEqual(len(scheduler), 8)
+            os.remove(self.record_path)
+            self.assertEqual(scheduler.prune(), [self.record_path])
+            self.assertEqual(len(scheduler), 4)
+            scheduler.forget('aip-1')
+            self.assertEqual(len(scheduler), 0)
+        with AuditScheduler(self.db) as scheduler:
+            self.assertEqual(len(scheduler), 0)
+            self.assertEqual(scheduler.next_batch(10000), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from unittest import mock
+
+from pypremis.lib import PremisRecord, DuplicateIdentifierError
+from pypremis.nodes import *
+from pypremis import snapshot
+from pypremis.snapshot import Snapshot, SnapshotError, write_snapshot, HEADER, MAGIC
+
+
+EXTENDED = (
+    '<premis:premis xmlns:premis="http://www.loc.gov/premis/v3" '
+    'xmlns:mix="http://www.loc.gov/mix/v20">'
+    '<premis:agent><premis:agentIdentifier>'
+    '<premis:agentIdentifierType>t</premis:agentIdentifierType>'
+    '<premis:agentIdentifierValue>v</premis:agentIdentifierValue>'
+    '</premis:agentIdentifier>'
+    '<premis:agentExtension><mix:mix><mix:imageWidth>10</mix:imageWidth></mix:mix>'
+    '<mix:note>a</mix:note><mix:note>b</mix:note></premis:agentExtension>'
+    '</premis:agent></premis:premis>'
+)
+
+
+class SnapshotTestCase(unittest.TestCase):
+    """Tests for binary snapshots of records
+
+    Uses kitchen-sink.xml, so should be run from the 'tests' directory.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'premis.snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        record = PremisRecord(frompath='kitchen-sink.xml')
+        record.to_snapshot(self.path)
+        for use_mmap in (False, True):
+            result = PremisRecord.from_snapshot(self.path, use_mmap=use_mmap)
+            self.assertEqual(result, record)
+            self.assertEqual(result.to_xml(), record.to_xml())
+            self.assertEqual(result.events_list.identifiers, record.events_list.identifiers)
+            self.assertEqual(result.objects_list.identifiers, record.objects_list.identifiers)
+
+    def test_lazy_and_opaque(self):
+        expected = PremisRecord(frompath='kitchen-sink.xml').to_xml()
+        for kwargs in ({'lazy': True}, {'opaque_extensions': True}):
+            PremisRecord(frompath='kitchen-sink.xml', **kwargs).to_snapshot(self.path)
+            self.assertEqual(PremisRecord.from_snapshot(self.path).to_xml(), expected)
+
+    def test_extensions(self):
+        record = PremisRecord(frompath=io.BytesIO(EXTENDED.encode('utf-8')))
+        record.to_snapshot(self.path)
+        result = PremisRecord.from_snapshot(self.path)
+        self.assertEqual(result.to_xml(), record.to_xml())
+        extension = result.get_agent_list()[0].get_agentExtension()[0]
+        self.assertEqual(extension.get_field('{http://www.loc.gov/mix/v20}note'), ['a', 'b'])
+
+    def test_selected(self):
+        record = PremisRecord(frompath='kitchen-sink.xml')
+        record.to_snapshot(self.path)
+        event = record.get_event_list()[5]
+        agent = record.get_agent_list()[1]
+        identifiers = [event.get_eventIdentifier(), repr(agent.get_agentIdentifier()[0])]
+        result = PremisRecord.from_snapshot(self.path, identifiers=identifiers)
+        self.assertEqual(result.get_event_list(), [event])
+        self.assertEqual(result.get_agent_list(), [agent])
+        self.assertEqual(result.get_object_list(), [])
+        with self.assertRaises(KeyError):
+            PremisRecord.from_snapshot(self.path, identifiers=['missing'])
+
+    def test_get(self):
+        record = PremisRecord(frompath='kitchen-sink.xml')
+        record.to_snapshot(self.path)
+        event = record.get_event_list()[0]
+        with Snapshot(self.path, use_mmap=True) as snapshot:
+            self.assertEqual(len(snapshot), 29)
+            self.assertEqual(snapshot.get(event.get_eventIdentifier()), event)
+            self.assertIsNone(snapshot.get('missing'))
+            names = [name for name, node in snapshot.iter_entities()]
+        self.assertEqual(names.count('event'), 23)
+
+    def test_shared_strings(self):
+        record = PremisRecord(frompath='kitchen-sink.xml')
+        record.to_snapshot(self.path)
+        events = PremisRecord.from_snapshot(self.path).get_event_list()
+        types = [event.get_eventIdentifier().get_eventIdentifierType() for event in events]
+        self.assertIs(types[1], types[2])
+
+    def test_duplicates(self):
+        record = PremisRecord(frompath='kitchen-sink.xml')
+        record.to_snapshot(self.path)
+        event = record.get_event_list()[0]
+        result = PremisRecord.from_snapshot(self.path)
+        with self.assertRaises(DuplicateIdentifierError):
+            result.add_event(event)
+
+    def test_bad_files(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'<premis:premis/>')
+        with self.assertRaises(SnapshotError):
+            Snapshot(self.path)
+        with open(self.path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, 99, 0, 0, 0, 0, snapshot.schema_hash()))
+        with self.assertRaises(SnapshotError):
+            Snapshot(self.path)
+        PremisRecord(frompath='kitchen-sink.xml').to_snapshot(self.path)
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        with open(self.path, 'wb') as f:
+            f.write(data[:len(data) // 2])
+        with self.assertRaises(SnapshotError):
+            Snapshot(self.path)
+
+    def test_schema_changed(self):
+        PremisRecord(frompath='kitchen-sink.xml').to_snapshot(self.path)
+        with mock.patch.object(snapshot, 'schema_hash', return_value=b'\0' * 8):
+            with self.assertRaises(SnapshotError):
+                Snapshot(self.path)
+        Snapshot(self.path).close()
+
+    def test_nul(self):
+        record = PremisRecord(events=[Event(EventIdentifier('a\0b', 'v'), 't', 'd')])
+        with self.assertRaises(SnapshotError):
+            write_snapshot(record, self.path)
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from pypremis.factories import XMLNodeFactory
+from pypremis.lib import PremisRecord
+from pypremis.nodes import *
+
+
+class StreamingTestCase(unittest.TestCase):
+    """Tests for the generator based XMLNodeFactory methods
+
+    Uses kitchen-sink.xml, so should be run from the 'tests' directory.
+    """
+
+    def test_iter_matches_find(self):
+        eager = XMLNodeFactory('kitchen-sink.xml')
+        for find, iterate in (('find_objects', 'iter_objects'), ('find_events', 'iter_events'),
+                              ('find_agents', 'iter_agents'), ('find_rights', 'iter_rights')):
+            streamed = list(getattr(XMLNodeFactory('kitchen-sink.xml'), iterate)())
+            self.assertEqual(streamed, getattr(eager, find)())
+
+    def test_does_not_parse_whole_document(self):
+        factory = XMLNodeFactory('kitchen-sink.xml')
+        counts = {}
+        for name, node in factory.iter_entities():
+            counts[name] = counts.get(name, 0) + 1
+        self.assertEqual(counts, {'object': 2, 'event': 23, 'agent': 3, 'rights': 1})
+        self.assertIsNone(factory._xml)
+
+    def test_held_elements_survive(self):
+        # Elements are detached from the root after they are yielded, but
+        # ones the caller keeps must stay intact
+        seen = [x for x in XMLNodeFactory('kitchen-sink.xml').iter_elements()]
+        self.assertEqual(len(seen), 29)
+        self.assertTrue(all(len(element) for name, element in seen))
+
+    def test_file_object(self):
+        with open('kitchen-sink.xml', 'rb') as f:
+            events = list(XMLNodeFactory(f).iter_events())
+        self.assertEqual(len(events), 23)
+        self.assertIsInstance(events[0], Event)
+
+    def test_populate_matches_parsed(self):
+        streamed = PremisRecord(frompath='kitchen-sink.xml')
+        record = PremisRecord(objects=XMLNodeFactory('kitchen-sink.xml').find_objects(),
+                              events=XMLNodeFactory('kitchen-sink.xml').find_events(),
+                              agents=XMLNodeFactory('kitchen-sink.xml').find_agents(),
+                              rights=XMLNodeFactory('kitchen-sink.xml').find_rights())
+        self.assertEqual(streamed.to_xml(), record.to_xml())
+
+
+if __name__ == '__main__':
+    unittest.main()